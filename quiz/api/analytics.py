@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .archive import iter_archive_columns
+from .cache import get_version
+from .models import Question, Option, Selection
+
+# Число выбравших: сумма единичных битов по последней оси
+if hasattr(np, 'bitwise_count'):
+    def _popcount(bits):
+        return np.bitwise_count(bits).sum(axis=-1, dtype=np.int64)
+else:
+    _POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+    def _popcount(bits):
+        return _POPCOUNT[bits].sum(axis=-1, dtype=np.int64)
+
+
+# Битовая матрица ответов опроса: столбец на вариант ответа вопросов с вариантами, бит на респондента
+# (строки в порядке появления респондентов). Столбец хранится упакованным: для миллиона респондентов
+# это 125 КБ, пересечение двух условий - побитовое И, число респондентов - подсчёт битов
+class AnswerMatrix:
+
+    def __init__(self, questions, options):
+        # questions - {вопрос: (заголовок, [варианты ответа по порядку])}, options - {вариант: заголовок}
+        self.questions = questions
+        self.options = options
+        self.option_ids = np.array(sorted(options), dtype=np.int64)
+        self.respondents = np.empty(0, dtype=np.int64)
+        self.bits = np.zeros((len(self.option_ids), 0), dtype=np.uint8)
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+
+    @property
+    def size(self):
+        return len(self.respondents)
+
+    # Строки респондентов, новые респонденты добавляются в конец
+    def _rows(self, respondent_ids):
+        unique, inverse = np.unique(respondent_ids, return_inverse=True)
+        positions = np.searchsorted(self._sorted_ids, unique)
+        found = positions < len(self._sorted_ids)
+        found[found] = self._sorted_ids[positions[found]] == unique[found]
+
+        rows = np.empty(len(unique), dtype=np.int64)
+        rows[found] = self._sorted_rows[positions[found]]
+        added = unique[~found]
+        if len(added):
+            rows[~found] = np.arange(self.size, self.size + len(added))
+            self.respondents = np.concatenate([self.respondents, added])
+            order = np.argsort(self.respondents, kind='stable')
+            self._sorted_ids, self._sorted_rows = self.respondents[order], order
+            width = (self.size + 7) // 8
+            if width > self.bits.shape[1]:
+                bits = np.zeros((len(self.option_ids), max(width, self.bits.shape[1] * 2)), dtype=np.uint8)
+                bits[:, :self.bits.shape[1]] = self.bits
+                self.bits = bits
+        return rows[inverse]
+
+    # Отметка выбранных вариантов: пары (респондент, вариант). Варианты других опросов пропускаются
+    def add(self, respondent_ids, option_ids):
+        respondent_ids = np.asarray(respondent_ids, dtype=np.int64)
+        option_ids = np.asarray(option_ids, dtype=np.int64)
+        columns = np.searchsorted(self.option_ids, option_ids)
+        known = columns < len(self.option_ids)
+        known[known] = self.option_ids[columns[known]] == option_ids[known]
+        if not known.any():
+            return
+        rows = self._rows(respondent_ids[known])
+        np.bitwise_or.at(self.bits, (columns[known], rows >> 3), np.left_shift(1, rows & 7).astype(np.uint8))
+
+    def _columns(self, option_ids):
+        return np.searchsorted(self.option_ids, np.asarray(option_ids, dtype=np.int64))
+
+    # Маска респондентов, выбравших все варианты all_of и хотя бы один из any_of (без условий - все)
+    def mask(self, all_of=(), any_of=()):
+        width = (self.size + 7) // 8
+        mask = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        mask[:width] = 0xFF
+        if self.size % 8:
+            mask[width - 1] = (1 << (self.size % 8)) - 1
+        for column in self._columns(all_of):
+            mask &= self.bits[column]
+        if len(any_of):
+            mask &= np.bitwise_or.reduce(self.bits[self._columns(any_of)], axis=0)
+        return mask
+
+    def count(self, mask=None):
+        return int(_popcount(self.mask() if mask is None else mask))
+
+    # Число респондентов по каждому варианту ответа вопроса
+    def counts(self, question_id, mask=None):
+        bits = self.bits[self._columns(self.questions[question_id][1])]
+        return _popcount(bits if mask is None else bits & mask)
+
+    # Таблица сопряжённости: [i][j] - число респондентов, выбравших i-й вариант вопроса row
+    # и j-й вариант вопроса column (среди респондентов mask)
+    def crosstab(self, row, column, mask=None):
+        rows = self.bits[self._columns(self.questions[row][1])]
+        if mask is not None:
+            rows = rows & mask
+        columns = self.bits[self._columns(self.questions[column][1])]
+        table = np.empty((len(rows), len(columns)), dtype=np.int64)
+        for number, bits in enumerate(rows):
+            table[number] = _popcount(columns & bits)
+        return table
+
+
+def _load(poll_id):
+    questions = {}
+    for question_id, title in Question.objects.filter(poll=poll_id).exclude(q_type='text').order_by('pk') \
+            .values_list('pk', 'title'):
+        questions[question_id] = (title, [])
+    options = {}
+    for option_id, question_id, title in Option.objects.filter(question__in=list(questions)).order_by('pk') \
+            .values_list('pk', 'question', 'title'):
+        questions[question_id][1].append(option_id)
+        options[option_id] = title
+    matrix = AnswerMatrix(questions, options)
+
+    # Ответы опроса в архиве (api.archive) загружаются один раз, новых ответов у них не бывает
+    for columns in iter_archive_columns(poll_id):
+        pairs = [(respondent_id, option_id) for respondent_id, option_ids
+                 in zip(columns['respondent'], columns['option_ids']) for option_id in option_ids]
+        matrix.add([pair[0] for pair in pairs], [pair[1] for pair in pairs])
+    return matrix
+
+
+# Загрузка выбранных вариантов из таблицы ответов с pk больше watermark. Возвращает новый watermark
+def _load_selections(matrix, poll_id, watermark):
+    rows = Selection.objects.filter(pk__gt=watermark, option__question__poll=poll_id) \
+        .values_list('pk', 'submission__respondent', 'option')
+    selections = np.array(list(rows), dtype=np.int64).reshape(-1, 3)
+    if len(selections):
+        matrix.add(selections[:, 1], selections[:, 2])
+        watermark = int(selections[:, 0].max())
+    return watermark
+
+
+# Матрицы опросов в памяти процесса: опрос -> [версия опроса, время загрузки, watermark, AnswerMatrix].
+# При каждом обращении дочитываются новые выбранные варианты (pk больше watermark). Правка вопросов
+# (версия опроса в общем кеше) или возраст больше ANALYTICS_REBUILD_SECONDS - загрузка заново: так
+# учитываются удалённые ответы и ответы транзакций, завершившихся позже записанных после них
+_matrices = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_matrix(poll_id):
+    version = get_version(f'poll:{poll_id}')
+    with _lock:
+        entry = _matrices.get(poll_id)
+        expired = entry is not None and time.monotonic() - entry[1] > settings.ANALYTICS_REBUILD_SECONDS
+        if entry is None or entry[0] != version or expired:
+            entry = [version, time.monotonic(), 0, _load(poll_id)]
+        entry[2] = _load_selections(entry[3], poll_id, entry[2])
+        _matrices[poll_id] = entry
+        _matrices.move_to_end(poll_id)
+        if len(_matrices) > settings.ANALYTICS_CACHE_SIZE:
+            _matrices.popitem(last=False)
+        return entry[3]
+
+
+def clear_matrices():
+    with _lock:
+        _matrices.clear()
@@ -0,0 +1,49 @@
+from collections import namedtuple
+
+from .models import Submission, Selection
+from .results import record_submissions
+from .sheets import append_answers
+
+# Ответ для записи: option_ids - выбранные варианты, text - текстовый ответ (None для вопросов с вариантами),
+# spool_key - ключ записи очереди ответов (api.spool), из которой записывается ответ
+AnswerRow = namedtuple('AnswerRow', ['poll_id', 'respondent_id', 'question_id', 'option_ids', 'text', 'spool_key'],
+                       defaults=(None,))
+
+
+# bulk_create с заполнением первичных ключей. Если бэкенд не возвращает идентификаторы (SQLite),
+# они читаются из queryset: новые строки - последние по pk среди его строк. Вызывается внутри транзакции
+def bulk_create_with_pks(model, objs, queryset, batch_size=None):
+    model.objects.bulk_create(objs, batch_size=batch_size)
+    if objs and objs[0].pk is None:
+        ids = list(queryset.order_by('-pk').values_list('pk', flat=True)[:len(objs)])
+        for obj, pk in zip(objs, reversed(ids)):
+            obj.pk = pk
+    return objs
+
+
+# Пакетная запись ответов (AnswerRow) любых респондентов: одна вставка ответов, одна вставка выбранных
+# вариантов, обновление счётчиков и листов ответов. Вызывается внутри транзакции; повторный ответ вызывает IntegrityError
+def bulk_create_answers(rows):
+    if not rows:
+        return []
+
+    submissions = bulk_create_with_pks(
+        Submission,
+        [Submission(respondent_id=row.respondent_id, question_id=row.question_id, text=row.text,
+                    spool_key=row.spool_key) for row in rows],
+        Submission.objects.filter(respondent__in={row.respondent_id for row in rows},
+                                  question__in={row.question_id for row in rows}),
+    )
+
+    Selection.objects.bulk_create([
+        Selection(submission_id=submission.pk, option_id=option_id)
+        for submission, row in zip(submissions, rows) for option_id in row.option_ids
+    ])
+    record_submissions([(row.poll_id, submission, row.option_ids) for submission, row in zip(submissions, rows)])
+    append_answers(rows)
+    return submissions
+
+
+# Удаление ответов на вопрос с вариантами, в которых после удаления вариантов не осталось ни одного выбранного
+def delete_empty_submissions(question_id):
+    Submission.objects.filter(question=question_id, text__isnull=True, selections__isnull=True).delete()
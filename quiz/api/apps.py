@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = 'api'
+
+    def ready(self):
+        # Сброс кеша токенов (api.authentication) при удалении токена и изменении пользователя,
+        # настройка соединений с SQLite (api.database)
+        from . import authentication, database  # noqa: F401
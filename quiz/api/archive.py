@@ -0,0 +1,162 @@
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .answers import bulk_create_with_pks
+from .cache import invalidate_question
+from .models import Poll, Question, Option, Submission, Selection, AnswerSheet, PollArchive, PollArchiveChunk
+from .sheets import dumps, loads, rebuild_sheets
+
+# Архив ответов завершённых опросов: ответы переносятся из таблиц Submission/Selection в части
+# PollArchiveChunk по ARCHIVE_CHUNK_SIZE ответов - сжатый JSON по столбцам в порядке выгрузки
+# (респондент, вопрос). Счётчики результатов и листы ответов остаются на месте, поэтому результаты
+# и история респондентов читаются как прежде, а выгрузка читает архив (api.export)
+COLUMNS = ('respondent', 'question', 'text', 'option_ids')
+
+
+def _encode(columns):
+    return zlib.compress(dumps(columns).encode())
+
+
+def _decode(content):
+    return loads(zlib.decompress(content))
+
+
+def is_archived(poll_id):
+    return PollArchive.objects.filter(poll=poll_id).exists()
+
+
+# Опросы, закончившиеся больше ARCHIVE_AFTER_DAYS дней назад и ещё не перенесённые в архив
+def closed_polls(now=None):
+    deadline = (now or timezone.now()) - timedelta(days=settings.ARCHIVE_AFTER_DAYS)
+    return Poll.objects.filter(end_date__lt=deadline, archive__isnull=True)
+
+
+# Перенос ответов опроса в архив одной транзакцией. Ответы, записанные после архивации, дописываются
+# в архив повторным вызовом. Возвращает число перенесённых ответов
+def archive_poll(poll_id, chunk_size=None):
+    chunk_size = chunk_size or settings.ARCHIVE_CHUNK_SIZE
+    rows = Submission.objects.filter(question__poll=poll_id) \
+        .order_by('respondent', 'question', 'selections__pk') \
+        .values_list('pk', 'respondent', 'question', 'text', 'selections__option') \
+        .iterator()
+
+    with transaction.atomic():
+        # Устаревшие листы ответов (api.sheets.mark_stale) пересобираются, пока ответы ещё в таблицах:
+        # листы опросов в архиве не пересобираются, и история респондентов потеряла бы опрос
+        stale = list(AnswerSheet.objects.filter(poll=poll_id, stale=True).values_list('respondent', flat=True))
+        if stale:
+            rebuild_sheets(stale, [poll_id])
+
+        archive, _ = PollArchive.objects.select_for_update().get_or_create(poll_id=poll_id)
+        number = archive.chunks.aggregate(last=Max('number'))['last']
+        state = {'number': -1 if number is None else number, 'answers': 0}
+
+        def flush(pks, columns):
+            if not pks:
+                return
+            state['number'] += 1
+            state['answers'] += len(pks)
+            PollArchiveChunk.objects.create(archive=archive, number=state['number'], answers=len(pks),
+                                            content=_encode(columns))
+            selections = Selection.objects.filter(submission__in=pks)
+            selections._raw_delete(selections.db)
+            submissions = Submission.objects.filter(pk__in=pks)
+            submissions._raw_delete(submissions.db)
+
+        pks, columns = [], {column: [] for column in COLUMNS}
+        for pk, respondent_id, question_id, text, option_id in rows:
+            if not pks or pks[-1] != pk:
+                if len(pks) >= chunk_size:
+                    flush(pks, columns)
+                    pks, columns = [], {column: [] for column in COLUMNS}
+                pks.append(pk)
+                columns['respondent'].append(respondent_id)
+                columns['question'].append(question_id)
+                columns['text'].append(text)
+                columns['option_ids'].append([])
+            if option_id is not None:
+                columns['option_ids'][-1].append(option_id)
+        flush(pks, columns)
+
+        archive.answers += state['answers']
+        archive.save(update_fields=['answers'])
+
+    # Индекс вопросов должен узнать, что ответы на вопросы опроса больше не принимаются
+    invalidate_question(*Question.all_objects.filter(poll=poll_id).values_list('pk', flat=True))
+    return state['answers']
+
+
+# Части архива опроса по порядку: словари столбцов COLUMNS. Части читаются из базы по одной
+def iter_archive_columns(poll_id):
+    chunks = PollArchiveChunk.objects.filter(archive=poll_id).order_by('number') \
+        .values_list('content', flat=True).iterator(chunk_size=1)
+    for content in chunks:
+        yield _decode(content)
+
+
+# Ответы из архива опроса в формате api.export.iter_answers. Ответы на удалённые вопросы пропускаются,
+# удалённые варианты - тоже, как и ответы, в которых после этого не осталось вариантов
+def iter_archived_answers(poll_id):
+    questions = options = None
+    for columns in iter_archive_columns(poll_id):
+        if questions is None:
+            questions = {pk: (title, q_type) for pk, title, q_type in Question.objects.filter(poll=poll_id)
+                         .values_list('pk', 'title', 'q_type')}
+            options = dict(Option.objects.filter(question__poll=poll_id).values_list('pk', 'title'))
+
+        for respondent_id, question_id, text, option_ids in zip(*(columns[column] for column in COLUMNS)):
+            if question_id not in questions:
+                continue
+            option_ids = [option_id for option_id in option_ids if option_id in options]
+            if text is None and not option_ids:
+                continue
+            title, q_type = questions[question_id]
+            yield {
+                'respondent': respondent_id,
+                'question': question_id,
+                'question_title': title,
+                'q_type': q_type,
+                'option_ids': option_ids,
+                'options': [options[option_id] for option_id in option_ids],
+                'text': text,
+            }
+
+
+# Возврат ответов опроса из архива в таблицы ответов (например, перед правкой вопросов).
+# Счётчики и листы ответов не меняются: они не удалялись при архивации
+def restore_poll(poll_id):
+    with transaction.atomic():
+        archive = PollArchive.objects.select_for_update().get(poll=poll_id)
+        questions = set(Question.all_objects.filter(poll=poll_id).values_list('pk', flat=True))
+        options = set(Option.objects.filter(question__poll=poll_id).values_list('pk', flat=True))
+
+        restored = 0
+        for columns in iter_archive_columns(poll_id):
+            answers = [(respondent_id, question_id, text, [option_id for option_id in option_ids
+                                                           if option_id in options])
+                       for respondent_id, question_id, text, option_ids in zip(*(columns[c] for c in COLUMNS))
+                       if question_id in questions]
+            answers = [answer for answer in answers if answer[2] is not None or answer[3]]
+            submissions = bulk_create_with_pks(
+                Submission,
+                [Submission(respondent_id=respondent_id, question_id=question_id, text=text)
+                 for respondent_id, question_id, text, _ in answers],
+                Submission.objects.filter(question__poll=poll_id),
+            )
+            Selection.objects.bulk_create([
+                Selection(submission_id=submission.pk, option_id=option_id)
+                for submission, (_, _, _, option_ids) in zip(submissions, answers) for option_id in option_ids
+            ])
+            restored += len(submissions)
+
+        chunks = PollArchiveChunk.objects.filter(archive=archive)
+        chunks._raw_delete(chunks.db)
+        archive.delete()
+
+    invalidate_question(*questions)
+    return restored
@@ -0,0 +1,54 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import get_cache
+
+# Поля пользователя, изменение которых сбрасывает кешированные токены
+AUTH_USER_FIELDS = frozenset(('password', 'is_active', 'is_staff', 'is_superuser'))
+
+
+def _token_key(key):
+    return f"auth:token:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+# TokenAuthentication с кешированием токена вместе с пользователем на AUTH_TOKEN_CACHE_TIMEOUT секунд:
+# повторные запросы с тем же токеном обходятся без обращения к базе. Запись сбрасывается при удалении
+# токена и при изменении пароля, прав или активности пользователя (в том числе при полном сохранении)
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cache = get_cache()
+        token = cache.get(_token_key(key))
+        if token is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            cache.set(_token_key(key), token, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return token.user, token
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    get_cache().delete(_token_key(instance.key))
+
+
+# Сохранение только тех полей, которые не влияют на проверку токена и права (например, last_login при входе
+# через update_last_login), не сбрасывает кеш и не запрашивает токены пользователя
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not AUTH_USER_FIELDS.intersection(update_fields):
+        return
+    keys = [_token_key(key) for key in Token.objects.filter(user=instance).values_list('key', flat=True)]
+    if keys:
+        get_cache().delete_many(keys)
@@ -0,0 +1,34 @@
+import time
+
+from django.db import connection
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+# Замер функции: время вызова (мкс) и среднее число запросов к базе на один вызов
+def measure(func, iterations=1000, setup=None):
+    timings = []
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        for _ in range(iterations):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'mean_us': round(sum(timings) / len(timings) * 1e6, 2),
+        'p50_us': round(timings[len(timings) // 2] * 1e6, 2),
+        'p99_us': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1e6, 2),
+        'queries': counter.count / iterations,
+    }
@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+from django.db.models import Count
+
+from api.analytics import AnswerMatrix, get_matrix
+from api.models import Question, Selection
+
+from . import measure
+from .data import generate
+
+
+# Таблица сопряжённости двух вопросов запросом ORM (самосоединение ответов через респондента)
+def orm_crosstab(row, column):
+    path = 'submission__respondent__submissions__selections__option'
+    return dict(
+        ((row_option, column_option), total) for row_option, column_option, total in Selection.objects
+        .filter(option__question=row, **{f'{path}__question': column})
+        .values_list('option', path).annotate(total=Count('submission__respondent', distinct=True)).order_by()
+    )
+
+
+# Битовая матрица ответов (api.analytics): на синтетической матрице из respondents респондентов с questions
+# вопросами по options вариантов (один вариант на вопрос, популярность по Ципфу) - время построения и таблицы
+# сопряжённости без условия и с условием; на базе из db_respondents респондентов - сравнение с запросом ORM
+def run(respondents=1000000, questions=10, options=5, db_respondents=2000, iterations=20, seed=1):
+    respondents, questions, options = int(respondents), int(questions), int(options)
+    db_respondents, iterations = int(db_respondents), int(iterations)
+    rng = np.random.default_rng(int(seed))
+
+    option_ids = np.arange(questions * options).reshape(questions, options) + 1
+    matrix = AnswerMatrix(
+        {question + 1: (f'вопрос {question}', list(option_ids[question])) for question in range(questions)},
+        {int(option_id): f'вариант {option_id}' for option_id in option_ids.ravel()},
+    )
+    weights = 1 / np.arange(1, options + 1)
+    chosen = rng.choice(options, size=(respondents, questions), p=weights / weights.sum())
+    started = time.perf_counter()
+    matrix.add(np.repeat(np.arange(respondents) + 1, questions), option_ids[np.arange(questions), chosen].ravel())
+    build = time.perf_counter() - started
+
+    mask = matrix.mask(all_of=[int(option_ids[2][0])])
+    synthetic = {
+        'respondents': respondents,
+        'build_s': round(build, 3),
+        'memory_bytes': int(matrix.bits.nbytes + matrix.respondents.nbytes),
+        'crosstab': measure(lambda: matrix.crosstab(1, 2), iterations),
+        'crosstab_where': measure(lambda: matrix.crosstab(1, 2, matrix.mask(all_of=[int(option_ids[2][0])])),
+                                  iterations),
+        'filtered_respondents': matrix.count(mask),
+    }
+
+    dataset = generate(polls=1, questions=9, options=4, respondents=db_respondents, participation=1)
+    poll = dataset.polls[0]
+    row, column = Question.objects.filter(poll=poll).exclude(q_type='text').order_by('pk') \
+        .values_list('pk', flat=True)[:2]
+
+    started = time.perf_counter()
+    loaded = get_matrix(poll.pk)
+    load = time.perf_counter() - started
+    table = loaded.crosstab(row, column)
+    expected = orm_crosstab(row, column)
+    for i, row_option in enumerate(loaded.questions[row][1]):
+        for j, column_option in enumerate(loaded.questions[column][1]):
+            if table[i][j] != expected.get((row_option, column_option), 0):
+                raise AssertionError('Таблица сопряжённости по матрице отличается от запроса ORM')
+
+    return {
+        'synthetic': synthetic,
+        'database': {
+            'respondents': db_respondents,
+            'load_s': round(load, 3),
+            'orm': measure(lambda: orm_crosstab(row, column), iterations),
+            'matrix': measure(lambda: get_matrix(poll.pk).crosstab(row, column), iterations),
+        },
+    }
@@ -0,0 +1,89 @@
+import json
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.db import connection, connections, OperationalError
+from django.test import Client
+from django.test.utils import override_settings
+
+from api.answers import bulk_create_with_pks
+from api.models import Question, Respondent
+
+from .data import generate
+
+# Данные пишутся в базу и видны другим соединениям, поэтому бенчмарк не откатывается командой
+ROLLBACK = False
+
+# Настройки SQLite по умолчанию для сравнения с settings.SQLITE_PRAGMAS
+DEFAULT_PRAGMAS = {'journal_mode': 'delete', 'synchronous': 'full', 'mmap_size': 0}
+
+
+# Пропускная способность записи ответов (POST /api/sendanswer/) при разном числе параллельных процессов,
+# каждый со своим соединением: с PRAGMA из настроек и с настройками SQLite по умолчанию.
+# Нужна база в файле: manage.py benchmark concurrency --test-db /tmp/bench.sqlite3
+def run(workers='1,2,4,8', answers=2000, modes='default,tuned'):
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        raise AssertionError('Для бенчмарка concurrency нужна база в файле: укажите --test-db')
+
+    answers = int(answers)
+    dataset = generate(polls=5, questions=9, options=4, respondents=0)
+    questions = list(Question.objects.filter(q_type='check').prefetch_related('options'))
+    payloads = [(question.pk, [{'response': option.pk} for option in question.options.all()[:2]])
+                for question in questions]
+
+    results = []
+    for mode in modes.split(','):
+        pragmas = settings.SQLITE_PRAGMAS if mode == 'tuned' else DEFAULT_PRAGMAS
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            # Режим журнала переключается, только когда к базе нет других соединений
+            connections.close_all()
+            for count in [int(count) for count in str(workers).split(',')]:
+                results.append(dict(mode=mode, workers=count, **_write(count, answers, payloads)))
+    return {'polls': len(dataset.polls), 'results': results}
+
+
+def _write(workers, answers, payloads):
+    respondents = bulk_create_with_pks(Respondent, [Respondent() for _ in range(answers)], Respondent.objects.all(),
+                                       batch_size=500)
+    # Дочерние процессы открывают свои соединения
+    connections.close_all()
+
+    chunks = [([respondent.pk for respondent in respondents[number::workers]], payloads) for number in range(workers)]
+    started = time.perf_counter()
+    with multiprocessing.get_context('fork').Pool(workers) as pool:
+        outcomes = pool.map(_worker, chunks)
+    elapsed = time.perf_counter() - started
+
+    timings = [timing for chunk_timings, _ in outcomes for timing in chunk_timings]
+    errors = sum(chunk_errors for _, chunk_errors in outcomes)
+    timings.sort()
+    return {
+        'answers': answers,
+        'seconds': round(elapsed, 3),
+        'answers_per_s': round(answers / elapsed, 1),
+        'p50_ms': round(timings[len(timings) // 2] * 1000, 2),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 2),
+        'errors': errors,
+    }
+
+
+def _worker(args):
+    respondent_ids, payloads = args
+    client = Client()
+    timings, errors = [], 0
+    try:
+        for number, respondent_id in enumerate(respondent_ids):
+            question, options = payloads[number % len(payloads)]
+            started = time.perf_counter()
+            try:
+                response = client.post('/api/sendanswer/', json.dumps({
+                    'question': question, 'respondent': respondent_id, 'response_options': options,
+                }), content_type='application/json')
+                errors += response.status_code != 201
+            except OperationalError:
+                errors += 1
+            timings.append(time.perf_counter() - started)
+    finally:
+        connections.close_all()
+    return timings, errors
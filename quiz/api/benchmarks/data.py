@@ -0,0 +1,73 @@
+import random
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from api.answers import AnswerRow, bulk_create_answers, bulk_create_with_pks
+from api.models import Poll, Question, Option, Respondent
+
+Dataset = namedtuple('Dataset', ['polls', 'questions', 'respondents'])
+
+WORDS = ('да', 'нет', 'скорее', 'всегда', 'иногда', 'никогда', 'удобно', 'быстро', 'дорого', 'понятно')
+
+
+# Синтетические данные: polls опросов по questions вопросов (типы по кругу radio, check, text)
+# с options вариантами ответа и respondents респондентов. Каждый респондент проходит опрос
+# с вероятностью participation; популярность вариантов убывает по закону Ципфа, в 'check'
+# выбирается от одного до трёх вариантов. Результат воспроизводим при одинаковом seed
+def generate(polls=20, questions=10, options=4, respondents=500, participation=0.3, seed=1, batch_size=5000):
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    with transaction.atomic():
+        poll_objs = bulk_create_with_pks(Poll, [
+            Poll(title=f'опрос {number}', start_date=now - timedelta(days=rng.randint(0, 30)),
+                 end_date=now + timedelta(days=rng.randint(1, 30)))
+            for number in range(polls)
+        ], Poll.objects.all())
+        question_objs = bulk_create_with_pks(Question, [
+            Question(poll=poll, title=f'{poll.title} / вопрос {number}', q_type=('radio', 'check', 'text')[number % 3])
+            for poll in poll_objs for number in range(questions)
+        ], Question.objects.all())
+        option_objs = bulk_create_with_pks(Option, [
+            Option(question=question, title=f'вариант {number}')
+            for question in question_objs if question.q_type != 'text' for number in range(options)
+        ], Option.objects.all())
+        # У Respondent нет полей, кроме первичного ключа: размер пачки для SQLite задаётся явно
+        respondent_objs = bulk_create_with_pks(Respondent, [Respondent() for _ in range(respondents)],
+                                               Respondent.objects.all(), batch_size=500)
+
+    options_by_question = {}
+    for option in option_objs:
+        options_by_question.setdefault(option.question_id, []).append(option.pk)
+    weights = [1 / rank for rank in range(1, options + 1)]
+    questions_by_poll = {}
+    for question in question_objs:
+        questions_by_poll.setdefault(question.poll_id, []).append(question)
+
+    rows = []
+    for respondent in respondent_objs:
+        for poll in poll_objs:
+            if rng.random() >= participation:
+                continue
+            for question in questions_by_poll[poll.pk]:
+                if question.q_type == 'text':
+                    rows.append(AnswerRow(poll.pk, respondent.pk, question.pk, [],
+                                          ' '.join(rng.choices(WORDS, k=rng.randint(1, 8)))))
+                    continue
+                choices = options_by_question[question.pk]
+                count = 1 if question.q_type == 'radio' else rng.randint(1, min(3, len(choices)))
+                selected = set()
+                while len(selected) < count:
+                    selected.add(rng.choices(choices, weights[:len(choices)])[0])
+                rows.append(AnswerRow(poll.pk, respondent.pk, question.pk, sorted(selected), None))
+            if len(rows) >= batch_size:
+                with transaction.atomic():
+                    bulk_create_answers(rows)
+                rows = []
+    with transaction.atomic():
+        bulk_create_answers(rows)
+
+    return Dataset(poll_objs, question_objs, respondent_objs)
@@ -0,0 +1,52 @@
+from io import BytesIO
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.models import Poll, Question
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from api.serializers import QuestionRowSerializer, RespondentPollRowSerializer
+
+from . import measure
+from .data import generate
+
+
+# Кодирование и разбор больших ответов стандартными JSONRenderer/JSONParser и FastJSONRenderer/FastJSONParser:
+# история респондента, ответившего на questions вопросов (passedpoll), и список из questions вопросов
+def run(questions=10000, polls=100, options=4, iterations=20):
+    questions, polls, options, iterations = int(questions), int(polls), int(options), int(iterations)
+    dataset = generate(polls=polls, questions=questions // polls, options=options, respondents=1, participation=1)
+    respondent_id = dataset.respondents[0].pk
+
+    payloads = {
+        'passedpoll': RespondentPollRowSerializer(
+            Poll.objects.filter(poll__submissions__respondent=respondent_id).distinct().order_by('pk')
+            .values(*RespondentPollRowSerializer.fields),
+            many=True, context={'respondent_id': respondent_id},
+        ).data,
+        'question_list': QuestionRowSerializer(
+            Question.objects.order_by('pk').values(*QuestionRowSerializer.fields), many=True
+        ).data,
+    }
+
+    results = {}
+    for name, data in payloads.items():
+        content = JSONRenderer().render(data)
+        if FastJSONRenderer().render(data) != content:
+            raise AssertionError(f'{name}: вывод FastJSONRenderer отличается')
+        result = {'bytes': len(content)}
+        for label, renderer, parser in (('stdlib', JSONRenderer(), JSONParser()),
+                                        ('fast', FastJSONRenderer(), FastJSONParser())):
+            encode = measure(lambda: renderer.render(data), iterations)
+            decode = measure(lambda: parser.parse(BytesIO(content)), iterations)
+            result[label] = {
+                'encode': encode,
+                'decode': decode,
+                'encode_mb_s': round(len(content) / encode['mean_us'], 1),
+                'decode_mb_s': round(len(content) / decode['mean_us'], 1),
+            }
+        result['encode_speedup'] = round(result['stdlib']['encode']['mean_us'] / result['fast']['encode']['mean_us'], 2)
+        result['decode_speedup'] = round(result['stdlib']['decode']['mean_us'] / result['fast']['decode']['mean_us'], 2)
+        results[name] = result
+    return results
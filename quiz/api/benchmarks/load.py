@@ -0,0 +1,119 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import Poll, Question, Option, Respondent
+
+from . import measure
+from .data import generate
+
+PASSWORD = 'benchmark-password'
+
+
+# Нагрузка на все методы API через тестовый клиент Django (полный цикл WSGI-обработчика:
+# middleware, маршрутизация, аутентификация). Для каждого метода - пропускная способность
+# в одном потоке, p50/p99 и число SQL-запросов на запрос. Методы можно ограничить --set endpoints=a,b
+def run(polls=20, questions=10, options=4, respondents=500, iterations=200, endpoints=''):
+    iterations = int(iterations)
+    dataset = generate(int(polls), int(questions), int(options), int(respondents))
+
+    admin = User.objects.create_superuser('benchmark', 'benchmark@example.com', PASSWORD)
+    token = Token.objects.create(user=admin)
+    client = Client()
+    admin_client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    poll = dataset.polls[0]
+    poll_questions = list(Question.objects.filter(poll=poll).prefetch_related('options').order_by('pk'))
+    check = next(question for question in poll_questions if question.q_type == 'check')
+    check_options = [{'id': option.pk, 'title': option.title} for option in check.options.all()]
+    busiest = Respondent.objects.annotate(answers=Count('submissions')).order_by('-answers').first()
+    state = {}
+
+    def answer(question):
+        if question.q_type == 'text':
+            return {'question': question.pk, 'response_text': {'response': 'ответ'}}
+        return {'question': question.pk, 'response_options': [{'response': question.options.all()[0].pk}]}
+
+    def new_respondent():
+        state['respondent'] = Respondent.objects.create().pk
+
+    def new_poll():
+        state['poll'] = Poll.objects.create(title='удаляемый', start_date=timezone.now()).pk
+
+    def new_question():
+        state['question'] = Question.objects.create(poll=poll, title='удаляемый', q_type='text').pk
+
+    def post(client, path, data):
+        return client.post(path, json.dumps(data), content_type='application/json')
+
+    def stream(response):
+        b''.join(response.streaming_content)
+        return response
+
+    # Имя метода: (ожидаемый код ответа, подготовка без замера, запрос)
+    scenarios = {
+        'api_doc': (200, None, lambda: client.get('/api/')),
+        'poll_all_list': (200, None, lambda: admin_client.get('/api/poll/all/list/')),
+        'poll_active_list': (200, None, lambda: client.get('/api/poll/active/list/')),
+        'poll_add': (201, None, lambda: post(admin_client, '/api/poll/add/', {
+            'title': 'новый', 'start_date': timezone.now().isoformat(),
+        })),
+        'poll_import': (201, None, lambda: post(admin_client, '/api/poll/import/', {
+            'title': 'импорт', 'start_date': timezone.now().isoformat(),
+            'questions': [{'title': f'вопрос {number}', 'q_type': 'check',
+                           'options': [{'title': f'вариант {option}'} for option in range(int(options))]}
+                          for number in range(int(questions))],
+        })),
+        'poll_update': (200, None, lambda: admin_client.patch(f'/api/poll/{poll.pk}/update/', json.dumps({
+            'description': 'обновлено',
+        }), content_type='application/json')),
+        'poll_delete': (204, new_poll, lambda: admin_client.delete(f"/api/poll/{state['poll']}/delete/")),
+        'poll_results': (200, None, lambda: admin_client.get(f'/api/poll/{poll.pk}/results/')),
+        'poll_export_csv': (200, None, lambda: stream(admin_client.get(f'/api/poll/{poll.pk}/export/csv/'))),
+        'poll_export_jsonl': (200, None, lambda: stream(admin_client.get(f'/api/poll/{poll.pk}/export/jsonl/'))),
+        'question_add': (201, None, lambda: post(admin_client, '/api/question/add/', {
+            'poll': poll.pk, 'title': 'новый', 'q_type': 'check',
+            'options': [{'title': f'вариант {option}'} for option in range(int(options))],
+        })),
+        'question_update': (200, None, lambda: admin_client.put(f'/api/question/{check.pk}/update/', json.dumps({
+            'poll': poll.pk, 'title': check.title, 'q_type': check.q_type, 'options': check_options,
+        }), content_type='application/json')),
+        'question_delete': (204, new_question,
+                            lambda: admin_client.delete(f"/api/question/{state['question']}/delete/")),
+        'question_list': (200, None, lambda: client.get(f'/api/question/{poll.pk}/list/')),
+        'token_auth': (200, None, lambda: client.post('/api/token-auth/', {
+            'username': admin.username, 'password': PASSWORD,
+        })),
+        'respondent_create': (201, None, lambda: post(client, '/api/get/respondent-id/', {})),
+        'answer_send': (201, new_respondent, lambda: post(client, '/api/sendanswer/', dict(
+            answer(check), respondent=state['respondent'],
+        ))),
+        'poll_answers_send': (201, new_respondent, lambda: post(client, f'/api/poll/{poll.pk}/sendanswers/', {
+            'respondent': state['respondent'], 'answers': [answer(question) for question in poll_questions],
+        })),
+        'passed_poll': (200, None, lambda: client.get(f'/api/passedpoll/{busiest.pk}/list/')),
+        'metrics': (200, None, lambda: admin_client.get('/api/metrics/')),
+    }
+
+    names = [name for name in str(endpoints).split(',') if name] or list(scenarios)
+    results = {}
+    for name in names:
+        status, setup, request = scenarios[name]
+        if setup is not None:
+            setup()
+        response = request()
+        if response.status_code != status:
+            raise AssertionError(f'{name}: {response.status_code} вместо {status}')
+        result = measure(request, iterations, setup)
+        result['rps'] = round(1e6 / result['mean_us'], 1)
+        results[name] = result
+
+    return {
+        'dataset': {'polls': len(dataset.polls), 'questions': len(dataset.questions),
+                    'options': Option.objects.count(), 'respondents': len(dataset.respondents)},
+        'endpoints': results,
+    }
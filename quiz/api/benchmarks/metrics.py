@@ -0,0 +1,29 @@
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+
+from api.metrics import MetricsMiddleware, reset
+
+from . import measure
+
+
+# Накладные расходы MetricsMiddleware на запрос: представление-заглушка без middleware и с ним
+def run(iterations=100000):
+    iterations = int(iterations)
+    request = RequestFactory().get('/api/poll/active/list/')
+    request.resolver_match = resolve('/api/poll/active/list/')
+    response = HttpResponse()
+
+    def view(request):
+        return response
+
+    middleware = MetricsMiddleware(view)
+    reset()
+    bare = measure(lambda: view(request), iterations)
+    instrumented = measure(lambda: middleware(request), iterations)
+    reset()
+    return {
+        'bare': bare,
+        'instrumented': instrumented,
+        'overhead_us': round(instrumented['mean_us'] - bare['mean_us'], 2),
+    }
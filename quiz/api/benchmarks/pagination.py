@@ -0,0 +1,47 @@
+from base64 import b64encode
+from datetime import timedelta
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.models import Poll
+
+from . import measure
+
+
+# Курсор на позицию в выборке (в формате rest_framework CursorPagination)
+def make_cursor(position):
+    return b64encode(urlencode({'p': str(position)}).encode('ascii')).decode('ascii')
+
+
+# Время ответа poll/all/list/ на первой странице и в конце таблицы при росте числа опросов.
+# Размеры задаются через --set sizes=1000,10000,100000,1000000
+def run(sizes='1000,10000,100000', iterations=50, page_size=100):
+    client = APIClient()
+    client.force_authenticate(User(username='benchmark', is_staff=True))
+    start = timezone.now() - timedelta(days=365)
+
+    results = []
+    total = 0
+    for size in [int(size) for size in str(sizes).split(',')]:
+        while total < size:
+            batch = min(10000, size - total)
+            Poll.objects.bulk_create([
+                Poll(title=f'poll {number}', start_date=start + timedelta(seconds=number))
+                for number in range(total, total + batch)
+            ])
+            total += batch
+
+        tail = Poll.objects.order_by('-start_date', '-pk').values_list('start_date', flat=True)[int(page_size) * 2]
+        first_url = f'/api/poll/all/list/?page_size={page_size}'
+        tail_url = f'{first_url}&cursor={make_cursor(tail)}'
+        assert len(client.get(tail_url).json()['results']) == int(page_size)
+
+        results.append({
+            'polls': size,
+            'first_page': measure(lambda: client.get(first_url), int(iterations)),
+            'last_pages': measure(lambda: client.get(tail_url), int(iterations)),
+        })
+    return results
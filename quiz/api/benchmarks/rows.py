@@ -0,0 +1,82 @@
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from api.answers import bulk_create_with_pks
+from api.models import Poll, Question, Option, Submission, Selection, AnswerSheet
+from api.serializers import PollSerializer, AllQuestionSerializer, RespondentPollSerializer, PollRowSerializer, \
+    QuestionRowSerializer, RespondentPollRowSerializer, AnswerSheetRowSerializer
+
+from . import measure
+from .data import generate
+
+
+# ModelSerializer-версии и быстрые сериализаторы на страницах из questions вопросов: вопросы одного опроса
+# (AllQuestionSerializer), история респондента, ответившего на все вопросы (RespondentPollSerializer),
+# и polls опросов (PollSerializer). История также сравнивается с чтением листов ответов (answer_sheet:
+# 'model' - сборка по таблицам ответов, 'row' - листы). Замер включает загрузку данных и рендеринг JSON;
+# вывод сверяется побайтно
+def run(questions=10000, polls=100, options=4, iterations=10):
+    questions, polls, options, iterations = int(questions), int(polls), int(options), int(iterations)
+    dataset = generate(polls=polls, questions=questions // polls, options=options, respondents=1, participation=1)
+    respondent_id = dataset.respondents[0].pk
+
+    poll = Poll.objects.create(title='большой', start_date=dataset.polls[0].start_date)
+    question_objs = bulk_create_with_pks(Question, [
+        Question(poll=poll, title=f'вопрос {number}', q_type='check') for number in range(questions)
+    ], Question.objects.filter(poll=poll))
+    Option.objects.bulk_create([Option(question=question, title=f'вариант {number}')
+                                for question in question_objs for number in range(options)])
+
+    def model_questions():
+        return AllQuestionSerializer(Question.objects.filter(poll=poll).order_by('pk')
+                                     .prefetch_related('options'), many=True).data
+
+    def row_questions():
+        return QuestionRowSerializer(Question.objects.filter(poll=poll).order_by('pk')
+                                     .values(*QuestionRowSerializer.fields), many=True).data
+
+    history_polls = Poll.objects.filter(poll__submissions__respondent=respondent_id).distinct().order_by('pk')
+
+    def model_history():
+        selections = Selection.objects.select_related('option').order_by('pk')
+        submissions = Submission.objects.filter(respondent=respondent_id) \
+            .prefetch_related(Prefetch('selections', queryset=selections))
+        answered = Question.objects.filter(submissions__respondent=respondent_id).order_by('pk') \
+            .prefetch_related(Prefetch('submissions', queryset=submissions, to_attr='respondent_submissions'))
+        return RespondentPollSerializer(
+            history_polls.prefetch_related(Prefetch('poll', queryset=answered, to_attr='answered_questions')),
+            many=True,
+        ).data
+
+    def row_history():
+        return RespondentPollRowSerializer(history_polls.values(*RespondentPollRowSerializer.fields), many=True,
+                                           context={'respondent_id': respondent_id}).data
+
+    def sheet_history():
+        return AnswerSheetRowSerializer(AnswerSheet.objects.filter(respondent=respondent_id).order_by('poll')
+                                        .values(*AnswerSheetRowSerializer.fields), many=True,
+                                        context={'respondent_id': respondent_id}).data
+
+    def model_polls():
+        return PollSerializer(Poll.objects.order_by('pk'), many=True).data
+
+    def row_polls():
+        return PollRowSerializer(Poll.objects.order_by('pk').values(*PollRowSerializer.fields), many=True).data
+
+    render = JSONRenderer().render
+    results = {}
+    for name, model, row in (('all_question', model_questions, row_questions),
+                             ('respondent_poll', model_history, row_history),
+                             ('answer_sheet', row_history, sheet_history),
+                             ('poll', model_polls, row_polls)):
+        if render(model()) != render(row()):
+            raise AssertionError(f'{name}: вывод быстрого сериализатора отличается')
+        model_result = measure(lambda: render(model()), iterations)
+        row_result = measure(lambda: render(row()), iterations)
+        results[name] = {
+            'model': model_result,
+            'row': row_result,
+            'speedup': round(model_result['mean_us'] / row_result['mean_us'], 2),
+        }
+    results['questions'] = questions
+    return results
@@ -0,0 +1,101 @@
+import random
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from api.answers import bulk_create_with_pks
+from api.models import Poll, Question, Respondent, Submission
+from api.search import AnswerSearch
+
+from . import measure
+
+# Словарь ответов: популярность слов убывает по закону Ципфа, у слов несколько форм
+WORDS = (
+    'доставка', 'доставки', 'доставкой', 'курьер', 'курьера', 'быстро', 'долго', 'вовремя', 'опоздал', 'товар',
+    'товары', 'качество', 'качеством', 'цена', 'цены', 'дорого', 'дешево', 'удобно', 'неудобно', 'приложение',
+    'приложении', 'оплата', 'оплатой', 'поддержка', 'поддержку', 'вежливый', 'вежливо', 'упаковка', 'упаковкой',
+    'понравилось', 'понравился', 'не', 'очень', 'всё', 'хорошо', 'плохо', 'отлично', 'ужасно', 'спасибо', 'снова',
+)
+RARE_WORD = 'телепортация'
+
+
+def _texts(rng, count, rare_rate):
+    weights = [1 / rank for rank in range(1, len(WORDS) + 1)]
+    for _ in range(count):
+        words = rng.choices(WORDS, weights, k=rng.randint(3, 12))
+        if rng.random() < rare_rate:
+            words.append(RARE_WORD)
+        yield ' '.join(words)
+
+
+# Поиск по текстовым ответам (api.search) против поиска подстроки (icontains) на answers ответах:
+# первая страница из page_size результатов с общим числом найденных - по редкому слову, по слову средней
+# частоты и по слову почти из каждого ответа (без оценки релевантности, см. SEARCH_RANK_LIMIT), в том числе
+# в одном опросе. Вставка ответов идёт через триггеры индекса, её скорость тоже измеряется.
+# Для 5 млн ответов: --test-db /tmp/search.sqlite3 --set answers=5000000
+def run(answers=200000, polls=10, questions=10, page_size=20, iterations=20, scan_iterations=3, seed=1,
+        batch_size=10000):
+    answers, polls, questions = int(answers), int(polls), int(questions)
+    page_size, iterations, scan_iterations = int(page_size), int(iterations), int(scan_iterations)
+    rng = random.Random(int(seed))
+    now = timezone.now()
+
+    poll_objs = bulk_create_with_pks(Poll, [
+        Poll(title=f'опрос {number}', start_date=now - timedelta(days=1)) for number in range(polls)
+    ], Poll.objects.all())
+    question_ids = [question.pk for question in bulk_create_with_pks(Question, [
+        Question(poll=poll, title=f'{poll.title} / вопрос {number}', q_type='text')
+        for poll in poll_objs for number in range(questions)
+    ], Question.objects.all())]
+    respondent_count = -(-answers // len(question_ids))
+    respondent_ids = [respondent.pk for respondent in bulk_create_with_pks(
+        Respondent, [Respondent() for _ in range(respondent_count)], Respondent.objects.all(), batch_size=500
+    )]
+
+    texts = _texts(rng, answers, rare_rate=1e-4)
+    started = time.perf_counter()
+    for start in range(0, answers, int(batch_size)):
+        Submission.objects.bulk_create([
+            Submission(respondent_id=respondent_ids[number // len(question_ids)],
+                       question_id=question_ids[number % len(question_ids)], text=next(texts))
+            for number in range(start, min(answers, start + int(batch_size)))
+        ])
+    insert = time.perf_counter() - started
+
+    def fts(query, **filters):
+        search = AnswerSearch(query, **filters)
+        return search.count(), search[0:page_size]
+
+    def scan(query, **filters):
+        submissions = Submission.objects.filter(text__icontains=query, **filters)
+        return submissions.count(), list(submissions.order_by('pk').values('pk', 'text')[:page_size])
+
+    poll_id = poll_objs[0].pk
+    if fts(RARE_WORD)[0] != scan(RARE_WORD)[0]:
+        raise AssertionError('Поиск по индексу нашёл другое число ответов, чем поиск подстроки')
+
+    return {
+        'answers': answers,
+        'insert_answers_per_s': round(answers / insert),
+        'rare_word': {
+            'found': fts(RARE_WORD)[0],
+            'fts': measure(lambda: fts(RARE_WORD), iterations),
+            'icontains': measure(lambda: scan(RARE_WORD), scan_iterations),
+        },
+        'medium_word': {
+            'found': fts('упаковка')[0],
+            'fts': measure(lambda: fts('упаковка'), iterations),
+            'icontains': measure(lambda: scan('упаковк'), scan_iterations),
+        },
+        'common_word': {
+            'found': fts('доставка')[0],
+            'fts': measure(lambda: fts('доставка'), iterations),
+            'icontains': measure(lambda: scan('доставк'), scan_iterations),
+        },
+        'common_word_in_poll': {
+            'found': fts('доставка', poll=poll_id)[0],
+            'fts': measure(lambda: fts('доставка', poll=poll_id), iterations),
+            'icontains': measure(lambda: scan('доставк', question__poll=poll_id), scan_iterations),
+        },
+    }
@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import Count
+
+from api.models import Poll, Question, Respondent
+from api.serializers import CreateAnswerSerializer, AnswerSheetRowSerializer, QuestionRowSerializer
+from api.views import ListRespondentPoll, ListAllQuestions
+
+from . import measure
+from .data import generate
+
+
+# Откат изменений, сделанных замеряемой функцией
+class Rollback(Exception):
+    pass
+
+
+def rolled_back(func):
+    def wrapper():
+        try:
+            with transaction.atomic():
+                func()
+                raise Rollback
+        except Rollback:
+            pass
+    return wrapper
+
+
+# Сериализаторы на синтетических данных: проверка и запись ответа (CreateAnswerSerializer),
+# история ответов респондента и вопросы опроса (сериализаторы представлений ListRespondentPoll и ListAllQuestions).
+# Чтение замеряется вместе с загрузкой queryset представления
+def run(polls=20, questions=10, options=4, respondents=500, iterations=500):
+    iterations = int(iterations)
+    dataset = generate(int(polls), int(questions), int(options), int(respondents))
+
+    question = Question.objects.filter(q_type='check').prefetch_related('options').first()
+    respondent = Respondent.objects.create()
+    data = {
+        'question': question.pk,
+        'respondent': respondent.pk,
+        'response_options': [{'response': option.pk} for option in question.options.all()[:2]],
+    }
+
+    def validate():
+        CreateAnswerSerializer(data=data).is_valid(raise_exception=True)
+
+    def create():
+        serializer = CreateAnswerSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    # Респондент с наибольшим числом пройденных опросов
+    busiest = Respondent.objects.annotate(answers=Count('submissions')).order_by('-answers').first()
+    history = ListRespondentPoll(kwargs={'pk': busiest.pk})
+    definition = ListAllQuestions(kwargs={'pk': dataset.polls[0].pk})
+
+    return {
+        'dataset': {'polls': len(dataset.polls), 'questions': len(dataset.questions),
+                    'respondents': len(dataset.respondents)},
+        'create_answer_validate': measure(validate, iterations),
+        'create_answer_create': measure(rolled_back(create), iterations),
+        'respondent_poll': measure(
+            lambda: AnswerSheetRowSerializer(list(history.get_queryset()), many=True,
+                                             context={'respondent_id': busiest.pk}).data, iterations
+        ),
+        'all_question': measure(
+            lambda: QuestionRowSerializer(list(definition.get_queryset()), many=True).data, iterations
+        ),
+        'polls_in_history': Poll.objects.filter(poll__submissions__respondent=busiest).distinct().count(),
+    }
@@ -0,0 +1,50 @@
+from django.utils import timezone
+
+from api.cache import clear_question_index
+from api.models import Poll, Question, Option, Respondent, Submission
+from api.serializers import CreateAnswerSerializer
+
+from . import measure
+
+
+# Проверка ответа на вопрос 'check' до появления индекса вариантов ответа и уникального ограничения
+# на ответ: поле response (PrimaryKeyRelatedField) загружало каждый выбранный вариант отдельным запросом
+def legacy_validate(data):
+    if Submission.objects.filter(respondent=data['respondent'], question=data['question']).exists():
+        raise AssertionError
+    options_for_this_question = Option.objects.filter(question=data['question'])
+    for option in data['response_options']:
+        if not (Option.objects.get(pk=option['response']) in options_for_this_question):
+            raise AssertionError
+
+
+# CreateAnswerSerializer.is_valid() для вопроса 'check' с 50 вариантами ответа: прежняя проверка, индекс
+# после сброса (первый ответ на вопрос в процессе) и прогретый индекс. Запросы с прогретым индексом - только
+# поля question и respondent, их число не зависит от числа выбранных вариантов
+def run(options=50, selected=5, iterations=2000):
+    options, selected, iterations = int(options), int(selected), int(iterations)
+    poll = Poll.objects.create(title='benchmark', start_date=timezone.now())
+    question = Question.objects.create(poll=poll, title='benchmark', q_type='check')
+    Option.objects.bulk_create([Option(question=question, title=f'option {n}') for n in range(options)])
+    option_ids = list(Option.objects.filter(question=question).values_list('id', flat=True))
+    respondent = Respondent.objects.create()
+
+    data = {
+        'question': question.pk,
+        'respondent': respondent.pk,
+        'response_options': [{'response': option_id} for option_id in option_ids[-selected:]],
+    }
+
+    def is_valid():
+        CreateAnswerSerializer(data=data).is_valid(raise_exception=True)
+
+    result = {
+        'options': options,
+        'selected': selected,
+        'legacy': measure(lambda: legacy_validate(data), iterations),
+        'cold_index': measure(is_valid, iterations, setup=clear_question_index),
+    }
+    clear_question_index()
+    is_valid()
+    result['warm_index'] = measure(is_valid, iterations)
+    return result
@@ -0,0 +1,133 @@
+import hashlib
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.utils import timezone
+
+from .models import Question, Option
+
+
+def get_cache():
+    return caches[getattr(settings, 'POLL_CACHE_ALIAS', 'default')]
+
+
+# Версии кешируемых данных. Начальное значение берётся от времени, чтобы после вытеснения ключа версии
+# из кеша не вернуться к уже использованному номеру
+def get_version(name):
+    cache = get_cache()
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(name):
+    cache = get_cache()
+    key = f'version:{name}'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+
+def _variant_key(variant):
+    return hashlib.md5(variant.encode()).hexdigest() if variant else ''
+
+
+# Определение опроса (вопросы с вариантами ответа) в виде готового JSON.
+# variant - строка запроса, от которой зависит ответ (страница)
+def get_poll_definition(poll_id, render, variant=''):
+    cache = get_cache()
+    key = f'poll-definition:{poll_id}:{get_version(f"poll:{poll_id}")}:{_variant_key(variant)}'
+    entry = cache.get(key)
+    if entry is None:
+        content = render()
+        entry = ('"%s"' % hashlib.md5(content).hexdigest(), content)
+        cache.set(key, entry, getattr(settings, 'POLL_DEFINITION_TIMEOUT', 24 * 60 * 60))
+    return entry
+
+
+def invalidate_poll(*poll_ids):
+    for poll_id in set(poll_ids):
+        bump_version(f'poll:{poll_id}')
+    stick_to_primary('polls')
+
+
+# Список активных опросов. Хранится до ближайшей границы (начало или окончание какого-либо опроса),
+# render возвращает (данные, момент границы или None), variant - строка запроса (страница)
+def get_active_polls(render, variant=''):
+    cache = get_cache()
+    key = f'active-polls:{get_version("active-polls")}:{_variant_key(variant)}'
+    entry = cache.get(key)
+    if entry is None or (entry[1] is not None and timezone.now() >= entry[1]):
+        data, expires_at = render()
+        entry = (data, expires_at)
+        timeout = getattr(settings, 'ACTIVE_POLLS_TIMEOUT', 24 * 60 * 60)
+        if expires_at is not None:
+            timeout = min(timeout, max(1, int((expires_at - timezone.now()).total_seconds()) + 1))
+        cache.set(key, entry, timeout)
+    return entry[0]
+
+
+def invalidate_active_polls():
+    bump_version('active-polls')
+    stick_to_primary('polls')
+
+
+# Сведения о вопросе для проверки ответов без запросов к базе
+QuestionMeta = namedtuple('QuestionMeta', ['poll_id', 'title', 'q_type', 'option_ids', 'archived'])
+
+# Индекс вопросов в памяти процесса: вопрос -> (версия, QuestionMeta с идентификаторами вариантов ответа).
+# Актуальность записи сверяется с версией вопроса в общем кеше, поэтому правка в одном процессе
+# сбрасывает индекс во всех
+_question_index = OrderedDict()
+
+
+def get_question_meta(question_id):
+    version = get_version(f'question:{question_id}')
+    entry = _question_index.get(question_id)
+    if entry is None or entry[0] != version:
+        poll_id, title, q_type, archive = Question.objects.values_list('poll', 'title', 'q_type', 'poll__archive') \
+            .get(pk=question_id)
+        option_ids = frozenset(Option.objects.filter(question=question_id).values_list('id', flat=True))
+        entry = (version, QuestionMeta(poll_id, title, q_type, option_ids, archive is not None))
+        _question_index[question_id] = entry
+        if len(_question_index) > getattr(settings, 'QUESTION_INDEX_SIZE', 10000):
+            _question_index.popitem(last=False)
+    return entry[1]
+
+
+def clear_question_index():
+    _question_index.clear()
+
+
+def invalidate_question(*question_ids):
+    for question_id in set(question_ids):
+        bump_version(f'question:{question_id}')
+
+
+# Чтение с реплики (api.routers). После записи чтение данных области scope ('polls' - опросы и вопросы,
+# 'respondent:<id>' - ответы респондента) REPLICA_STICKY_SECONDS секунд идёт с основной базы, пока реплика
+# не догонит её. Иначе кеш определений опросов мог бы заполниться устаревшими данными с реплики
+REPLICA = 'replica'
+
+
+def replica_configured():
+    return REPLICA in connections.databases
+
+
+def stick_to_primary(*scopes):
+    if replica_configured():
+        get_cache().set_many({f'replica:sticky:{scope}': True for scope in scopes}, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_stuck_to_primary(scope):
+    return get_cache().get(f'replica:sticky:{scope}', False)
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Poll, Question, Option, Submission, Selection, PollCounter, QuestionCounter, OptionCounter, \
+    AnswerSheet, PollArchive, PollArchiveChunk
+from .sheets import mark_stale
+
+# Таблицы, зависящие от вопросов, в порядке удаления, и путь от каждой к вопросу
+QUESTION_DEPENDENTS = (
+    (Selection, 'submission__question'),
+    (Selection, 'option__question'),
+    (Submission, 'question'),
+    (OptionCounter, 'option__question'),
+    (Option, 'question'),
+    (QuestionCounter, 'question'),
+)
+
+
+# Шаги удаления: (модель, условие на её строки). questions и polls - подзапросы с первичными ключами
+# удаляемых вопросов и опросов, опросы удаляются после всех своих вопросов
+def _stages(questions, polls=None):
+    stages = [(model, {f'{path}__in': questions}) for model, path in QUESTION_DEPENDENTS]
+    stages.append((Question, {'pk__in': questions}))
+    if polls is not None:
+        stages += [(AnswerSheet, {'poll__in': polls}), (PollArchiveChunk, {'archive__in': polls}),
+                   (PollArchive, {'poll__in': polls}), (PollCounter, {'poll__in': polls}), (Poll, {'pk__in': polls})]
+    return stages
+
+
+# Удаление без сборщика каскадов Django: по одному DELETE с подзапросом на таблицу, строки не загружаются
+# в память и сигналы не отправляются
+def _delete_now(stages):
+    with transaction.atomic():
+        for model, lookups in stages:
+            queryset = model._base_manager.filter(**lookups)
+            queryset._raw_delete(queryset.db)
+
+
+# Удаление опросов и вопросов со всеми ответами и счётчиками. При DELETE_MODE = tombstone строки только
+# помечаются удалёнными (ответ на запрос не ждёт удаления ответов), а удаляет их команда purge_deleted
+def delete_polls(*poll_ids):
+    if settings.DELETE_MODE == 'tombstone':
+        now = timezone.now()
+        with transaction.atomic():
+            Question.all_objects.filter(poll__in=poll_ids, deleted_at__isnull=True).update(deleted_at=now)
+            Poll.all_objects.filter(pk__in=poll_ids, deleted_at__isnull=True).update(deleted_at=now)
+        return
+    _delete_now(_stages(Question.all_objects.filter(poll__in=poll_ids).values('pk'),
+                        Poll.all_objects.filter(pk__in=poll_ids).values('pk')))
+
+
+# Листы ответов опросов удалённых вопросов собираются заново (см. api.sheets)
+def delete_questions(*question_ids):
+    mark_stale(*Question.all_objects.filter(pk__in=question_ids).values_list('poll', flat=True).distinct())
+    if settings.DELETE_MODE == 'tombstone':
+        Question.all_objects.filter(pk__in=question_ids, deleted_at__isnull=True).update(deleted_at=timezone.now())
+        return
+    _delete_now(_stages(Question.all_objects.filter(pk__in=question_ids).values('pk')))
+
+
+# Удаление не более batch_size строк помеченных опросов и вопросов одной короткой транзакцией:
+# строки первой непустой таблицы в порядке зависимостей. Возвращает число удалённых строк (0 - удалять нечего)
+def purge_batch(batch_size):
+    questions = Question.all_objects.filter(deleted_at__isnull=False).values('pk')
+    polls = Poll.all_objects.filter(deleted_at__isnull=False, poll__isnull=True).values('pk')
+    for model, lookups in _stages(questions, polls):
+        ids = list(model._base_manager.filter(**lookups).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if ids:
+            with transaction.atomic():
+                queryset = model._base_manager.filter(pk__in=ids)
+                queryset._raw_delete(queryset.db)
+            return len(ids)
+    return 0
@@ -0,0 +1,74 @@
+import csv
+import json
+
+from .archive import iter_archived_answers
+from .models import Submission
+
+CSV_COLUMNS = ['respondent', 'question', 'question_title', 'q_type', 'option_ids', 'options', 'text']
+
+
+# Ответы на вопросы опроса одним запросом с join, по строке на пару респондент x вопрос.
+# Строки читаются порциями через iterator(), поэтому расход памяти не зависит от числа ответов.
+# Ответы опроса, перенесённые в архив, выводятся первыми
+def iter_answers(poll_id, chunk_size=2000):
+    yield from iter_archived_answers(poll_id)
+    rows = Submission.objects.filter(question__poll=poll_id, question__deleted_at__isnull=True) \
+        .order_by('respondent', 'question', 'selections__pk') \
+        .values_list('pk', 'respondent', 'question', 'question__title', 'question__q_type', 'text',
+                     'selections__option', 'selections__option__title') \
+        .iterator(chunk_size=chunk_size)
+
+    answer = None
+    for pk, respondent_id, question_id, title, q_type, text, option_id, option_title in rows:
+        if answer is None or answer['submission'] != pk:
+            if answer is not None:
+                del answer['submission']
+                yield answer
+            answer = {
+                'submission': pk,
+                'respondent': respondent_id,
+                'question': question_id,
+                'question_title': title,
+                'q_type': q_type,
+                'option_ids': [],
+                'options': [],
+                'text': text,
+            }
+        if option_id is not None:
+            answer['option_ids'].append(option_id)
+            answer['options'].append(option_title)
+    if answer is not None:
+        del answer['submission']
+        yield answer
+
+
+class _Echo:
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(poll_id, chunk_size=2000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for answer in iter_answers(poll_id, chunk_size):
+        yield writer.writerow([
+            answer['respondent'],
+            answer['question'],
+            answer['question_title'],
+            answer['q_type'],
+            ';'.join(str(option_id) for option_id in answer['option_ids']),
+            ';'.join(answer['options']),
+            answer['text'] if answer['text'] is not None else '',
+        ])
+
+
+def iter_jsonl(poll_id, chunk_size=2000):
+    for answer in iter_answers(poll_id, chunk_size):
+        yield json.dumps(answer, ensure_ascii=False) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson; charset=utf-8'),
+}
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.archive import closed_polls, archive_poll, restore_poll
+
+
+class Command(BaseCommand):
+    help = 'Перенос ответов завершённых опросов (старше ARCHIVE_AFTER_DAYS дней) в архив'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, action='append', dest='polls',
+                            help='Перенести в архив указанный опрос независимо от даты окончания')
+        parser.add_argument('--restore', type=int, action='append', dest='restore',
+                            help='Вернуть ответы опроса из архива в таблицы ответов')
+        parser.add_argument('--once', action='store_true', help='Перенести завершённые опросы и завершить работу')
+        parser.add_argument('--interval', type=float, default=60 * 60,
+                            help='Пауза между проверками завершённых опросов (секунды)')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            for poll_id in options['restore']:
+                self.stdout.write(f'Опрос {poll_id}: возвращено ответов {restore_poll(poll_id)}')
+            return
+        if options['polls']:
+            for poll_id in options['polls']:
+                self.stdout.write(f'Опрос {poll_id}: перенесено ответов {archive_poll(poll_id)}')
+            return
+
+        total = 0
+        try:
+            while True:
+                for poll_id in closed_polls().order_by('end_date').values_list('pk', flat=True):
+                    archived = archive_poll(poll_id)
+                    total += archived
+                    self.stdout.write(f'Опрос {poll_id}: перенесено ответов {archived}')
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Перенесено ответов: {total}'))
@@ -0,0 +1,73 @@
+import importlib
+import inspect
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment
+
+from api.analytics import clear_matrices
+from api.cache import get_cache, clear_question_index
+
+BENCHMARKS = ['validate', 'pagination', 'metrics', 'serializers', 'load', 'rows', 'json_codec', 'concurrency',
+              'analytics', 'search']
+
+
+# Откат данных бенчмарка, чтобы следующий запускался на пустой базе
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Запуск бенчмарков на временной тестовой базе данных'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f'Бенчмарки для запуска: {", ".join(BENCHMARKS)}')
+        parser.add_argument('--output', help='Файл для результатов в формате JSON')
+        parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', dest='params',
+                            help='Параметр бенчмарка, например --set sizes=1000,1000000')
+        parser.add_argument('--test-db', help='Файл временной базы SQLite (по умолчанию база в памяти)')
+
+    def handle(self, *args, **options):
+        names = options['names'] or BENCHMARKS
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f'Неизвестные бенчмарки: {", ".join(sorted(unknown))}')
+
+        try:
+            params = dict(param.split('=', 1) for param in options['params'])
+        except ValueError:
+            raise CommandError('Параметры задаются в виде NAME=VALUE')
+
+        setup_test_environment()
+        if options['test_db']:
+            connection.settings_dict['TEST']['NAME'] = options['test_db']
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            results = {}
+            for name in names:
+                module = importlib.import_module(f'api.benchmarks.{name}')
+                accepted = inspect.signature(module.run).parameters
+                kwargs = {key: value for key, value in params.items() if key in accepted}
+                get_cache().clear()
+                clear_question_index()
+                clear_matrices()
+                # Бенчмарки с ROLLBACK = False пишут в базу из нескольких соединений и не откатываются
+                if not getattr(module, 'ROLLBACK', True):
+                    results[name] = module.run(**kwargs)
+                    continue
+                try:
+                    with transaction.atomic():
+                        results[name] = module.run(**kwargs)
+                        raise Rollback
+                except Rollback:
+                    pass
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = json.dumps(results, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+        self.stdout.write(report)
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.spool import get_spool, drain_batch
+
+
+class Command(BaseCommand):
+    help = 'Перенос ответов из очереди (ANSWER_INGEST_MODE = spool) в базу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Разобрать очередь и завершить работу')
+        parser.add_argument('--batch-size', type=int, default=settings.ANSWER_SPOOL_BATCH_SIZE,
+                            help='Ответов в одной транзакции')
+        parser.add_argument('--interval', type=float, default=1.0, help='Пауза при пустой очереди (секунды)')
+        parser.add_argument('--retention', type=float, default=24,
+                            help='Время хранения состояния обработанных ответов (часы)')
+
+    def handle(self, *args, **options):
+        spool = get_spool()
+        total = 0
+        try:
+            while True:
+                drained = drain_batch(spool, options['batch_size'])
+                total += drained
+                if drained:
+                    continue
+                spool.purge(options['retention'] * 60 * 60)
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Обработано ответов: {total}'))
@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import EXPORT_FORMATS
+from api.models import Poll
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка ответов на опрос в CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('poll', type=int, help='Опрос')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', help='Формат выгрузки')
+        parser.add_argument('--output', help='Файл для выгрузки (по умолчанию stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Размер порции чтения из базы')
+
+    def handle(self, *args, **options):
+        if not Poll.objects.filter(pk=options['poll']).exists():
+            raise CommandError(f"Опрос '{options['poll']}' не найден")
+
+        iter_rows, _ = EXPORT_FORMATS[options['format']]
+        output = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for line in iter_rows(options['poll'], options['chunk_size']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,32 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.serializers import ImportPollSerializer
+
+
+class Command(BaseCommand):
+    help = 'Импорт опросов вместе с вопросами и вариантами ответа из JSON (опрос или список опросов)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Файл JSON ('-' - stdin)")
+
+    def handle(self, *args, **options):
+        source = sys.stdin if options['file'] == '-' else open(options['file'], encoding='utf-8')
+        try:
+            data = json.load(source)
+        except ValueError as error:
+            raise CommandError(f'Некорректный JSON: {error}')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        serializer = ImportPollSerializer(data=data, many=isinstance(data, list))
+        if not serializer.is_valid():
+            raise CommandError(json.dumps(serializer.errors, ensure_ascii=False))
+
+        with transaction.atomic():
+            serializer.save()
+        self.stdout.write(json.dumps(serializer.data, ensure_ascii=False))
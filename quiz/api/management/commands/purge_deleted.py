@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.deletion import purge_batch
+
+
+class Command(BaseCommand):
+    help = 'Удаление строк опросов и вопросов, помеченных удалёнными (DELETE_MODE = tombstone)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Удалить все помеченные строки и завершить работу')
+        parser.add_argument('--batch-size', type=int, default=settings.PURGE_BATCH_SIZE,
+                            help='Строк в одной транзакции')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Пауза, когда удалять нечего (секунды)')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Пауза между транзакциями, чтобы не занимать базу (секунды)')
+
+    def handle(self, *args, **options):
+        total = 0
+        try:
+            while True:
+                purged = purge_batch(options['batch_size'])
+                total += purged
+                if purged:
+                    time.sleep(options['pause'])
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Удалено строк: {total}'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Respondent, AnswerSheet
+from api.sheets import rebuild_sheets, check_sheets
+
+
+class Command(BaseCommand):
+    help = 'Заполнение листов ответов респондентов по таблицам ответов и сверка с ними'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--respondent', type=int, action='append', dest='respondents',
+                            help='Респондент (можно указать несколько)')
+        parser.add_argument('--stale', action='store_true', help='Пересобрать только листы, помеченные устаревшими')
+        parser.add_argument('--check', action='store_true', help='Только сверить листы и вывести расхождения')
+        parser.add_argument('--batch-size', type=int, default=500, help='Респондентов в одной транзакции')
+
+    def handle(self, *args, **options):
+        respondents = Respondent.objects.order_by('pk')
+        if options['respondents']:
+            respondents = respondents.filter(pk__in=options['respondents'])
+        if options['stale']:
+            respondents = respondents.filter(answer_sheets__stale=True).distinct()
+        respondent_ids = list(respondents.values_list('pk', flat=True))
+
+        total = 0
+        for start in range(0, len(respondent_ids), options['batch_size']):
+            batch = respondent_ids[start:start + options['batch_size']]
+            if options['check']:
+                for respondent_id, poll_id in check_sheets(batch):
+                    total += 1
+                    self.stdout.write(f'{AnswerSheet._meta.verbose_name} {respondent_id} / {poll_id}')
+            elif options['stale']:
+                poll_ids = AnswerSheet.objects.filter(respondent__in=batch, stale=True).values_list('poll', flat=True)
+                total += rebuild_sheets(batch, set(poll_ids))
+            else:
+                total += rebuild_sheets(batch)
+
+        if options['check']:
+            if total:
+                raise CommandError(f'Расхождений: {total}')
+            self.stdout.write(f'Расхождений: {total}')
+            return
+        self.stdout.write(self.style.SUCCESS(f'Обновлено листов: {total}'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import PollCounter, QuestionCounter, OptionCounter
+from api.results import count_results, stored_results
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков результатов опросов по таблицам ответов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=int, action='append', dest='polls', help='Опрос (можно указать несколько)')
+        parser.add_argument('--check', action='store_true', help='Только сверить счётчики и вывести расхождения')
+
+    def handle(self, *args, **options):
+        poll_ids = options['polls']
+
+        with transaction.atomic():
+            expected = count_results(poll_ids)
+            stored = stored_results(poll_ids)
+
+            drift = 0
+            for model in (PollCounter, QuestionCounter, OptionCounter):
+                for key in sorted(set(expected[model]) | set(stored[model])):
+                    if expected[model].get(key, 0) != stored[model].get(key, 0):
+                        drift += 1
+                        self.stdout.write(
+                            f'{model._meta.verbose_name} {key}: '
+                            f'{stored[model].get(key, 0)} вместо {expected[model].get(key, 0)}'
+                        )
+
+            if options['check']:
+                if drift:
+                    raise CommandError(f'Расхождений: {drift}')
+                self.stdout.write(f'Расхождений: {drift}')
+                return
+
+            # Счётчики опросов в архиве не пересчитываются: их ответов нет в таблицах, пересчёт обнулил бы результаты
+            self._rebuild(PollCounter, 'respondents', expected[PollCounter], 'poll', poll_ids)
+            self._rebuild(QuestionCounter, 'respondents', expected[QuestionCounter], 'question__poll', poll_ids)
+            self._rebuild(OptionCounter, 'count', expected[OptionCounter], 'option__question__poll', poll_ids)
+
+        self.stdout.write(self.style.SUCCESS(f'Счётчики пересчитаны, исправлено расхождений: {drift}'))
+
+    @staticmethod
+    def _rebuild(model, field, values, poll_path, poll_ids):
+        queryset = model.objects.filter(**{f'{poll_path}__archive__isnull': True})
+        if poll_ids is not None:
+            queryset = queryset.filter(**{f'{poll_path}__in': poll_ids})
+        queryset.delete()
+        key_field = model._meta.pk.attname
+        model.objects.bulk_create([model(**{key_field: key, field: value}) for key, value in values.items()],
+                                  batch_size=500)
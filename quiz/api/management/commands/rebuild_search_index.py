@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.search import rebuild_index, check_index
+
+
+class Command(BaseCommand):
+    help = 'Перестроение полнотекстового индекса текстовых ответов и проверка его целостности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Только проверить индекс')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            error = check_index()
+            if error:
+                raise CommandError(f'Индекс не совпадает с таблицей ответов: {error}')
+            self.stdout.write('Расхождений: 0')
+            return
+
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Индекс поиска перестроен'))
@@ -0,0 +1,140 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+# Границы корзин гистограммы времени ответа (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Статистика одного представления: запросы, гистограмма времени ответа, число и время SQL-запросов
+class ViewMetrics:
+    __slots__ = ('requests', 'buckets', 'latency', 'queries', 'sql_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency = 0.0
+        self.queries = 0
+        self.sql_time = 0.0
+
+
+# Метрики хранятся в памяти процесса: при нескольких процессах сервера каждый отдаёт свои
+_metrics = {}
+_lock = threading.Lock()
+
+
+def record(view, latency, queries, sql_time):
+    with _lock:
+        metrics = _metrics.get(view)
+        if metrics is None:
+            metrics = _metrics[view] = ViewMetrics()
+        metrics.requests += 1
+        metrics.buckets[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        metrics.latency += latency
+        metrics.queries += queries
+        metrics.sql_time += sql_time
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
+
+
+# Счётчик числа и времени SQL-запросов (обёртка connection.execute_wrapper)
+class QueryTimer:
+    __slots__ = ('count', 'elapsed')
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - started
+            self.count += 1
+
+
+# Имя представления для меток: класс для представлений на классах, иначе функция
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    func = getattr(match.func, 'view_class', match.func)
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+# Учёт каждого запроса: время ответа, число и время SQL-запросов по представлениям.
+# Для потоковых ответов время учитывается до начала передачи тела
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        latency = time.perf_counter() - started
+
+        record(view_name(request), latency, timer.count, timer.elapsed)
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = (
+                f'db;dur={timer.elapsed * 1000:.2f};desc="{timer.count} queries", '
+                f'total;dur={latency * 1000:.2f}'
+            )
+        return response
+
+
+def _format(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Метрики в текстовом формате Prometheus
+def render_metrics():
+    with _lock:
+        snapshot = [
+            (view, metrics.requests, list(metrics.buckets), metrics.latency, metrics.queries, metrics.sql_time)
+            for view, metrics in sorted(_metrics.items())
+        ]
+
+    lines = [
+        '# HELP quiz_http_requests_total Обработано запросов',
+        '# TYPE quiz_http_requests_total counter',
+    ]
+    lines += [f'quiz_http_requests_total{{view="{view}"}} {requests}' for view, requests, *_ in snapshot]
+
+    lines += [
+        '# HELP quiz_http_request_duration_seconds Время ответа',
+        '# TYPE quiz_http_request_duration_seconds histogram',
+    ]
+    for view, requests, buckets, latency, _, _ in snapshot:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += count
+            lines.append(f'quiz_http_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+        lines.append(f'quiz_http_request_duration_seconds_sum{{view="{view}"}} {_format(latency)}')
+        lines.append(f'quiz_http_request_duration_seconds_count{{view="{view}"}} {requests}')
+
+    lines += [
+        '# HELP quiz_db_queries_total Выполнено SQL-запросов',
+        '# TYPE quiz_db_queries_total counter',
+    ]
+    lines += [f'quiz_db_queries_total{{view="{view}"}} {queries}' for view, _, _, _, queries, _ in snapshot]
+
+    lines += [
+        '# HELP quiz_db_query_duration_seconds_total Время выполнения SQL-запросов',
+        '# TYPE quiz_db_query_duration_seconds_total counter',
+    ]
+    lines += [f'quiz_db_query_duration_seconds_total{{view="{view}"}} {_format(sql_time)}'
+              for view, _, _, _, _, sql_time in snapshot]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Submission',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='api.Question', verbose_name='вопрос')),
+                ('respondent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='api.Respondent', verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'ответ респондента',
+                'verbose_name_plural': 'ответы респондентов',
+            },
+        ),
+        migrations.AddField(
+            model_name='baseanswer',
+            name='submission',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='api.Submission', verbose_name='ответ респондента'),
+        ),
+        # Один ответ респондента на каждую пару (респондент, вопрос) из уже сохранённых ответов
+        migrations.RunSQL(
+            sql=[
+                'INSERT INTO api_submission (question_id, respondent_id) '
+                'SELECT DISTINCT question_id, respondent_id FROM api_baseanswer',
+                'UPDATE api_baseanswer SET submission_id = ('
+                'SELECT s.id FROM api_submission s '
+                'WHERE s.question_id = api_baseanswer.question_id AND s.respondent_id = api_baseanswer.respondent_id)',
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='submission',
+            constraint=models.UniqueConstraint(fields=('respondent', 'question'), name='unique_respondent_question'),
+        ),
+    ]
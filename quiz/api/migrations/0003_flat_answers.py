@@ -0,0 +1,66 @@
+# Generated by Django 2.2.10 on 2026-10-18 19:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_submission'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='submission',
+            options={'verbose_name': 'ответ', 'verbose_name_plural': 'ответы'},
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='text',
+            field=models.TextField(blank=True, null=True, verbose_name='ответ текстом'),
+        ),
+        migrations.CreateModel(
+            name='Selection',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('option', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='selections', to='api.Option', verbose_name='ответ из вариантов')),
+                ('submission', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='selections', to='api.Submission', verbose_name='ответ')),
+            ],
+            options={
+                'verbose_name': 'выбранная опция',
+                'verbose_name_plural': 'выбранные опции',
+            },
+        ),
+        # Перенос ответов из таблиц многотабличного наследования: выбранные варианты - в api_selection
+        # (в порядке исходных ответов), текст - в api_submission.text
+        migrations.RunSQL(
+            sql=[
+                'INSERT INTO api_submission (question_id, respondent_id) '
+                'SELECT DISTINCT question_id, respondent_id FROM api_baseanswer WHERE submission_id IS NULL '
+                'AND NOT EXISTS (SELECT 1 FROM api_submission s '
+                'WHERE s.question_id = api_baseanswer.question_id AND s.respondent_id = api_baseanswer.respondent_id)',
+                'UPDATE api_baseanswer SET submission_id = ('
+                'SELECT s.id FROM api_submission s '
+                'WHERE s.question_id = api_baseanswer.question_id AND s.respondent_id = api_baseanswer.respondent_id) '
+                'WHERE submission_id IS NULL',
+                'INSERT INTO api_selection (submission_id, option_id) '
+                'SELECT b.submission_id, o.response_id FROM api_optionanswer o '
+                'INNER JOIN api_baseanswer b ON b.id = o.pm_link_id ORDER BY o.pm_link_id',
+                'UPDATE api_submission SET text = ('
+                'SELECT t.response FROM api_textanswer t INNER JOIN api_baseanswer b ON b.id = t.pm_link_id '
+                'WHERE b.submission_id = api_submission.id ORDER BY t.pm_link_id LIMIT 1) '
+                'WHERE id IN (SELECT b.submission_id FROM api_textanswer t '
+                'INNER JOIN api_baseanswer b ON b.id = t.pm_link_id)',
+            ],
+        ),
+        migrations.DeleteModel(
+            name='OptionAnswer',
+        ),
+        migrations.DeleteModel(
+            name='TextAnswer',
+        ),
+        migrations.DeleteModel(
+            name='BaseAnswer',
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_flat_answers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OptionCounter',
+            fields=[
+                ('option', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='api.Option', verbose_name='вариант ответа')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='выбран раз')),
+            ],
+            options={
+                'verbose_name': 'счётчик варианта ответа',
+                'verbose_name_plural': 'счётчики вариантов ответа',
+            },
+        ),
+        migrations.CreateModel(
+            name='PollCounter',
+            fields=[
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='api.Poll', verbose_name='опрос')),
+                ('respondents', models.PositiveIntegerField(default=0, verbose_name='респондентов')),
+            ],
+            options={
+                'verbose_name': 'счётчик опроса',
+                'verbose_name_plural': 'счётчики опросов',
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionCounter',
+            fields=[
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counter', serialize=False, to='api.Question', verbose_name='вопрос')),
+                ('respondents', models.PositiveIntegerField(default=0, verbose_name='респондентов')),
+            ],
+            options={
+                'verbose_name': 'счётчик вопроса',
+                'verbose_name_plural': 'счётчики вопросов',
+            },
+        ),
+        # Начальные значения счётчиков по уже сохранённым ответам
+        migrations.RunSQL(
+            sql=[
+                'INSERT INTO api_optioncounter (option_id, count) '
+                'SELECT option_id, COUNT(*) FROM api_selection GROUP BY option_id',
+                'INSERT INTO api_questioncounter (question_id, respondents) '
+                'SELECT question_id, COUNT(*) FROM api_submission GROUP BY question_id',
+                'INSERT INTO api_pollcounter (poll_id, respondents) '
+                'SELECT q.poll_id, COUNT(DISTINCT s.respondent_id) FROM api_submission s '
+                'INNER JOIN api_question q ON q.id = s.question_id GROUP BY q.poll_id',
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.10 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['start_date', 'end_date'], name='poll_start_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='poll',
+            index=models.Index(fields=['end_date', 'start_date'], name='poll_end_start_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.10 on 2026-10-18 19:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_deleted_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerSheet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('questions', models.TextField(default='[]', verbose_name='вопросы с ответами (JSON)')),
+                ('stale', models.BooleanField(default=False, verbose_name='требует пересборки')),
+                ('poll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_sheets', to='api.Poll', verbose_name='опрос')),
+                ('respondent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='answer_sheets', to='api.Respondent', verbose_name='пользователь')),
+            ],
+            options={
+                'verbose_name': 'лист ответов',
+                'verbose_name_plural': 'листы ответов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='answersheet',
+            constraint=models.UniqueConstraint(fields=('respondent', 'poll'), name='unique_answer_sheet'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.10 on 2026-10-18 19:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_answer_sheet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PollArchive',
+            fields=[
+                ('poll', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='api.Poll', verbose_name='опрос')),
+                ('answers', models.PositiveIntegerField(default=0, verbose_name='ответов')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='дата/время переноса в архив')),
+            ],
+            options={
+                'verbose_name': 'архив опроса',
+                'verbose_name_plural': 'архивы опросов',
+            },
+        ),
+        migrations.CreateModel(
+            name='PollArchiveChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField(verbose_name='номер части')),
+                ('answers', models.PositiveIntegerField(verbose_name='ответов')),
+                ('content', models.BinaryField(verbose_name='ответы (сжатый JSON по столбцам)')),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.PollArchive', verbose_name='архив опроса')),
+            ],
+            options={
+                'verbose_name': 'часть архива опроса',
+                'verbose_name_plural': 'части архивов опросов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pollarchivechunk',
+            constraint=models.UniqueConstraint(fields=('archive', 'number'), name='unique_archive_chunk'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# Полнотекстовый индекс текстовых ответов (см. api.search). SQLite: таблица FTS5 с внешним содержимым -
+# представлением с текстами ответов, где ё заменена на е; индекс обновляют триггеры на api_submission.
+# PostgreSQL: GIN-индекс по выражению to_tsvector('russian', ...), обновляется самой базой
+NORMALIZED = "replace(replace({}, 'ё', 'е'), 'Ё', 'Е')"
+
+INDEX_SQL = {
+    'sqlite': [
+        f"CREATE VIEW api_submission_search_content AS SELECT id, {NORMALIZED.format('text')} AS text "
+        "FROM api_submission WHERE text IS NOT NULL",
+        "CREATE VIRTUAL TABLE api_submission_search USING fts5(text, content='api_submission_search_content', "
+        "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER api_submission_search_insert AFTER INSERT ON api_submission WHEN new.text IS NOT NULL "
+        f"BEGIN INSERT INTO api_submission_search(rowid, text) VALUES (new.id, {NORMALIZED.format('new.text')}); END",
+        "CREATE TRIGGER api_submission_search_delete AFTER DELETE ON api_submission WHEN old.text IS NOT NULL "
+        "BEGIN INSERT INTO api_submission_search(api_submission_search, rowid, text) "
+        f"VALUES ('delete', old.id, {NORMALIZED.format('old.text')}); END",
+        "CREATE TRIGGER api_submission_search_update AFTER UPDATE OF text ON api_submission BEGIN "
+        "INSERT INTO api_submission_search(api_submission_search, rowid, text) "
+        f"SELECT 'delete', old.id, {NORMALIZED.format('old.text')} WHERE old.text IS NOT NULL; "
+        f"INSERT INTO api_submission_search(rowid, text) SELECT new.id, {NORMALIZED.format('new.text')} "
+        "WHERE new.text IS NOT NULL; END",
+        "INSERT INTO api_submission_search(api_submission_search) VALUES ('rebuild')",
+    ],
+    'postgresql': [
+        "CREATE INDEX api_submission_search ON api_submission "
+        "USING gin (to_tsvector('russian', translate(coalesce(text, ''), 'ёЁ', 'еЕ')))",
+    ],
+}
+
+DROP_INDEX_SQL = {
+    'sqlite': [
+        'DROP TRIGGER api_submission_search_update',
+        'DROP TRIGGER api_submission_search_delete',
+        'DROP TRIGGER api_submission_search_insert',
+        'DROP TABLE api_submission_search',
+        'DROP VIEW api_submission_search_content',
+    ],
+    'postgresql': [
+        'DROP INDEX api_submission_search',
+    ],
+}
+
+
+def create_index(apps, schema_editor):
+    for sql in INDEX_SQL.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    for sql in DROP_INDEX_SQL.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_poll_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
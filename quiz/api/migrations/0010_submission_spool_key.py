@@ -0,0 +1,41 @@
+import importlib
+
+from django.db import migrations, models
+
+# В SQLite добавление и удаление поля пересоздаёт таблицу api_submission: переименование новой таблицы
+# не проходит, пока на старую ссылается представление полнотекстового индекса (миграция 0009_answer_search),
+# а триггеры индекса удаляются вместе со старой таблицей. Представление и триггеры удаляются до изменения
+# таблицы и создаются после; сам индекс (таблица FTS5) не меняется: id ответов при пересоздании сохраняются
+answer_search = importlib.import_module('api.migrations.0009_answer_search')
+CREATE_SQL = [sql for sql in answer_search.INDEX_SQL['sqlite'] if sql.startswith(('CREATE VIEW', 'CREATE TRIGGER'))]
+DROP_SQL = [sql for sql in answer_search.DROP_INDEX_SQL['sqlite'] if sql.startswith(('DROP VIEW', 'DROP TRIGGER'))]
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in CREATE_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in DROP_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_answer_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_search_triggers, create_search_triggers),
+        migrations.AddField(
+            model_name='submission',
+            name='spool_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, unique=True,
+                                   verbose_name='ключ ответа в очереди'),
+        ),
+        migrations.RunPython(create_search_triggers, drop_search_triggers),
+    ]
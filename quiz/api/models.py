@@ -1,10 +1,21 @@
 from django.db import models
 
 
+# Записи, не помеченные удалёнными (DELETE_MODE = tombstone). Помеченные видны только через all_objects
+# до удаления командой purge_deleted
+class LiveManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Poll(models.Model):
     class Meta:
         verbose_name_plural = 'опросы'
         verbose_name = 'опрос'
+        indexes = [
+            models.Index(fields=['start_date', 'end_date'], name='poll_start_end_idx'),
+            models.Index(fields=['end_date', 'start_date'], name='poll_end_start_idx'),
+        ]
 
     def __str__(self):
         return str(self.title)
@@ -13,6 +24,10 @@ class Poll(models.Model):
     description = models.CharField(blank=True, null=True, max_length=140, verbose_name='описание')
     start_date = models.DateTimeField(verbose_name='дата/время старта')
     end_date = models.DateTimeField(blank=True, null=True, verbose_name='дата/время старта')
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False, verbose_name='дата/время удаления')
+
+    objects = LiveManager()
+    all_objects = models.Manager()
 
 
 class Question(models.Model):
@@ -32,6 +47,10 @@ class Question(models.Model):
     poll = models.ForeignKey(Poll, related_name='poll', unique=False, on_delete=models.CASCADE, verbose_name='опрос')
     title = models.CharField(max_length=140, verbose_name='вопрос')
     q_type = models.CharField(choices=QUESTION_TYPES, max_length=5, verbose_name='тип вопроса')
+    deleted_at = models.DateTimeField(blank=True, null=True, editable=False, verbose_name='дата/время удаления')
+
+    objects = LiveManager()
+    all_objects = models.Manager()
 
 
 class Option(models.Model):
@@ -57,7 +76,7 @@ class Respondent(models.Model):
         verbose_name = 'пользователь'
 
 
-class BaseAnswer(models.Model):
+class Submission(models.Model):
 
     def __str__(self):
         return 'Ответ ' + str(self.respondent) + ' на ' + str(self.question)
@@ -65,35 +84,125 @@ class BaseAnswer(models.Model):
     class Meta:
         verbose_name_plural = 'ответы'
         verbose_name = 'ответ'
+        constraints = [
+            models.UniqueConstraint(fields=['respondent', 'question'], name='unique_respondent_question'),
+        ]
 
-    question = models.ForeignKey(Question, related_name='question', unique=False, on_delete=models.CASCADE,
-                                 verbose_name='вопрос')
-    respondent = models.ForeignKey(Respondent, related_name='respondent', unique=False, on_delete=models.CASCADE,
+    question = models.ForeignKey(Question, related_name='submissions', on_delete=models.CASCADE, verbose_name='вопрос')
+    respondent = models.ForeignKey(Respondent, related_name='submissions', on_delete=models.CASCADE,
                                    verbose_name='пользователь')
+    text = models.TextField(blank=True, null=True, verbose_name='ответ текстом')
+    # Ключ записи очереди ответов (api.spool), из которой записан ответ: повторный разбор записи после сбоя
+    # находит уже записанный ответ и не считает его повтором
+    spool_key = models.CharField(max_length=255, blank=True, null=True, unique=True, editable=False,
+                                 verbose_name='ключ ответа в очереди')
 
 
-class TextAnswer(BaseAnswer):
+class Selection(models.Model):
 
     def __str__(self):
-        return str(self.response)
+        return str(self.option)
 
     class Meta:
-        verbose_name_plural = 'тексты'
-        verbose_name = 'текст'
+        verbose_name_plural = 'выбранные опции'
+        verbose_name = 'выбранная опция'
 
-    response = models.TextField(verbose_name='ответ текстом')
-    pm_link = models.OneToOneField(BaseAnswer, on_delete=models.CASCADE, parent_link=True, related_name='answer_text')
+    submission = models.ForeignKey(Submission, related_name='selections', on_delete=models.CASCADE,
+                                   verbose_name='ответ')
+    option = models.ForeignKey(Option, related_name='selections', on_delete=models.CASCADE,
+                               verbose_name='ответ из вариантов')
 
 
-class OptionAnswer(BaseAnswer):
+class PollCounter(models.Model):
 
     def __str__(self):
-        return str(self.response)
+        return str(self.poll)
 
     class Meta:
-        verbose_name_plural = 'выбранные опции'
-        verbose_name = 'выбранная опция'
+        verbose_name_plural = 'счётчики опросов'
+        verbose_name = 'счётчик опроса'
+
+    poll = models.OneToOneField(Poll, related_name='counter', primary_key=True, on_delete=models.CASCADE,
+                                verbose_name='опрос')
+    respondents = models.PositiveIntegerField(default=0, verbose_name='респондентов')
+
+
+class QuestionCounter(models.Model):
+
+    def __str__(self):
+        return str(self.question)
+
+    class Meta:
+        verbose_name_plural = 'счётчики вопросов'
+        verbose_name = 'счётчик вопроса'
+
+    question = models.OneToOneField(Question, related_name='counter', primary_key=True, on_delete=models.CASCADE,
+                                    verbose_name='вопрос')
+    respondents = models.PositiveIntegerField(default=0, verbose_name='респондентов')
+
+
+class OptionCounter(models.Model):
+
+    def __str__(self):
+        return str(self.option)
+
+    class Meta:
+        verbose_name_plural = 'счётчики вариантов ответа'
+        verbose_name = 'счётчик варианта ответа'
+
+    option = models.OneToOneField(Option, related_name='counter', primary_key=True, on_delete=models.CASCADE,
+                                  verbose_name='вариант ответа')
+    count = models.PositiveIntegerField(default=0, verbose_name='выбран раз')
+
+
+class AnswerSheet(models.Model):
+
+    def __str__(self):
+        return 'Ответы ' + str(self.respondent_id) + ' на опрос ' + str(self.poll_id)
+
+    class Meta:
+        verbose_name_plural = 'листы ответов'
+        verbose_name = 'лист ответов'
+        constraints = [
+            models.UniqueConstraint(fields=['respondent', 'poll'], name='unique_answer_sheet'),
+        ]
+
+    respondent = models.ForeignKey(Respondent, related_name='answer_sheets', on_delete=models.CASCADE,
+                                   verbose_name='пользователь')
+    poll = models.ForeignKey(Poll, related_name='answer_sheets', on_delete=models.CASCADE, verbose_name='опрос')
+    questions = models.TextField(default='[]', verbose_name='вопросы с ответами (JSON)')
+    stale = models.BooleanField(default=False, verbose_name='требует пересборки')
+
 
-    response = models.ForeignKey(Option, related_name='response', unique=False, verbose_name='ответ из вариантов',
-                                 on_delete=models.CASCADE)
-    pm_link = models.OneToOneField(BaseAnswer, on_delete=models.CASCADE, parent_link=True, related_name='answer_option')
+class PollArchive(models.Model):
+
+    def __str__(self):
+        return str(self.poll)
+
+    class Meta:
+        verbose_name_plural = 'архивы опросов'
+        verbose_name = 'архив опроса'
+
+    poll = models.OneToOneField(Poll, related_name='archive', primary_key=True, on_delete=models.CASCADE,
+                                verbose_name='опрос')
+    answers = models.PositiveIntegerField(default=0, verbose_name='ответов')
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name='дата/время переноса в архив')
+
+
+class PollArchiveChunk(models.Model):
+
+    def __str__(self):
+        return str(self.archive) + ' / ' + str(self.number)
+
+    class Meta:
+        verbose_name_plural = 'части архивов опросов'
+        verbose_name = 'часть архива опроса'
+        constraints = [
+            models.UniqueConstraint(fields=['archive', 'number'], name='unique_archive_chunk'),
+        ]
+
+    archive = models.ForeignKey(PollArchive, related_name='chunks', on_delete=models.CASCADE,
+                                verbose_name='архив опроса')
+    number = models.PositiveIntegerField(verbose_name='номер части')
+    answers = models.PositiveIntegerField(verbose_name='ответов')
+    content = models.BinaryField(verbose_name='ответы (сжатый JSON по столбцам)')
@@ -0,0 +1,29 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+# Постраничный вывод по курсору (keyset): следующая страница выбирается условием по полю сортировки,
+# а не смещением, поэтому время ответа не растёт с размером таблицы. Сортировка задаётся атрибутом
+# ordering вьюхи. Курсор хранит значение только первого поля сортировки: строки с тем же значением
+# пропускаются смещением, поэтому первое поле должно быть уникальным или почти уникальным (pk, start_date).
+# Последнее поле - pk: он делает порядок строк с одинаковым первым полем постоянным между запросами
+class KeysetPagination(CursorPagination):
+    page_size_query_param = 'page_size'
+    ordering = ('pk',)
+
+    @property
+    def max_page_size(self):
+        return getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'ordering', self.ordering)
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+
+# Постраничный вывод результатов поиска (api.search.AnswerSearch): результаты упорядочены по релевантности,
+# а не по полю таблицы, поэтому страница выбирается смещением (limit/offset)
+class SearchPagination(LimitOffsetPagination):
+
+    @property
+    def max_limit(self):
+        return getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
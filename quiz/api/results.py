@@ -0,0 +1,114 @@
+from collections import Counter, defaultdict
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, router
+from django.db.models import F, Count
+
+from .models import Respondent, Submission, Selection, PollCounter, QuestionCounter, OptionCounter, PollArchive
+
+
+# Увеличение счётчиков: amounts - {ключ: прирост}. Недостающие строки создаются с нулём
+# (ignore_conflicts на случай параллельной вставки) и увеличиваются тем же UPDATE
+def _increment(model, field, amounts):
+    by_amount = defaultdict(list)
+    for key, amount in amounts.items():
+        if amount:
+            by_amount[amount].append(key)
+
+    key_field = model._meta.pk.attname
+    for amount, keys in by_amount.items():
+        updated = model.objects.filter(pk__in=keys).update(**{field: F(field) + amount})
+        if updated < len(keys):
+            missing = set(keys) - set(model.objects.filter(pk__in=keys).values_list('pk', flat=True))
+            model.objects.bulk_create([model(**{key_field: key}) for key in missing], ignore_conflicts=True)
+            model.objects.filter(pk__in=missing).update(**{field: F(field) + amount})
+
+
+# Учёт новых ответов в счётчиках. Вызывается в транзакции записи ответов, entries - тройки
+# (опрос, только что созданный Submission, выбранные варианты). Респондент учитывается в опросе,
+# если до этих ответов он не отвечал ни на один его вопрос. Строки респондентов блокируются (по порядку pk,
+# чтобы не было взаимных блокировок) до проверки прежних ответов: при READ COMMITTED параллельная первая
+# запись того же респондента в опрос ждёт фиксации этой транзакции и видит её ответы, поэтому респондент
+# не учитывается дважды. В SQLite запись и так идёт по одной транзакции, блокировка не нужна
+def record_submissions(entries):
+    if not entries:
+        return
+    participants = {(poll_id, submission.respondent_id) for poll_id, submission, _ in entries}
+    if connections[router.db_for_write(Respondent)].features.has_select_for_update:
+        list(Respondent.objects.select_for_update().filter(pk__in={respondent_id for _, respondent_id in participants})
+             .order_by('pk').values_list('pk', flat=True))
+    answered_before = set(
+        Submission.objects.filter(respondent__in={respondent_id for _, respondent_id in participants},
+                                  question__poll__in={poll_id for poll_id, _ in participants},
+                                  question__deleted_at__isnull=True)
+        .exclude(pk__in=[submission.pk for _, submission, _ in entries])
+        .values_list('question__poll', 'respondent').distinct()
+    )
+    _increment(PollCounter, 'respondents', Counter(poll_id for poll_id, _ in participants - answered_before))
+    _increment(QuestionCounter, 'respondents', Counter(submission.question_id for _, submission, _ in entries))
+    _increment(OptionCounter, 'count', Counter(option_id for _, _, option_ids in entries for option_id in option_ids))
+
+
+# Значение счётчика опроса, вопроса или варианта ответа (строки счётчика может ещё не быть)
+def get_counter(instance, field):
+    try:
+        return getattr(instance.counter, field)
+    except ObjectDoesNotExist:
+        return 0
+
+
+# Пересчёт счётчиков вопроса и его опроса после удаления вариантов ответа или вопросов. Счётчики опроса,
+# ответы которого перенесены в архив, посчитать по таблицам ответов нельзя, они остаются прежними
+def refresh_question(question_id):
+    if PollArchive.objects.filter(poll__poll=question_id).exists():
+        return
+    QuestionCounter.objects.update_or_create(
+        question_id=question_id,
+        defaults={'respondents': Submission.objects.filter(question=question_id).count()},
+    )
+
+
+def refresh_poll(poll_id):
+    if PollArchive.objects.filter(poll=poll_id).exists():
+        return
+    PollCounter.objects.update_or_create(
+        poll_id=poll_id,
+        defaults={'respondents': Submission.objects.filter(question__poll=poll_id, question__deleted_at__isnull=True)
+                  .values('respondent').distinct().count()},
+    )
+
+
+# Значения счётчиков, посчитанные заново по таблицам ответов (кроме опросов в архиве): {модель: {ключ: значение}}
+def count_results(poll_ids=None):
+    submissions = Submission.objects.filter(question__deleted_at__isnull=True, question__poll__archive__isnull=True)
+    selections = Selection.objects.filter(submission__question__deleted_at__isnull=True,
+                                          submission__question__poll__archive__isnull=True)
+    if poll_ids is not None:
+        submissions = submissions.filter(question__poll__in=poll_ids)
+        selections = selections.filter(option__question__poll__in=poll_ids)
+
+    return {
+        PollCounter: dict(submissions.order_by().values_list('question__poll')
+                          .annotate(total=Count('respondent', distinct=True))),
+        QuestionCounter: dict(submissions.order_by().values_list('question').annotate(total=Count('pk'))),
+        OptionCounter: dict(selections.order_by().values_list('option').annotate(total=Count('pk'))),
+    }
+
+
+def stored_results(poll_ids=None):
+    # Счётчики опросов в архиве не сверяются: их ответов нет в таблицах
+    polls = PollCounter.objects.filter(poll__deleted_at__isnull=True, poll__archive__isnull=True)
+    questions = QuestionCounter.objects.filter(question__deleted_at__isnull=True,
+                                               question__poll__archive__isnull=True)
+    options = OptionCounter.objects.filter(option__question__deleted_at__isnull=True,
+                                           option__question__poll__archive__isnull=True)
+    if poll_ids is not None:
+        polls = polls.filter(poll__in=poll_ids)
+        questions = questions.filter(question__poll__in=poll_ids)
+        options = options.filter(option__question__poll__in=poll_ids)
+
+    return {
+        PollCounter: {key: value for key, value in polls.values_list('pk', 'respondents') if value},
+        QuestionCounter: {key: value for key, value in questions.values_list('pk', 'respondents') if value},
+        OptionCounter: {key: value for key, value in options.values_list('pk', 'count') if value},
+    }
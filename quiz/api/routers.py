@@ -0,0 +1,34 @@
+from contextvars import ContextVar
+
+from .cache import REPLICA, replica_configured, is_stuck_to_primary
+
+_read_from_replica = ContextVar('read_from_replica', default=False)
+
+
+# Чтение с реплики только внутри представлений с ReplicaReadMixin; запись и остальные чтения - основная база
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if _read_from_replica.get() and replica_configured():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+# Представление, читающее с реплики. replica_scope - область данных (см. api.cache.stick_to_primary),
+# может ссылаться на аргументы маршрута: 'respondent:{pk}'
+class ReplicaReadMixin:
+    replica_scope = 'polls'
+
+    def dispatch(self, request, *args, **kwargs):
+        use_replica = replica_configured() and not is_stuck_to_primary(self.replica_scope.format(**kwargs))
+        token = _read_from_replica.set(use_replica)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            _read_from_replica.reset(token)
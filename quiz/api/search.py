@@ -0,0 +1,155 @@
+import re
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+
+# Полнотекстовый поиск по текстовым ответам (Submission.text). Индекс создаёт миграция 0009_answer_search:
+# в SQLite - таблица FTS5, которую обновляют триггеры на вставку, удаление и изменение ответов, в PostgreSQL -
+# GIN-индекс по to_tsvector('russian', ...). Ответы на удалённые вопросы не находятся; ответы опросов в архиве
+# (api.archive) удалены из таблицы ответов и тоже не находятся
+SEARCH_TABLE = 'api_submission_search'
+TSVECTOR = "to_tsvector('russian', translate(coalesce(s.text, ''), 'ёЁ', 'еЕ'))"
+
+WORD = re.compile(r'\w+')
+CYRILLIC = re.compile(r'[а-я]+')
+
+# В FTS5 нет стеммера для русского языка: у слов запроса отбрасываются окончание и возвратная частица,
+# а основа ищется как префикс ("доставкой" -> доставк*). Окончания проверяются от длинных к коротким
+ENDINGS = tuple(sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ешь', 'ишь', 'ете', 'ите',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ую', 'юю',
+    'ов', 'ев', 'ть', 'ет', 'ит', 'ут', 'ют', 'ат', 'ят', 'ия', 'ью',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True))
+REFLEXIVE = ('ся', 'сь')
+MIN_STEM = 3
+
+
+def normalize(text):
+    return text.lower().replace('ё', 'е')
+
+
+def words(query):
+    return WORD.findall(normalize(query))
+
+
+def stem(word):
+    for suffix in REFLEXIVE:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            word = word[:-len(suffix)]
+            break
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+# Запрос FTS5: все слова обязательны, русские слова - префиксы основ. Слова берутся в кавычки,
+# поэтому синтаксис FTS5 (OR, NEAR, *) во введённой строке не действует
+def match_expression(query):
+    return ' '.join(f'"{stem(word)}"*' if CYRILLIC.fullmatch(word) else f'"{word}"' for word in words(query))
+
+
+# Результаты поиска по убыванию релевантности (при равной - по id ответа). Поддерживает count() и срезы,
+# как QuerySet, чтобы постраничный вывод (api.pagination.SearchPagination) запрашивал только нужную страницу.
+# Оценку релевантности FTS5 считает для каждого совпадения в индексе, поэтому если слова есть больше чем
+# в SEARCH_RANK_LIMIT ответах (почти в каждом ответе), ответы выводятся без оценки, новые первыми
+class AnswerSearch:
+
+    def __init__(self, q, poll=None, question=None, using='default'):
+        self.query = q
+        self.poll = poll
+        self.question = question
+        self.connection = connections[using]
+        self._count = self._matches = None
+
+    # Таблицы, условие поиска и условие фильтров по опросу и вопросу
+    def _sql(self):
+        if self.connection.vendor == 'postgresql':
+            tables = 'api_submission s'
+            conditions = [f"{TSVECTOR} @@ plainto_tsquery('russian', %s)"]
+            params = [normalize(self.query)]
+        else:
+            tables = f'{SEARCH_TABLE} JOIN api_submission s ON s.id = {SEARCH_TABLE}.rowid'
+            conditions = [f'{SEARCH_TABLE} MATCH %s']
+            params = [match_expression(self.query)]
+        tables += ' JOIN api_question q ON q.id = s.question_id'
+        conditions.append('q.deleted_at IS NULL')
+
+        filters, filter_params = ['1 = 1'], []
+        if self.poll is not None:
+            filters.append('q.poll_id = %s')
+            filter_params.append(self.poll)
+        if self.question is not None:
+            filters.append('s.question_id = %s')
+            filter_params.append(self.question)
+        return f'FROM {tables} WHERE {" AND ".join(conditions)}', params, ' AND '.join(filters), filter_params
+
+    # Число найденных ответов с фильтрами и без них - одним запросом: в SQLite каждое условие MATCH
+    # по частому префиксу заново собирает список всех совпадений
+    def _counts(self):
+        if self._count is None:
+            self._count = self._matches = 0
+            if words(self.query):
+                sql, params, filters, filter_params = self._sql()
+                with self.connection.cursor() as cursor:
+                    cursor.execute(f'SELECT COUNT(CASE WHEN {filters} THEN 1 END), COUNT(*) {sql}',
+                                   filter_params + params)
+                    self._count, self._matches = cursor.fetchone()
+        return self._count, self._matches
+
+    def count(self):
+        return self._counts()[0]
+
+    # Оценка, её параметры и сортировка. Без оценки SQLite сортирует по rowid таблицы FTS5: найденные
+    # ответы читаются из индекса уже по убыванию id и чтение останавливается на конце страницы
+    def _order(self):
+        postgresql = self.connection.vendor == 'postgresql'
+        if self._counts()[1] > settings.SEARCH_RANK_LIMIT:
+            return 'NULL', [], 's.id DESC' if postgresql else f'{SEARCH_TABLE}.rowid DESC'
+        if postgresql:
+            score = f"ts_rank({TSVECTOR}, plainto_tsquery('russian', %s))"
+            return score, [normalize(self.query)], 'score DESC, s.id'
+        # bm25() в FTS5 тем меньше, чем релевантнее ответ
+        return f'-{SEARCH_TABLE}.rank', [], 'score DESC, s.id'
+
+    def __getitem__(self, page):
+        if not self.count():
+            return []
+        sql, params, filters, filter_params = self._sql()
+        score, score_params, order = self._order()
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT s.id, s.respondent_id, q.poll_id, s.question_id, q.title, s.text, {score} AS score '
+                f'{sql} AND {filters} ORDER BY {order} LIMIT %s OFFSET %s',
+                score_params + params + filter_params + [page.stop - page.start, page.start],
+            )
+            return [
+                {'id': pk, 'respondent': respondent_id, 'poll': poll_id, 'question': question_id,
+                 'question_title': title, 'text': text, 'score': None if score is None else round(score, 6)}
+                for pk, respondent_id, poll_id, question_id, title, text, score in cursor.fetchall()
+            ]
+
+
+# Перестроение индекса по таблице ответов (в PostgreSQL - REINDEX)
+def rebuild_index(using='default'):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'REINDEX INDEX {SEARCH_TABLE}')
+        else:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+# Проверка, что индекс FTS5 совпадает с таблицей ответов. Возвращает текст ошибки или None.
+# Индекс PostgreSQL строится по выражению над самой таблицей и разойтись с ней не может
+def check_index(using='default'):
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('integrity-check', 1)")
+    except DatabaseError as error:
+        return str(error)
+    return None
@@ -1,7 +1,16 @@
 from collections import OrderedDict
+
+from django.db import transaction, IntegrityError
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
-from .models import Poll, Question, BaseAnswer, Option, OptionAnswer, TextAnswer, Respondent
+from .answers import AnswerRow, bulk_create_answers, bulk_create_with_pks, delete_empty_submissions
+from .archive import is_archived
+from .cache import invalidate_poll, invalidate_question, get_question_meta, invalidate_active_polls
+from .models import Poll, Question, Submission, Selection, Option, Respondent
+from .results import refresh_question, refresh_poll, get_counter
+from .search import words
+from .sheets import loads, collect_sheets, mark_stale
 
 EMPTY_VALUES = ('', None, [], ())
 
@@ -10,7 +19,7 @@ EMPTY_VALUES = ('', None, [], ())
 class PollSerializer(serializers.ModelSerializer):
     class Meta:
         model = Poll
-        fields = '__all__'
+        exclude = ['deleted_at']
 
 
 # Регистрация нового респондента
@@ -20,17 +29,73 @@ class CreateRespondentSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-# Ответ на вопрос (публикация ответа) (блок сериалайзеров)
-class OptionAnswerSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = OptionAnswer
-        fields = ['response']
+# Ответ на вопрос (публикация ответа) (блок сериалайзеров). Вариант ответа - только идентификатор:
+# принадлежность вопросу проверяется по индексу вопросов (validate_response), без запроса на каждый вариант
+class OptionAnswerSerializer(serializers.Serializer):
+    response = serializers.IntegerField()
 
 
-class TextAnswerSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = TextAnswer
-        fields = ['response']
+class TextAnswerSerializer(serializers.Serializer):
+    response = serializers.CharField()
+
+
+# Проверка ответа на вопрос по его типу и вариантам ответа. response_options - идентификаторы выбранных
+# вариантов, None - если поле не передано
+def validate_response(question, q_type, option_ids, response_options, response_text):
+    if q_type == 'radio':
+        if response_options is None:
+            raise serializers.ValidationError(
+                f"Необходимо передать выбранные вариант ответа в поле 'response_options' "
+            )
+        if len(response_options) > 1:
+            raise serializers.ValidationError(
+                f"Для вопроса {question} необходимо выбрать только один вариант"
+            )
+        elif len(response_options) < 1:
+            raise serializers.ValidationError(
+                f"Необходимо передать выбранный вариант ответа"
+            )
+
+    if q_type == 'check':
+        if response_options is None:
+            raise serializers.ValidationError(
+                f"Необходимо передать выбранные вариант ответа в поле 'response_options' "
+            )
+        if len(response_options) < 1:
+            raise serializers.ValidationError(
+                f"Необходимо передать выбранные вариант ответа"
+            )
+
+    if q_type in ('radio', 'check'):
+        for option in response_options:
+            if option not in option_ids:
+                raise serializers.ValidationError(
+                    f"Некорректный вариант ответа '{option}' на вопрос '{question}'. "
+                    f"Данный вариант ответа относится к другому вопросу."
+                )
+
+    if q_type == 'text':
+        if response_text is None:
+            raise serializers.ValidationError(
+                f"Необходимо передать ответ в поле 'response_text' "
+            )
+
+
+# Ответы на опрос, перенесённый в архив (api.archive), не принимаются
+def validate_not_archived(poll_id, archived):
+    if archived:
+        raise serializers.ValidationError(
+            f"Опрос '{poll_id}' завершён, его ответы перенесены в архив"
+        )
+
+
+# Строка для записи ответа из проверенных данных (question - Question или QuestionMeta)
+def answer_row(poll_id, respondent_id, question_id, q_type, response_options, response_text):
+    if q_type == 'text':
+        return AnswerRow(poll_id, respondent_id, question_id, [], response_text['response'])
+    option_ids = [option['response'] for option in response_options]
+    # Для 'radio' сохраняется последний переданный вариант, как и раньше
+    return AnswerRow(poll_id, respondent_id, question_id, option_ids[-1:] if q_type == 'radio' else option_ids, None)
 
 
 class CreateAnswerSerializer(serializers.ModelSerializer):
@@ -38,100 +103,141 @@ class CreateAnswerSerializer(serializers.ModelSerializer):
     response_text = TextAnswerSerializer(required=False)
 
     class Meta:
-        model = BaseAnswer
+        model = Submission
         fields = ['question', 'respondent', 'response_options', 'response_text']
 
+    # Повторный ответ отсекается уникальным ограничением на Submission при записи (см. create)
     def validate(self, attrs):
+        # Варианты ответа берутся из индекса в памяти процесса, без запросов к базе
+        meta = get_question_meta(attrs['question'].pk)
+        validate_not_archived(meta.poll_id, meta.archived)
+        response_options = attrs.get('response_options', None)
+        validate_response(
+            attrs['question'],
+            meta.q_type,
+            meta.option_ids,
+            [option['response'] for option in response_options] if response_options is not None else None,
+            attrs.get('response_text', None),
+        )
+        return attrs
 
-        if BaseAnswer.objects.filter(respondent=attrs['respondent'], question=attrs['question']).exists():
-            raise serializers.ValidationError(
-                f"Респондент '{attrs['respondent']}' уже дал ответ на вопрос '{attrs['question']}'"
-            )
-
-        if attrs['question'].q_type == 'radio':
-            response_options = attrs.get('response_options', None)
-            if response_options is None:
-                raise serializers.ValidationError(
-                    f"Необходимо передать выбранные вариант ответа в поле 'response_options' "
-                )
-            if len(response_options) > 1:
-                raise serializers.ValidationError(
-                    f"Для вопроса {attrs['question']} необходимо выбрать только один вариант"
-                )
-            elif len(response_options) < 1:
-                raise serializers.ValidationError(
-                    f"Необходимо передать выбранный вариант ответа"
-                )
+    def create(self, validated_data):
+        question = validated_data['question']
+        row = answer_row(question.poll_id, validated_data['respondent'].pk, question.pk, question.q_type,
+                         validated_data.get('response_options'), validated_data.get('response_text'))
+        try:
+            with transaction.atomic():
+                submission, = bulk_create_answers([row])
+        except IntegrityError:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                f"Респондент '{validated_data['respondent']}' уже дал ответ на вопрос '{question}'"
+            ]})
+        return submission
+
+
+# Ответ сразу на все вопросы опроса (блок сериалайзеров)
+class PollAnswerItemSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    response_options = OptionAnswerSerializer(many=True, required=False)
+    response_text = TextAnswerSerializer(required=False)
 
-            options_for_this_question = Option.objects.filter(question=attrs['question'])
-            if not (response_options[0]['response'] in options_for_this_question):
-                raise serializers.ValidationError(
-                    f"Некорректный вариант ответа '{response_options[0]['response']}' на вопрос '{attrs['question']}'. "
-                    f"Данный вариант ответа относится к другому вопросу."
-                )
 
-        if attrs['question'].q_type == 'check':
-            response_options = attrs.get('response_options', None)
-            if response_options is None:
-                raise serializers.ValidationError(
-                    f"Необходимо передать выбранные вариант ответа в поле 'response_options' "
-                )
+class CreatePollAnswersSerializer(serializers.Serializer):
+    respondent = serializers.PrimaryKeyRelatedField(queryset=Respondent.objects.all())
+    answers = PollAnswerItemSerializer(many=True, allow_empty=False)
 
-            if len(response_options) < 1:
+    def validate(self, attrs):
+        poll_id = self.context['poll_id']
+        validate_not_archived(poll_id, is_archived(poll_id))
+
+        # Вопросы и варианты ответа опроса загружаются один раз на весь пакет
+        questions = {question.pk: question for question in Question.objects.filter(poll=poll_id)}
+        options = {question_id: set() for question_id in questions}
+        for question_id, option_id in Option.objects.filter(question__in=list(questions)).values_list('question', 'id'):
+            options[question_id].add(option_id)
+
+        seen = set()
+        for item in attrs['answers']:
+            question = questions.get(item['question'])
+            if question is None:
                 raise serializers.ValidationError(
-                    f"Необходимо передать выбранные вариант ответа"
+                    f"Вопрос '{item['question']}' не относится к опросу '{poll_id}'"
                 )
-            options_for_this_question = Option.objects.filter(question=attrs['question'])
-            for option in response_options:
-                if not (option['response'] in options_for_this_question):
-                    raise serializers.ValidationError(
-                        f"Некорректный вариант ответа '{option['response']}' на вопрос '{attrs['question']}'. "
-                        f"Данный вариант ответа относится к другому вопросу."
-                    )
-
-        if attrs['question'].q_type == 'text':
-            response_text = attrs.get('response_text', None)
-            if response_text is None:
+            if question.pk in seen:
                 raise serializers.ValidationError(
-                    f"Необходимо передать ответ в поле 'response_text' "
+                    f"Ответ на вопрос '{question}' передан несколько раз"
                 )
+            seen.add(question.pk)
+
+            response_options = item.get('response_options', None)
+            validate_response(
+                question,
+                question.q_type,
+                options[question.pk],
+                [option['response'] for option in response_options] if response_options is not None else None,
+                item.get('response_text', None),
+            )
+            item['question'] = question
 
         return attrs
 
     def create(self, validated_data):
+        respondent = validated_data['respondent']
+        rows = [
+            answer_row(self.context['poll_id'], respondent.pk, item['question'].pk, item['question'].q_type,
+                       item.get('response_options'), item.get('response_text'))
+            for item in validated_data['answers']
+        ]
+
+        try:
+            with transaction.atomic():
+                bulk_create_answers(rows)
+        except IntegrityError:
+            # Уникальное ограничение на Submission: ищем вопрос с уже сохранённым ответом только для сообщения
+            answered = Submission.objects.filter(
+                respondent=respondent,
+                question__in=[item['question'] for item in validated_data['answers']]
+            ).select_related('question').first()
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+                f"Респондент '{respondent}' уже дал ответ на вопрос '{answered.question if answered else ''}'"
+            ]})
+
+        return {
+            'poll': self.context['poll_id'],
+            'respondent': respondent.pk,
+            'questions': [item['question'].pk for item in validated_data['answers']],
+        }
 
-        if validated_data['question'].q_type == 'radio':
-            response_options = validated_data.pop('response_options')
-            response = response_options.pop()
-            answer = OptionAnswer.objects.create(
-                question=validated_data['question'],
-                respondent=validated_data['respondent'],
-                response=response['response']
-            )
+    def to_representation(self, instance):
+        return instance
 
-        elif validated_data['question'].q_type == 'check':
-            response_options = validated_data.pop('response_options')
-            for response in response_options:
-                OptionAnswer.objects.create(
-                    question=validated_data['question'],
-                    respondent=validated_data['respondent'],
-                    response=response['response']
-                )
-            answer = BaseAnswer.objects.filter(
-                question=validated_data['question'],
-                respondent=validated_data['respondent']
-            ).first()
-
-        elif validated_data['question'].q_type == 'text':
-            response = validated_data.pop('response_text')
-
-            answer = TextAnswer.objects.create(
-                question=validated_data['question'],
-                respondent=validated_data['respondent'],
-                response=response['response']
-            )
 
-        return answer
+# Ответ на вопрос для постановки в очередь записи (ANSWER_INGEST_MODE = 'spool'): проверяется
+# по индексу вопросов без запросов к базе, существование респондента и повтор ответа проверяются при записи
+class SpoolAnswerSerializer(serializers.Serializer):
+    question = serializers.IntegerField()
+    respondent = serializers.IntegerField()
+    response_options = OptionAnswerSerializer(many=True, required=False)
+    response_text = TextAnswerSerializer(required=False)
+
+    def validate(self, attrs):
+        try:
+            meta = get_question_meta(attrs['question'])
+        except Question.DoesNotExist:
+            raise serializers.ValidationError({'question': [f"Вопрос '{attrs['question']}' не найден"]})
+        validate_not_archived(meta.poll_id, meta.archived)
+
+        response_options = attrs.get('response_options', None)
+        validate_response(
+            meta.title,
+            meta.q_type,
+            meta.option_ids,
+            [option['response'] for option in response_options] if response_options is not None else None,
+            attrs.get('response_text', None),
+        )
+        attrs['row'] = answer_row(meta.poll_id, attrs['respondent'], attrs['question'], meta.q_type,
+                                  response_options, attrs.get('response_text'))
+        return attrs
 
 
 # Обновление опроса
@@ -145,7 +251,7 @@ class UpdatePollSerializer(serializers.ModelSerializer):
 class AddPollSerializer(serializers.ModelSerializer):
     class Meta:
         model = Poll
-        fields = '__all__'
+        exclude = ['deleted_at']
 
 
 # Добавление нового вопроса (блок сериалайзеров)
@@ -168,6 +274,7 @@ class AddQuestionSerializer(serializers.ModelSerializer):
         if options_data is not None:
             for option in options_data:
                 Option.objects.create(question=question, **option)
+        invalidate_poll(question.poll_id)
         return question
 
     def to_representation(self, instance):
@@ -176,6 +283,66 @@ class AddQuestionSerializer(serializers.ModelSerializer):
                            if v not in EMPTY_VALUES)
 
 
+# Импорт опроса вместе с вопросами и вариантами ответа (блок сериалайзеров)
+class ImportOptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Option
+        fields = ['id', 'title']
+
+
+class ImportQuestionSerializer(serializers.ModelSerializer):
+    options = ImportOptionSerializer(many=True, required=False, source='imported_options')
+
+    class Meta:
+        model = Question
+        fields = ['id', 'title', 'q_type', 'options']
+
+    def validate(self, attrs):
+        options = attrs.get('imported_options', [])
+        if attrs['q_type'] == 'text' and options:
+            raise serializers.ValidationError(
+                f"Для вопроса '{attrs['title']}' с ответом текстом варианты ответа не передаются"
+            )
+        if attrs['q_type'] in ('radio', 'check') and not options:
+            raise serializers.ValidationError(
+                f"Для вопроса '{attrs['title']}' необходимо передать варианты ответа"
+            )
+        return attrs
+
+
+class ImportPollSerializer(serializers.ModelSerializer):
+    questions = ImportQuestionSerializer(many=True, source='imported_questions')
+
+    class Meta:
+        model = Poll
+        fields = ['id', 'title', 'description', 'start_date', 'end_date', 'questions']
+
+    # Опрос проверяется целиком до записи и вставляется одной транзакцией: по одному bulk_create
+    # на вопросы и на варианты ответа
+    def create(self, validated_data):
+        questions_data = validated_data.pop('imported_questions')
+        with transaction.atomic():
+            poll = Poll.objects.create(**validated_data)
+            questions = bulk_create_with_pks(
+                Question,
+                [Question(poll=poll, title=item['title'], q_type=item['q_type']) for item in questions_data],
+                Question.objects.filter(poll=poll),
+            )
+            for question, item in zip(questions, questions_data):
+                question.imported_options = [Option(question=question, **option)
+                                             for option in item.get('imported_options', [])]
+            bulk_create_with_pks(
+                Option,
+                [option for question in questions for option in question.imported_options],
+                Option.objects.filter(question__poll=poll),
+            )
+        poll.imported_questions = questions
+        # id опроса может совпасть с id удалённого опроса, чей пустой список вопросов остался в кеше
+        invalidate_poll(poll.pk)
+        invalidate_active_polls()
+        return poll
+
+
 # Обновление вопроса (блок сериалайзеров)
 class UpdateOptionSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)
@@ -192,31 +359,70 @@ class UpdateQuestionSerializer(serializers.ModelSerializer):
         model = Question
         fields = ['title', 'q_type', 'poll', 'options']
 
+    # Текущие варианты ответа загружаются один раз: по ним проверяются переданные id и строится разница
+    def validate_options(self, options_data):
+        self.current_options = {option.pk: option for option in Option.objects.filter(question=self.instance)}
+        seen = set()
+        for option in options_data:
+            opt_id = option.get('id')
+            if opt_id is None:
+                continue
+            if opt_id not in self.current_options:
+                raise serializers.ValidationError(
+                    f"Вариант ответа '{opt_id}' не относится к вопросу '{self.instance}'"
+                )
+            if opt_id in seen:
+                raise serializers.ValidationError(f"Вариант ответа '{opt_id}' передан несколько раз")
+            seen.add(opt_id)
+        return options_data
+
     def update(self, instance, validated_data):
         options_data = validated_data.pop('options', None)
+        previous_poll_id = instance.poll_id
+        previous_title = instance.title
+        options_changed = False
 
         instance.title = validated_data.get('title')
         instance.q_type = validated_data.get('q_type')
         instance.poll = validated_data.get('poll')
 
-        if options_data is not None:
-            options_queryset = Option.objects.filter(question=instance)
-            option_key = [key.get('id') for key in options_data]
-
-            for option in options_queryset:
-                if not (option.pk in option_key):
-                    option.delete()
-
-            for option in options_data:
-                opt_id = option.pop('id', None)
-                if opt_id is not None:
-                    opt_item = options_queryset.get(pk=opt_id)
-                    opt_item.title = option['title']
-                    opt_item.save()
-                else:
-                    Option.objects.create(question=instance, **option)
-
-        instance.save()
+        with transaction.atomic():
+            if options_data is not None:
+                # Разница с текущими вариантами: одно удаление, одно обновление изменённых заголовков
+                # и одна вставка новых
+                kept = {option['id'] for option in options_data if option.get('id') is not None}
+                removed = [pk for pk in self.current_options if pk not in kept]
+                changed = []
+                for option in options_data:
+                    if option.get('id') is None:
+                        continue
+                    current = self.current_options[option['id']]
+                    if current.title != option['title']:
+                        current.title = option['title']
+                        changed.append(current)
+
+                if removed:
+                    Option.objects.filter(pk__in=removed).delete()
+                if changed:
+                    Option.objects.bulk_update(changed, ['title'])
+                Option.objects.bulk_create([Option(question=instance, title=option['title'])
+                                            for option in options_data if option.get('id') is None])
+                options_changed = bool(removed or changed)
+
+                if removed:
+                    delete_empty_submissions(instance.pk)
+                    refresh_question(instance.pk)
+                    refresh_poll(previous_poll_id)
+
+            instance.save()
+            if previous_poll_id != instance.poll_id:
+                refresh_poll(previous_poll_id)
+                refresh_poll(instance.poll_id)
+            # В листах ответов хранятся заголовки вопросов и вариантов
+            if options_changed or previous_title != instance.title or previous_poll_id != instance.poll_id:
+                mark_stale(previous_poll_id, instance.poll_id)
+        invalidate_poll(previous_poll_id, instance.poll_id)
+        invalidate_question(instance.pk)
         return instance
 
 
@@ -235,61 +441,236 @@ class AllQuestionSerializer(serializers.ModelSerializer):
 
 
 # Получение пройденных опросов с вопросами и ответами (блок сериалайзеров)
-class DetailOptionAnswerSerializer(serializers.ModelSerializer):
+class AnswerSerializer(serializers.BaseSerializer):
+
+    # Ответ отдаётся в прежнем формате: по элементу на каждый выбранный вариант либо один текстовый ответ
+    def to_representation(self, instance):
+        if instance.text is not None:
+            return [OrderedDict([('answer_text', OrderedDict([('response', instance.text)]))])]
+        return [OrderedDict([('answer_option', OrderedDict([('response', str(selection.option))]))])
+                for selection in instance.selections.all()]
+
 
-    response = serializers.StringRelatedField()
+class QuestionSerializer(serializers.ModelSerializer):
+
+    # Ответы респондента предзагружаются во вьюхе (ListRespondentPoll.get_queryset)
+    answer = serializers.SerializerMethodField('get_answer')
+
+    def get_answer(self, question):
+        return [item for submission in question.respondent_submissions
+                for item in AnswerSerializer(submission).data]
 
     class Meta:
-        model = OptionAnswer
-        fields = ['response']
+        model = Question
+        fields = ['id', 'title', 'answer']
 
 
-class AnswerSerializer(serializers.ModelSerializer):
+class RespondentPollSerializer(serializers.ModelSerializer):
 
-    answer_option = DetailOptionAnswerSerializer(read_only=True, required=False)
-    answer_text = TextAnswerSerializer(read_only=True, required=False)
+    # Вопросы, на которые ответил респондент, предзагружаются во вьюхе (ListRespondentPoll.get_queryset)
+    questions = QuestionSerializer(source='answered_questions', many=True, read_only=True)
+    poll = serializers.CharField(source='title')
 
     class Meta:
-        model = BaseAnswer
-        fields = ['answer_option', 'answer_text']
+        model = Poll
+        fields = ['poll', 'id', 'questions', ]
+
+
+# Быстрые сериализаторы для чтения (блок сериалайзеров): работают со строками .values() и собирают
+# обычные словари без интроспекции полей ModelSerializer. Вывод совпадает с PollSerializer,
+# AllQuestionSerializer и RespondentPollSerializer байт в байт (см. тесты)
+class RowListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        return self.child.represent_rows(list(data))
+
+
+class RowSerializer(serializers.BaseSerializer):
+    # Поля для queryset.values()
+    fields = ()
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        kwargs['child'] = cls(context=kwargs.get('context', {}))
+        return RowListSerializer(*args, **kwargs)
 
     def to_representation(self, instance):
-        fields = super().to_representation(instance)
-        return OrderedDict((k, v) for k, v in fields.items()
-                           if v not in EMPTY_VALUES)
+        return self.represent_rows([instance])[0]
 
+    # Представление сразу всех строк страницы: связанные данные загружаются одним запросом на страницу
+    def represent_rows(self, rows):
+        raise NotImplementedError
 
-class QuestionSerializer(serializers.ModelSerializer):
 
-    answer = serializers.SerializerMethodField('get_answer')
+_datetime_field = serializers.DateTimeField()
 
-    def get_answer(self, question):
-        answer = BaseAnswer.objects.filter(
-            respondent=self.context['respondent_id'],
-            question=question,
-        )
-        answer_serializer = AnswerSerializer(instance=answer, many=True)
-        return answer_serializer.data
+
+class PollRowSerializer(RowSerializer):
+    fields = ('id', 'title', 'description', 'start_date', 'end_date')
+
+    def represent_rows(self, rows):
+        datetime = _datetime_field.to_representation
+        return [{
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'start_date': datetime(row['start_date']),
+            'end_date': datetime(row['end_date']) if row['end_date'] is not None else None,
+        } for row in rows]
+
+
+class QuestionRowSerializer(RowSerializer):
+    fields = ('id', 'poll', 'title', 'q_type')
+
+    def represent_rows(self, rows):
+        options = {row['id']: [] for row in rows}
+        for question_id, option_id, title in Option.objects.filter(question__in=list(options)) \
+                .values_list('question', 'id', 'title'):
+            options[question_id].append({'id': option_id, 'title': title})
+
+        data = []
+        for row in rows:
+            item = {'id': row['id'], 'poll': row['poll'], 'title': row['title'], 'q_type': row['q_type'],
+                    'options': options[row['id']]}
+            data.append({key: value for key, value in item.items() if value not in EMPTY_VALUES})
+        return data
+
+
+# Респондент передаётся в контексте ('respondent_id')
+class RespondentPollRowSerializer(RowSerializer):
+    fields = ('id', 'title')
+
+    def represent_rows(self, rows):
+        questions = {row['id']: [] for row in rows}
+        submissions = {}
+        for poll_id, question_id, title, submission_id, text in Submission.objects \
+                .filter(respondent=self.context['respondent_id'], question__poll__in=list(questions),
+                        question__deleted_at__isnull=True) \
+                .order_by('question', 'pk').values_list('question__poll', 'question', 'question__title', 'pk', 'text'):
+            # На вопрос у респондента один ответ (unique_respondent_question)
+            answer = submissions[submission_id] = [{'answer_text': {'response': text}}] if text is not None else []
+            questions[poll_id].append({'id': question_id, 'title': title, 'answer': answer})
+
+        for submission_id, option_title in Selection.objects.filter(submission__in=list(submissions)) \
+                .order_by('pk').values_list('submission', 'option__title'):
+            submissions[submission_id].append({'answer_option': {'response': option_title}})
+
+        return [{'poll': row['title'], 'id': row['id'], 'questions': questions[row['id']]} for row in rows]
+
+
+# История респондента по листам ответов (api.sheets): строки AnswerSheet с заголовком опроса, листы
+# отдаются без обращения к таблицам ответов. Устаревшие листы страницы собираются по таблицам ответов
+# одним проходом, листы без ответов пропускаются. Респондент передаётся в контексте ('respondent_id')
+class AnswerSheetRowSerializer(RowSerializer):
+    fields = ('poll', 'poll__title', 'questions', 'stale')
+
+    def represent_rows(self, rows):
+        respondent_id = self.context['respondent_id']
+        stale = [row['poll'] for row in rows if row['stale']]
+        collected = collect_sheets(Submission.objects.filter(respondent=respondent_id, question__poll__in=stale)) \
+            if stale else {}
+
+        data = []
+        for row in rows:
+            questions = collected.get((respondent_id, row['poll'])) if row['stale'] else loads(row['questions'])
+            if questions:
+                data.append({'poll': row['poll__title'], 'id': row['poll'], 'questions': questions})
+        return data
+
+
+# Результаты опроса по счётчикам (блок сериалайзеров)
+class OptionResultSerializer(serializers.ModelSerializer):
+
+    count = serializers.SerializerMethodField('get_count')
+
+    def get_count(self, option):
+        return get_counter(option, 'count')
+
+    class Meta:
+        model = Option
+        fields = ['id', 'title', 'count']
+
+
+class QuestionResultSerializer(serializers.ModelSerializer):
+
+    respondents = serializers.SerializerMethodField('get_respondents')
+    options = OptionResultSerializer(many=True, read_only=True)
+
+    def get_respondents(self, question):
+        return get_counter(question, 'respondents')
 
     class Meta:
         model = Question
-        fields = ['id', 'title', 'answer']
+        fields = ['id', 'title', 'q_type', 'respondents', 'options']
 
+    def to_representation(self, instance):
+        fields = super().to_representation(instance)
+        for option in fields['options']:
+            option['percent'] = round(option['count'] * 100 / fields['respondents'], 2) if fields['respondents'] else 0
+        return fields
 
-class RespondentPollSerializer(serializers.ModelSerializer):
 
-    questions = serializers.SerializerMethodField('get_questions')
-    poll = serializers.CharField(source='title')
+class PollResultsSerializer(serializers.ModelSerializer):
 
-    def get_questions(self, poll):
-        questions = Question.objects.filter(question__respondent=self.context['respondent_id']).distinct()
-        questions_serializer = QuestionSerializer(
-            instance=questions,
-            many=True,
-            context={'respondent_id': self.context['respondent_id']}
-        )
-        return questions_serializer.data
+    respondents = serializers.SerializerMethodField('get_respondents')
+    questions = QuestionResultSerializer(source='poll', many=True, read_only=True)
+
+    def get_respondents(self, poll):
+        return get_counter(poll, 'respondents')
 
     class Meta:
         model = Poll
-        fields = ['poll', 'id', 'questions', ]
+        fields = ['id', 'title', 'respondents', 'questions']
+
+
+# Таблица сопряжённости двух вопросов с вариантами (api.analytics): параметры запроса
+# row и column - вопросы опроса, where - варианты ответа, которые должен был выбрать респондент
+class CrosstabQuerySerializer(serializers.Serializer):
+    row = serializers.IntegerField()
+    column = serializers.IntegerField()
+    where = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, attrs):
+        matrix = self.context['matrix']
+        for field in ('row', 'column'):
+            if attrs[field] not in matrix.questions:
+                raise serializers.ValidationError({field: [
+                    f"Вопрос '{attrs[field]}' не относится к опросу или не имеет вариантов ответа"
+                ]})
+        unknown = [option_id for option_id in attrs['where'] if option_id not in matrix.options]
+        if unknown:
+            raise serializers.ValidationError({'where': [
+                f"Варианты ответа {unknown} не относятся к опросу"
+            ]})
+        return attrs
+
+    def to_representation(self, instance):
+        matrix = self.context['matrix']
+        mask = matrix.mask(all_of=instance['where'])
+
+        def question(question_id):
+            title, option_ids = matrix.questions[question_id]
+            counts = matrix.counts(question_id, mask)
+            return {'id': question_id, 'title': title, 'options': [
+                {'id': option_id, 'title': matrix.options[option_id], 'count': int(count)}
+                for option_id, count in zip(option_ids, counts)
+            ]}
+
+        return {
+            'respondents': matrix.count(mask),
+            'row': question(instance['row']),
+            'column': question(instance['column']),
+            'table': matrix.crosstab(instance['row'], instance['column'], mask).tolist(),
+        }
+
+
+# Параметры поиска по текстовым ответам: строка запроса и необязательные фильтры по опросу и вопросу
+class AnswerSearchQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    poll = serializers.IntegerField(required=False)
+    question = serializers.IntegerField(required=False)
+
+    def validate_q(self, value):
+        if not words(value):
+            raise serializers.ValidationError('В строке поиска нет ни одного слова')
+        return value
@@ -0,0 +1,138 @@
+import json
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Question, Option, Submission, Selection, AnswerSheet
+from .renderers import orjson
+
+
+# Лист ответов (AnswerSheet) - готовая история ответов респондента на один опрос: список вопросов
+# {'id', 'title', 'answer'} по возрастанию id в том же виде, что отдаёт RespondentPollRowSerializer.
+# Дописывается при каждой записи ответов; после правки или удаления вопросов листы опроса помечаются
+# устаревшими (stale) и собираются по таблицам ответов при чтении или командой rebuild_answer_sheets
+def dumps(questions):
+    if orjson is not None:
+        return orjson.dumps(questions).decode()
+    return json.dumps(questions, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(content):
+    return orjson.loads(content) if orjson is not None else json.loads(content)
+
+
+def _answer(text, option_titles):
+    answer = [{'answer_text': {'response': text}}] if text is not None else []
+    return answer + [{'answer_option': {'response': title}} for title in option_titles]
+
+
+# Дополнение листов новыми ответами (AnswerRow). Вызывается в транзакции записи ответов: недостающие листы
+# создаются пустыми (ignore_conflicts на случай параллельной вставки) и блокируются до конца транзакции
+def append_answers(rows):
+    pairs = {(row.respondent_id, row.poll_id) for row in rows}
+    respondent_ids = {respondent_id for respondent_id, _ in pairs}
+    poll_ids = {poll_id for _, poll_id in pairs}
+    AnswerSheet.objects.bulk_create([AnswerSheet(respondent_id=respondent_id, poll_id=poll_id)
+                                     for respondent_id, poll_id in pairs], ignore_conflicts=True)
+    sheets = {
+        (sheet.respondent_id, sheet.poll_id): sheet
+        for sheet in AnswerSheet.objects.select_for_update().filter(respondent__in=respondent_ids, poll__in=poll_ids)
+    }
+
+    titles = dict(Question.all_objects.filter(pk__in={row.question_id for row in rows}).values_list('pk', 'title'))
+    option_ids = {option_id for row in rows for option_id in row.option_ids}
+    option_titles = dict(Option.objects.filter(pk__in=option_ids).values_list('pk', 'title')) if option_ids else {}
+
+    additions = defaultdict(list)
+    for row in rows:
+        additions[(row.respondent_id, row.poll_id)].append({
+            'id': row.question_id,
+            'title': titles[row.question_id],
+            'answer': _answer(row.text, [option_titles[option_id] for option_id in row.option_ids]),
+        })
+
+    changed = []
+    for pair, questions in additions.items():
+        sheet = sheets[pair]
+        # Устаревший лист всё равно собирается заново по таблицам ответов
+        if sheet.stale:
+            continue
+        questions = loads(sheet.questions) + questions
+        questions.sort(key=lambda question: question['id'])
+        sheet.questions = dumps(questions)
+        changed.append(sheet)
+    AnswerSheet.objects.bulk_update(changed, ['questions'])
+
+
+# Листы опросов в архиве не пересобираются (ответов нет в таблицах) и сохраняют заголовки на момент архивации
+def mark_stale(*poll_ids):
+    AnswerSheet.objects.filter(poll__in=poll_ids, poll__archive__isnull=True, stale=False).update(stale=True)
+
+
+# Листы, собранные по таблицам ответов: {(респондент, опрос): вопросы}. submissions - ответы, по которым
+# собираются листы; ответы на вопросы, помеченные удалёнными, пропускаются
+def collect_sheets(submissions):
+    submissions = submissions.filter(question__deleted_at__isnull=True)
+    sheets = defaultdict(list)
+    answers = {}
+    for respondent_id, poll_id, question_id, title, submission_id, text in submissions \
+            .order_by('question', 'pk') \
+            .values_list('respondent', 'question__poll', 'question', 'question__title', 'pk', 'text').iterator():
+        answer = answers[submission_id] = _answer(text, [])
+        sheets[(respondent_id, poll_id)].append({'id': question_id, 'title': title, 'answer': answer})
+
+    for submission_id, option_title in Selection.objects.filter(submission__in=submissions.values('pk')) \
+            .order_by('pk').values_list('submission', 'option__title').iterator():
+        answers[submission_id].append({'answer_option': {'response': option_title}})
+    return dict(sheets)
+
+
+# Пересборка всех листов респондентов respondent_ids (или только опросов poll_ids), кроме листов опросов
+# в архиве. Возвращает число изменённых листов
+def rebuild_sheets(respondent_ids, poll_ids=None):
+    submissions = Submission.objects.filter(respondent__in=respondent_ids)
+    sheets = AnswerSheet.objects.filter(respondent__in=respondent_ids, poll__archive__isnull=True)
+    if poll_ids is not None:
+        submissions = submissions.filter(question__poll__in=poll_ids)
+        sheets = sheets.filter(poll__in=poll_ids)
+
+    with transaction.atomic():
+        stored = {(sheet.respondent_id, sheet.poll_id): sheet for sheet in sheets.select_for_update()}
+        expected = {pair: dumps(questions) for pair, questions in collect_sheets(submissions).items()}
+
+        removed = [sheet.pk for pair, sheet in stored.items() if pair not in expected]
+        changed = []
+        for pair, content in expected.items():
+            sheet = stored.get(pair)
+            if sheet is not None and (sheet.stale or sheet.questions != content):
+                sheet.questions, sheet.stale = content, False
+                changed.append(sheet)
+        created = [AnswerSheet(respondent_id=respondent_id, poll_id=poll_id, questions=content)
+                   for (respondent_id, poll_id), content in expected.items() if (respondent_id, poll_id) not in stored]
+
+        AnswerSheet.objects.filter(pk__in=removed).delete()
+        AnswerSheet.objects.bulk_update(changed, ['questions', 'stale'])
+        AnswerSheet.objects.bulk_create(created)
+    return len(removed) + len(changed) + len(created)
+
+
+# Сверка листов респондентов с таблицами ответов: пары (респондент, опрос), для которых лист отсутствует,
+# лишний или отличается. Листы, помеченные устаревшими, и листы удалённых опросов и опросов в архиве не сверяются
+def check_sheets(respondent_ids):
+    stored = {
+        (respondent_id, poll_id): (content, stale)
+        for respondent_id, poll_id, content, stale in AnswerSheet.objects
+        .filter(respondent__in=respondent_ids, poll__deleted_at__isnull=True, poll__archive__isnull=True)
+        .values_list('respondent', 'poll', 'questions', 'stale')
+    }
+    expected = collect_sheets(Submission.objects.filter(respondent__in=respondent_ids,
+                                                        question__poll__archive__isnull=True))
+
+    drift = []
+    for pair in sorted(stored.keys() | expected.keys()):
+        content, stale = stored.get(pair, (None, False))
+        if stale:
+            continue
+        if content is None or pair not in expected or loads(content) != expected[pair]:
+            drift.append(pair)
+    return drift
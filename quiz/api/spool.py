@@ -0,0 +1,179 @@
+import json
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+
+from .answers import AnswerRow, bulk_create_answers
+from .cache import stick_to_primary
+from .models import Option, Question, Respondent, Submission
+
+QUEUED = 'queued'
+COMMITTED = 'committed'
+REJECTED = 'rejected'
+
+
+# Локальная очередь ответов в отдельном файле SQLite в режиме WAL. Запись в неё не конкурирует
+# с основной базой, ответы переносятся в основную базу пакетами (drain)
+class AnswerSpool:
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(f"PRAGMA synchronous={getattr(settings, 'ANSWER_SPOOL_SYNCHRONOUS', 'FULL')}")
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS spool ('
+                'key TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL, error TEXT, '
+                'created REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS spool_status ON spool (status)')
+            self._local.connection = connection
+        return connection
+
+    # Постановка ответа в очередь. Возвращает (состояние, поставлен ли ответ сейчас): повторный ключ
+    # не создаёт новую запись, а возвращает состояние уже принятой
+    def enqueue(self, key, row):
+        now = time.time()
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO spool (key, payload, status, created, updated) VALUES (?, ?, ?, ?, ?)',
+            (key, json.dumps(row._asdict(), ensure_ascii=False), QUEUED, now, now),
+        )
+        if cursor.rowcount == 0:
+            return self.status(key), False
+        return {'key': key, 'status': QUEUED, 'error': None}, True
+
+    # Число ожидающих записи ответов, подсчёт ограничен limit
+    def pending(self, limit):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM (SELECT 1 FROM spool WHERE status = ? LIMIT ?)', (QUEUED, limit)
+        ).fetchone()[0]
+
+    def status(self, key):
+        row = self.connection.execute('SELECT status, error FROM spool WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return {'key': key, 'status': row[0], 'error': row[1]}
+
+    def fetch(self, limit):
+        return [
+            (key, AnswerRow(**json.loads(payload)))
+            for key, payload in self.connection.execute(
+                'SELECT key, payload FROM spool WHERE status = ? ORDER BY rowid LIMIT ?', (QUEUED, limit)
+            )
+        ]
+
+    # results - {ключ: (состояние, ошибка)}
+    def mark(self, results):
+        now = time.time()
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany(
+                'UPDATE spool SET status = ?, error = ?, updated = ? WHERE key = ?',
+                [(status, error, now, key) for key, (status, error) in results.items()],
+            )
+
+    # Удаление обработанных записей старше older_than секунд
+    def purge(self, older_than):
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            return self.connection.execute(
+                'DELETE FROM spool WHERE status != ? AND updated < ?', (QUEUED, time.time() - older_than)
+            ).rowcount
+
+
+_spools = {}
+
+
+def get_spool():
+    path = settings.ANSWER_SPOOL_PATH
+    if path not in _spools:
+        _spools[path] = AnswerSpool(path)
+    return _spools[path]
+
+
+def _duplicate(row):
+    return f"Респондент '{row.respondent_id}' уже дал ответ на вопрос '{row.question_id}'"
+
+
+def _invalid_options(row, options):
+    invalid = [option for option in row.option_ids if options.get(option) != row.question_id]
+    return f"Варианты ответа {invalid} не найдены или относятся к другому вопросу '{row.question_id}'"
+
+
+# Перенос пачки ответов из очереди в основную базу одной транзакцией. Ответы, которые нельзя записать
+# (повтор, удалённый вопрос или вариант, неизвестный респондент), помечаются отклонёнными. Ключ записи
+# сохраняется в ответе (Submission.spool_key): если обработчик упал после записи ответов, но до mark(),
+# при повторном разборе эти записи помечаются записанными, а не повторами. Возвращает число
+# обработанных записей очереди
+def drain_batch(spool, batch_size):
+    items = [(key, row._replace(spool_key=key)) for key, row in spool.fetch(batch_size)]
+    if not items:
+        return 0
+
+    results = {}
+    committed = set(Submission.objects.filter(spool_key__in=[key for key, _ in items])
+                    .values_list('spool_key', flat=True))
+    respondents = set(Respondent.objects.filter(pk__in={row.respondent_id for _, row in items})
+                      .values_list('pk', flat=True))
+    questions = set(Question.objects.filter(pk__in={row.question_id for _, row in items}, poll__archive__isnull=True)
+                    .values_list('pk', flat=True))
+    options = dict(Option.objects.filter(pk__in={option for _, row in items for option in row.option_ids})
+                   .values_list('pk', 'question'))
+    answered = set(Submission.objects.filter(respondent__in=respondents, question__in=questions)
+                   .values_list('respondent', 'question'))
+
+    accepted = []
+    for key, row in items:
+        pair = (row.respondent_id, row.question_id)
+        if key in committed:
+            results[key] = (COMMITTED, None)
+        elif row.respondent_id not in respondents:
+            results[key] = (REJECTED, f"Респондент '{row.respondent_id}' не найден")
+        elif row.question_id not in questions:
+            results[key] = (REJECTED, f"Вопрос '{row.question_id}' не найден")
+        elif any(options.get(option) != row.question_id for option in row.option_ids):
+            results[key] = (REJECTED, _invalid_options(row, options))
+        elif pair in answered:
+            results[key] = (REJECTED, _duplicate(row))
+        else:
+            answered.add(pair)
+            accepted.append((key, row))
+
+    try:
+        with transaction.atomic():
+            bulk_create_answers([row for _, row in accepted])
+        results.update((key, (COMMITTED, None)) for key, _ in accepted)
+    except IntegrityError:
+        # Ответ успел прийти другим путём (синхронная запись) или вариант удалён после проверки:
+        # пишем пачку поштучно
+        for key, row in accepted:
+            try:
+                with transaction.atomic():
+                    bulk_create_answers([row])
+                results[key] = (COMMITTED, None)
+            except IntegrityError:
+                results[key] = _failure(key, row)
+
+    spool.mark(results)
+    stick_to_primary(*{f'respondent:{row.respondent_id}' for key, row in items if results[key][0] == COMMITTED})
+    return len(items)
+
+
+# Причина, по которой не записался ответ из очереди: запись уже перенесена другим обработчиком,
+# повторный ответ или вариант, удалённый после проверки пачки
+def _failure(key, row):
+    if Submission.objects.filter(spool_key=key).exists():
+        return COMMITTED, None
+    if Submission.objects.filter(respondent=row.respondent_id, question=row.question_id).exists():
+        return REJECTED, _duplicate(row)
+    options = dict(Option.objects.filter(pk__in=row.option_ids).values_list('pk', 'question'))
+    return REJECTED, _invalid_options(row, options)
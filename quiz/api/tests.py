@@ -1,3 +1,1154 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO, BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User, update_last_login
+from django.core.management import call_command, CommandError
+from django.db import connection, connections
+from django.db.models import Prefetch
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .analytics import clear_matrices
+from .answers import AnswerRow, bulk_create_answers
+from .archive import archive_poll
+from .cache import get_cache
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .metrics import reset as reset_metrics
+from .models import Poll, Question, Option, Respondent, Submission, Selection, PollCounter, QuestionCounter, \
+    OptionCounter, AnswerSheet, PollArchive, PollArchiveChunk
+from .serializers import PollSerializer, AllQuestionSerializer, RespondentPollSerializer, PollRowSerializer, \
+    QuestionRowSerializer, RespondentPollRowSerializer, CreateAnswerSerializer
+from .spool import AnswerSpool, drain_batch, get_spool
+
+
+def create_poll(title, questions=3, options=3):
+    poll = Poll.objects.create(title=title, start_date=timezone.now())
+    for number in range(questions):
+        q_type = ('radio', 'check', 'text')[number % 3]
+        question = Question.objects.create(poll=poll, title=f'{title} / вопрос {number}', q_type=q_type)
+        if q_type != 'text':
+            for option_number in range(options):
+                Option.objects.create(question=question, title=f'вариант {option_number}')
+    return poll
+
+
+def answer_poll(respondent, poll):
+    rows = []
+    for question in poll.poll.all():
+        if question.q_type == 'text':
+            rows.append(AnswerRow(poll.pk, respondent.pk, question.pk, [], 'ответ'))
+        else:
+            options = [option.pk for option in question.options.all()]
+            rows.append(AnswerRow(poll.pk, respondent.pk, question.pk,
+                                  options if question.q_type == 'check' else options[:1], None))
+    bulk_create_answers(rows)
+
+
+def create_admin():
+    return User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+
+class ListRespondentPollTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def count_queries(self, respondent):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/passedpoll/{respondent.pk}/list/')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()['results']
+
+    def test_query_count_does_not_depend_on_answers(self):
+        small = Respondent.objects.create()
+        answer_poll(small, create_poll('малый', questions=1))
+        small_queries, _ = self.count_queries(small)
+
+        large = Respondent.objects.create()
+        for number in range(5):
+            answer_poll(large, create_poll(f'опрос {number}', questions=9))
+        large_queries, data = self.count_queries(large)
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(len(data), 5)
+
+    def test_questions_belong_to_their_poll(self):
+        respondent = Respondent.objects.create()
+        first, second = create_poll('первый'), create_poll('второй')
+        answer_poll(respondent, first)
+        answer_poll(respondent, second)
+
+        _, data = self.count_queries(respondent)
+
+        for poll in data:
+            titles = [question['title'] for question in poll['questions']]
+            self.assertEqual(len(titles), 3)
+            self.assertTrue(all(title.startswith(poll['poll']) for title in titles))
+        check = data[0]['questions'][1]['answer']
+        self.assertEqual(check, [{'answer_option': {'response': f'вариант {n}'}} for n in range(3)])
+        self.assertEqual(data[0]['questions'][2]['answer'], [{'answer_text': {'response': 'ответ'}}])
+
+
+class RowSerializerTest(TestCase):
+
+    def setUp(self):
+        self.respondent = Respondent.objects.create()
+        for number in range(3):
+            poll = create_poll(f'опрос {number}', questions=4)
+            answer_poll(self.respondent, poll)
+        Poll.objects.filter(title='опрос 1').update(description='описание',
+                                                     end_date=timezone.now() + timedelta(days=3))
+        Question.objects.create(poll=poll, title='', q_type='check')
+
+    def assertSameJSON(self, expected, actual):
+        self.assertEqual(JSONRenderer().render(expected.data), JSONRenderer().render(actual.data))
+
+    def test_poll(self):
+        with timezone.override('Europe/Moscow'):
+            self.assertSameJSON(
+                PollSerializer(Poll.objects.order_by('pk'), many=True),
+                PollRowSerializer(Poll.objects.order_by('pk').values(*PollRowSerializer.fields), many=True),
+            )
+
+    def test_all_question(self):
+        self.assertSameJSON(
+            AllQuestionSerializer(Question.objects.order_by('pk').prefetch_related('options'), many=True),
+            QuestionRowSerializer(Question.objects.order_by('pk').values(*QuestionRowSerializer.fields), many=True),
+        )
+
+    def test_respondent_poll(self):
+        respondent_id = self.respondent.pk
+        submissions = Submission.objects.filter(respondent=respondent_id) \
+            .prefetch_related(Prefetch('selections', queryset=Selection.objects.select_related('option').order_by('pk')))
+        questions = Question.objects.filter(submissions__respondent=respondent_id).order_by('pk') \
+            .prefetch_related(Prefetch('submissions', queryset=submissions, to_attr='respondent_submissions'))
+        polls = Poll.objects.filter(poll__submissions__respondent=respondent_id).distinct().order_by('pk')
+
+        self.assertSameJSON(
+            RespondentPollSerializer(
+                polls.prefetch_related(Prefetch('poll', queryset=questions, to_attr='answered_questions')), many=True
+            ),
+            RespondentPollRowSerializer(polls.values(*RespondentPollRowSerializer.fields), many=True,
+                                        context={'respondent_id': respondent_id}),
+        )
+
+
+class AnswerSheetTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.respondent = Respondent.objects.create()
+        self.polls = [create_poll(f'опрос {number}', questions=4) for number in range(3)]
+        # Ответы по одному вопросу, вразнобой по опросам, и сразу на весь опрос
+        for poll in reversed(self.polls[:2]):
+            for question in poll.poll.order_by('-pk'):
+                self.assertEqual(self.client.post('/api/sendanswer/', self.answer(question), format='json')
+                                 .status_code, 201)
+        self.assertEqual(self.client.post(f'/api/poll/{self.polls[2].pk}/sendanswers/', {
+            'respondent': self.respondent.pk,
+            'answers': [self.answer(question) for question in self.polls[2].poll.all()],
+        }, format='json').status_code, 201)
+
+    def answer(self, question):
+        if question.q_type == 'text':
+            return {'question': question.pk, 'respondent': self.respondent.pk,
+                    'response_text': {'response': f'ответ {question.pk}'}}
+        options = [{'response': option.pk} for option in question.options.order_by('-pk')]
+        return {'question': question.pk, 'respondent': self.respondent.pk,
+                'response_options': options if question.q_type == 'check' else options[:1]}
+
+    def history(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/passedpoll/{self.respondent.pk}/list/')
+        return len(queries), response.data['results']
+
+    def expected(self):
+        polls = Poll.objects.filter(poll__submissions__respondent=self.respondent.pk).distinct().order_by('pk')
+        return RespondentPollRowSerializer(polls.values(*RespondentPollRowSerializer.fields), many=True,
+                                           context={'respondent_id': self.respondent.pk}).data
+
+    def test_history_is_read_from_sheets(self):
+        queries, data = self.history()
+        self.assertEqual(queries, 1)
+        self.assertEqual(JSONRenderer().render(data), JSONRenderer().render(self.expected()))
+
+    def test_edited_question_is_collected_from_answers(self):
+        client = APIClient()
+        client.force_authenticate(create_admin())
+        question = self.polls[1].poll.get(q_type='check')
+        response = client.put(f'/api/question/{question.pk}/update/', {
+            'poll': question.poll_id, 'title': 'новый заголовок', 'q_type': 'check',
+            'options': [{'id': option.pk, 'title': f'новый {option.title}'} for option in question.options.all()],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AnswerSheet.objects.filter(stale=True).count(), 1)
+        self.assertEqual(JSONRenderer().render(self.history()[1]), JSONRenderer().render(self.expected()))
+
+        call_command('rebuild_answer_sheets', stale=True, stdout=StringIO())
+        self.assertFalse(AnswerSheet.objects.filter(stale=True).exists())
+        self.assertEqual(self.history()[0], 1)
+
+    def test_check_and_rebuild(self):
+        output = StringIO()
+        call_command('rebuild_answer_sheets', check=True, stdout=output)
+        self.assertIn('Расхождений: 0', output.getvalue())
+
+        AnswerSheet.objects.filter(poll=self.polls[0]).update(questions='[]')
+        AnswerSheet.objects.filter(poll=self.polls[1]).delete()
+        with self.assertRaisesMessage(CommandError, 'Расхождений: 2'):
+            call_command('rebuild_answer_sheets', check=True, stdout=output)
+
+        call_command('rebuild_answer_sheets', stdout=StringIO())
+        self.assertEqual(JSONRenderer().render(self.history()[1]), JSONRenderer().render(self.expected()))
+
+
+class FastJSONTest(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def sample(self):
+        return OrderedDict([
+            ('title', 'Опрос \u2028 «кириллица»'),
+            ('start_date', self.now),
+            ('percent', Decimal('33.33')),
+            ('lazy', gettext_lazy('вопрос')),
+            ('nested', [OrderedDict([('id', 1), ('options', [])]), None, True, 1.5]),
+            (1, 'ключ-число'),
+        ])
+
+    def test_renderer_matches_default_renderer(self):
+        expected = JSONRenderer().render(self.sample())
+        self.assertEqual(FastJSONRenderer().render(self.sample()), expected)
+        self.assertIn('кириллица'.encode(), expected)
+        with mock.patch('api.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.sample()), expected)
+
+    def test_parser(self):
+        content = '{"title": "Опрос", "options": [{"response": 1}]}'.encode()
+        self.assertEqual(FastJSONParser().parse(BytesIO(content)), {'title': 'Опрос', 'options': [{'response': 1}]})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(BytesIO(b'{"value": NaN}'))
+
+
+class ListAllQuestionsCacheTest(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.admin = create_admin()
+        self.poll = create_poll('опрос')
+        self.url = f'/api/question/{self.poll.pk}/list/'
+
+    def test_cached_definition_is_not_requeried(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(len(first.json()['results']), 3)
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_write_paths_invalidate(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_authenticate(self.admin)
+        response = self.client.post('/api/question/add/', {
+            'poll': self.poll.pk, 'title': 'новый', 'q_type': 'radio', 'options': [{'title': 'да'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 4)
+
+        question = self.poll.poll.first()
+        self.client.delete(f'/api/question/{question.pk}/delete/')
+        self.assertEqual(len(self.client.get(self.url).json()['results']), 3)
+
+
+class CreateAnswerTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.poll = create_poll('опрос')
+        self.respondent = Respondent.objects.create()
+
+    def test_repeated_answer_is_rejected_by_constraint(self):
+        question = self.poll.poll.get(q_type='check')
+        payload = {
+            'question': question.pk,
+            'respondent': self.respondent.pk,
+            'response_options': [{'response': option.pk} for option in question.options.all()],
+        }
+        self.assertEqual(self.client.post('/api/sendanswer/', payload, format='json').status_code, 201)
+        response = self.client.post('/api/sendanswer/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Submission.objects.filter(respondent=self.respondent).count(), 1)
+        self.assertEqual(Selection.objects.filter(submission__respondent=self.respondent).count(), 3)
+
+    def test_options_are_validated_without_queries(self):
+        question = create_poll('большой', questions=2, options=30).poll.get(q_type='check')
+        option_ids = list(question.options.values_list('pk', flat=True))
+        other = self.poll.poll.get(q_type='check').options.first().pk
+        counts = []
+        # Первая проверка загружает вопрос в индекс
+        for selected in ([option_ids[0]], [option_ids[0]], option_ids, [other, option_ids[0]]):
+            serializer = CreateAnswerSerializer(data={
+                'question': question.pk, 'respondent': self.respondent.pk,
+                'response_options': [{'response': option_id} for option_id in selected],
+            })
+            with CaptureQueriesContext(connection) as queries:
+                valid = serializer.is_valid()
+            counts.append(len(queries))
+        self.assertFalse(valid)
+        self.assertIn('другому вопросу', str(serializer.errors))
+        self.assertEqual(counts[1], counts[2])
+        self.assertEqual(counts[2], counts[3])
+
+
+class CreatePollAnswersTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.poll = create_poll('опрос')
+        self.respondent = Respondent.objects.create()
+
+    def answer(self, question):
+        if question.q_type == 'text':
+            return {'question': question.pk, 'response_text': {'response': f'ответ {question.pk}'}}
+        options = [{'response': option.pk} for option in question.options.all()]
+        return {'question': question.pk, 'response_options': options if question.q_type == 'check' else options[:1]}
+
+    def send(self, questions, poll=None):
+        return self.client.post(f'/api/poll/{(poll or self.poll).pk}/sendanswers/', {
+            'respondent': self.respondent.pk,
+            'answers': [self.answer(question) for question in questions],
+        }, format='json')
+
+    def test_answers_are_created(self):
+        questions = list(self.poll.poll.order_by('pk'))
+        response = self.send(questions)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'poll': self.poll.pk, 'respondent': self.respondent.pk,
+                                         'questions': [question.pk for question in questions]})
+        self.assertEqual(Submission.objects.filter(respondent=self.respondent).count(), 3)
+        self.assertEqual(Selection.objects.filter(submission__respondent=self.respondent).count(), 4)
+        self.assertEqual(PollCounter.objects.get(poll=self.poll).respondents, 1)
+        self.assertEqual(Submission.objects.get(question__q_type='text').text, f'ответ {questions[2].pk}')
+
+    def test_repeated_answer_rejects_whole_batch(self):
+        questions = list(self.poll.poll.order_by('pk'))
+        self.assertEqual(self.send(questions[:1]).status_code, 201)
+        response = self.send(questions)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('уже дал ответ', str(response.data))
+        self.assertEqual(Submission.objects.filter(respondent=self.respondent).count(), 1)
+        self.assertFalse(QuestionCounter.objects.filter(question=questions[1], respondents__gt=0).exists())
+
+    def test_question_from_other_poll_is_rejected(self):
+        other = create_poll('другой').poll.get(q_type='text')
+        response = self.send(list(self.poll.poll.all()) + [other])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('не относится к опросу', str(response.data))
+        self.assertFalse(Submission.objects.exists())
+
+    def test_archived_poll_is_rejected(self):
+        archive_poll(self.poll.pk)
+        response = self.send(list(Question.objects.filter(poll=self.poll)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('архив', str(response.data))
+        self.assertFalse(Submission.objects.exists())
+
+
+class SpoolAnswerTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.poll = create_poll('опрос')
+        self.respondent = Respondent.objects.create()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        spool_settings = override_settings(ANSWER_INGEST_MODE='spool',
+                                           ANSWER_SPOOL_PATH=os.path.join(directory.name, 'spool.sqlite3'))
+        spool_settings.enable()
+        self.addCleanup(spool_settings.disable)
+
+    def send(self, question, key):
+        return self.client.post('/api/sendanswer/', {
+            'question': question.pk,
+            'respondent': self.respondent.pk,
+            'response_options': [{'response': option.pk} for option in question.options.all()],
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_answers_are_queued_and_drained(self):
+        question = self.poll.poll.get(q_type='check')
+        response = self.send(question, 'first')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'queued')
+        # Повтор с тем же ключом не ставит ответ в очередь второй раз
+        self.assertEqual(self.send(question, 'first').status_code, 200)
+        self.assertEqual(self.send(question, 'second').status_code, 202)
+        self.assertFalse(Submission.objects.exists())
+
+        call_command('drain_answers', once=True, stdout=StringIO())
+
+        self.assertEqual(self.client.get(response['Location']).data['status'], 'committed')
+        self.assertEqual(self.client.get('/api/sendanswer/second/status/').data['status'], 'rejected')
+        self.assertEqual(self.client.get('/api/sendanswer/unknown/status/').status_code, 404)
+        self.assertEqual(Submission.objects.filter(respondent=self.respondent).count(), 1)
+        self.assertEqual(question.counter.respondents, 1)
+
+    def test_invalid_answer_is_not_queued(self):
+        question = self.poll.poll.get(q_type='radio')
+        self.assertEqual(self.send(question, 'radio').status_code, 400)
+        self.assertEqual(self.client.get('/api/sendanswer/radio/status/').status_code, 404)
+
+    def test_answer_to_deleted_poll_is_not_queued(self):
+        self.client.force_authenticate(create_admin())
+        for mode in ('tombstone', 'immediate'):
+            with override_settings(DELETE_MODE=mode):
+                poll = create_poll(f'удаляемый {mode}')
+                question = poll.poll.get(q_type='check')
+                self.assertEqual(self.send(question, f'{mode} before').status_code, 202)
+                self.assertEqual(self.client.delete(f'/api/poll/{poll.pk}/delete/').status_code, 204)
+                response = self.send(question, f'{mode} after')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('question', response.data)
+
+    def test_replay_after_crash_marks_answer_committed(self):
+        question = self.poll.poll.get(q_type='check')
+        response = self.send(question, 'first')
+        # Обработчик упал после записи ответов, но до отметки в очереди
+        with mock.patch.object(AnswerSpool, 'mark', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                drain_batch(get_spool(), 10)
+        self.assertEqual(self.client.get(response['Location']).data['status'], 'queued')
+
+        self.assertEqual(drain_batch(get_spool(), 10), 1)
+        self.assertEqual(self.client.get(response['Location']).data, {'key': 'first', 'status': 'committed',
+                                                                      'error': None})
+        self.assertEqual(Submission.objects.get(respondent=self.respondent).spool_key, 'first')
+
+    def test_deleted_option_is_rejected_with_own_error(self):
+        question = self.poll.poll.get(q_type='check')
+        self.send(question, 'first')
+        option_id = question.options.first().pk
+        Option.objects.filter(pk=option_id).delete()
+
+        drain_batch(get_spool(), 10)
+        state = get_spool().status('first')
+        self.assertEqual(state['status'], 'rejected')
+        self.assertIn(f'Варианты ответа [{option_id}]', state['error'])
+        self.assertFalse(Submission.objects.exists())
+
+    def test_too_long_key_is_rejected(self):
+        question = self.poll.poll.get(q_type='check')
+        self.assertEqual(self.send(question, 'k' * 256).status_code, 400)
+        self.assertEqual(self.send(question, 'k' * 255).status_code, 202)
+
+    @override_settings(ANSWER_SPOOL_MAX_PENDING=1)
+    def test_full_spool_returns_503(self):
+        self.assertEqual(self.send(self.poll.poll.get(q_type='check'), 'first').status_code, 202)
+        response = self.send(self.poll.poll.get(q_type='radio'), 'second')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+
+class ImportPollTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_admin())
+
+    def payload(self, questions):
+        return {
+            'title': 'импорт',
+            'start_date': timezone.now().isoformat(),
+            'questions': [
+                {'title': f'вопрос {number}', 'q_type': 'check',
+                 'options': [{'title': f'вариант {option}'} for option in range(4)]}
+                for number in range(questions)
+            ] + [{'title': 'текст', 'q_type': 'text'}],
+        }
+
+    def test_import_returns_assigned_ids(self):
+        response = self.client.post('/api/poll/import/', self.payload(3), format='json')
+        self.assertEqual(response.status_code, 201)
+        poll = Poll.objects.get(pk=response.data['id'])
+        questions = list(poll.poll.order_by('pk'))
+        self.assertEqual([question['id'] for question in response.data['questions']],
+                         [question.pk for question in questions])
+        self.assertEqual([option['id'] for option in response.data['questions'][0]['options']],
+                         list(questions[0].options.order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual(response.data['questions'][-1]['options'], [])
+
+    def test_query_count_does_not_depend_on_size(self):
+        counts = []
+        for questions in (2, 40):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(
+                    self.client.post('/api/poll/import/', self.payload(questions), format='json').status_code, 201
+                )
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_cached_question_list_is_invalidated(self):
+        get_cache().clear()
+        url = f'/api/question/{Poll.all_objects.count() + 1}/list/'
+        self.assertEqual(self.client.get(url).json()['results'], [])
+        response = self.client.post('/api/poll/import/', self.payload(1), format='json')
+        self.assertEqual(url, f'/api/question/{response.data["id"]}/list/')
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+
+    def test_invalid_question_rejects_whole_poll(self):
+        payload = self.payload(2)
+        payload['questions'].append({'title': 'без вариантов', 'q_type': 'radio'})
+        self.assertEqual(self.client.post('/api/poll/import/', payload, format='json').status_code, 400)
+        self.assertFalse(Poll.objects.exists())
+
+
+class UpdateQuestionTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_admin())
+
+    def update(self, question, options):
+        return self.client.put(f'/api/question/{question.pk}/update/', {
+            'title': question.title, 'q_type': question.q_type, 'poll': question.poll_id, 'options': options,
+        }, format='json')
+
+    def edit_options(self, count):
+        question = create_poll('опрос', questions=1, options=count).poll.get()
+        options = list(question.options.order_by('pk'))
+        payload = [{'id': option.pk, 'title': option.title} for option in options[1:]]
+        payload[0]['title'] = 'новый заголовок'
+        payload.append({'title': 'новый вариант'})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.update(question, payload).status_code, 200)
+        self.assertEqual(
+            list(question.options.order_by('pk').values_list('title', flat=True)),
+            ['новый заголовок'] + [option.title for option in options[2:]] + ['новый вариант'],
+        )
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_option_count(self):
+        self.assertEqual(self.edit_options(3), self.edit_options(60))
+
+    def test_unknown_option_id_is_validation_error(self):
+        question = create_poll('опрос', questions=1).poll.get()
+        other = create_poll('другой', questions=1).poll.get().options.first()
+        response = self.update(question, [{'id': other.pk, 'title': 'чужой'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('options', response.data)
+        self.assertEqual(question.options.count(), 3)
+
+
+class PollResultsTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_admin())
+        self.poll = create_poll('опрос')
+        self.check = self.poll.poll.get(q_type='check')
+        self.options = list(self.check.options.order_by('pk'))
+
+    def answer(self, options):
+        respondent = Respondent.objects.create()
+        response = self.client.post('/api/sendanswer/', {
+            'question': self.check.pk,
+            'respondent': respondent.pk,
+            'response_options': [{'response': option.pk} for option in options],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_counters_follow_answers_and_option_deletes(self):
+        self.answer(self.options[:2])
+        self.answer(self.options[:1])
+        self.answer(self.options[1:2])
+
+        data = self.client.get(f'/api/poll/{self.poll.pk}/results/').json()
+        self.assertEqual(data['respondents'], 3)
+        question = data['questions'][1]
+        self.assertEqual(question['respondents'], 3)
+        self.assertEqual([(o['count'], o['percent']) for o in question['options']], [(2, 66.67), (2, 66.67), (0, 0)])
+
+        response = self.client.put(f'/api/question/{self.check.pk}/update/', {
+            'title': self.check.title, 'q_type': 'check', 'poll': self.poll.pk,
+            'options': [{'id': self.options[1].pk, 'title': 'вариант 1'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        data = self.client.get(f'/api/poll/{self.poll.pk}/results/').json()
+        self.assertEqual(data['respondents'], 2)
+        self.assertEqual(data['questions'][1]['respondents'], 2)
+        self.assertEqual(data['questions'][1]['options'], [
+            {'id': self.options[1].pk, 'title': 'вариант 1', 'count': 2, 'percent': 100.0},
+        ])
+
+        out = StringIO()
+        call_command('rebuild_results', '--check', stdout=out)
+        self.assertIn('Расхождений: 0', out.getvalue())
+
+        PollCounter.objects.filter(poll=self.poll).update(respondents=5)
+        with self.assertRaisesMessage(CommandError, 'Расхождений: 1'):
+            call_command('rebuild_results', '--check', stdout=out)
+
+
+class ListActivePollTest(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        now = timezone.now()
+        Poll.objects.create(title='активный', start_date=now - timedelta(days=1), end_date=now + timedelta(days=1))
+        Poll.objects.create(title='бессрочный', start_date=now - timedelta(days=1))
+        Poll.objects.create(title='завершён', start_date=now - timedelta(days=5), end_date=now - timedelta(days=2))
+        Poll.objects.create(title='будущий', start_date=now + timedelta(days=3))
+
+    def titles(self):
+        return [poll['title'] for poll in self.client.get('/api/poll/active/list/').json()['results']]
+
+    def test_cached_until_next_boundary(self):
+        self.assertEqual(self.titles(), ['активный', 'бессрочный'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.titles(), ['активный', 'бессрочный'])
+
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=2)):
+            self.assertEqual(self.titles(), ['бессрочный'])
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(days=4)):
+            self.assertEqual(self.titles(), ['бессрочный', 'будущий'])
+
+    def test_admin_writes_invalidate(self):
+        self.titles()
+        self.client.force_authenticate(create_admin())
+        response = self.client.post('/api/poll/add/', {'title': 'новый', 'start_date': timezone.now()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('новый', self.titles())
+
+
+class PaginationTest(TestCase):
+
+    def test_cursor_walks_all_polls_in_order(self):
+        client = APIClient()
+        client.force_authenticate(create_admin())
+        start = timezone.now()
+        Poll.objects.bulk_create([
+            Poll(title=f'опрос {number}', start_date=start + timedelta(hours=number % 4)) for number in range(10)
+        ])
+
+        seen = []
+        url = '/api/poll/all/list/?page_size=3'
+        while url:
+            data = client.get(url).json()
+            self.assertLessEqual(len(data['results']), 3)
+            seen.extend(poll['id'] for poll in data['results'])
+            url = data['next']
+
+        expected = list(Poll.objects.order_by('start_date', 'pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        reset_metrics()
+        self.client = APIClient()
+
+    def test_requests_and_queries_are_recorded_per_view(self):
+        create_poll('опрос')
+        self.client.get('/api/poll/active/list/')
+        self.client.get('/api/poll/active/list/')
+
+        self.client.force_authenticate(create_admin())
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('quiz_http_requests_total{view="api.views.ListActivePoll"} 2', text)
+        self.assertIn('quiz_http_request_duration_seconds_bucket{view="api.views.ListActivePoll",le="+Inf"} 2', text)
+        self.assertIn('quiz_db_queries_total{view="api.views.ListActivePoll"}', text)
+
+    def test_metrics_are_admin_only(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+
+    def test_server_timing_header(self):
+        with self.settings(METRICS_SERVER_TIMING=True):
+            response = self.client.get('/api/poll/active/list/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.admin = create_admin()
+        self.token = Token.objects.create(user=self.admin)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeated_requests_skip_token_lookup(self):
+        self.assertEqual(self.client.get('/api/poll/all/list/').status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/poll/all/list/').status_code, 200)
+        self.assertFalse([query for query in queries.captured_queries if 'authtoken_token' in query['sql']])
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.client.get('/api/poll/all/list/').status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/poll/all/list/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/poll/all/list/').status_code, 200)
+        self.admin.is_active = False
+        self.admin.save()
+        self.assertEqual(self.client.get('/api/poll/all/list/').status_code, 401)
+
+    def test_saves_of_other_fields_skip_token_lookup(self):
+        self.assertEqual(self.client.get('/api/poll/all/list/').status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            update_last_login(None, self.admin)
+        self.assertFalse([query for query in queries.captured_queries if 'authtoken_token' in query['sql']])
+
+        self.admin.is_active = False
+        self.admin.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get('/api/poll/all/list/').status_code, 401)
+
+
+class DeletePollTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_admin())
+        self.respondent = Respondent.objects.create()
+        self.poll, self.kept = create_poll('удаляемый'), create_poll('оставшийся')
+        answer_poll(self.respondent, self.poll)
+        answer_poll(self.respondent, self.kept)
+        call_command('rebuild_results', stdout=StringIO())
+
+    def rows(self, poll):
+        return {
+            Question: Question.all_objects.filter(poll=poll).count(),
+            Option: Option.objects.filter(question__poll=poll).count(),
+            Submission: Submission.objects.filter(question__poll=poll).count(),
+            Selection: Selection.objects.filter(option__question__poll=poll).count(),
+            PollCounter: PollCounter.objects.filter(poll=poll).count(),
+            QuestionCounter: QuestionCounter.objects.filter(question__poll=poll).count(),
+            OptionCounter: OptionCounter.objects.filter(option__question__poll=poll).count(),
+        }
+
+    def test_delete_removes_dependent_rows(self):
+        kept = self.rows(self.kept)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.delete(f'/api/poll/{self.poll.pk}/delete/').status_code, 204)
+        self.assertFalse(Poll.all_objects.filter(pk=self.poll.pk).exists())
+        self.assertEqual(set(self.rows(self.poll).values()), {0})
+        self.assertEqual(self.rows(self.kept), kept)
+        # Строки ответов не загружаются: только DELETE по таблицам
+        self.assertFalse([query for query in queries if 'submission' in query['sql'] and
+                          query['sql'].startswith('SELECT')])
+
+    def test_delete_question_keeps_poll(self):
+        question = self.poll.poll.get(q_type='check')
+        self.assertEqual(self.client.delete(f'/api/question/{question.pk}/delete/').status_code, 204)
+        self.assertFalse(Question.all_objects.filter(pk=question.pk).exists())
+        self.assertFalse(Selection.objects.filter(option__question=question).exists())
+        self.assertEqual(self.poll.poll.count(), 2)
+
+    @override_settings(DELETE_MODE='tombstone')
+    def test_tombstone_hides_poll_until_purged(self):
+        rows = self.rows(self.poll)
+        self.assertEqual(self.client.delete(f'/api/poll/{self.poll.pk}/delete/').status_code, 204)
+        self.assertEqual(self.rows(self.poll), rows)
+
+        self.assertEqual([poll['id'] for poll in self.client.get('/api/poll/all/list/').data['results']],
+                         [self.kept.pk])
+        self.assertEqual([poll['id'] for poll in self.client.get(f'/api/passedpoll/{self.respondent.pk}/list/')
+                         .data['results']], [self.kept.pk])
+        question = Question.all_objects.filter(poll=self.poll, q_type='text').first()
+        response = self.client.post('/api/sendanswer/', {
+            'question': question.pk, 'respondent': Respondent.objects.create().pk,
+            'response_text': {'response': 'ответ'},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        kept = self.rows(self.kept)
+        call_command('purge_deleted', once=True, batch_size=2, stdout=StringIO())
+        self.assertFalse(Poll.all_objects.filter(pk=self.poll.pk).exists())
+        self.assertEqual(set(self.rows(self.poll).values()), {0})
+        self.assertEqual(self.rows(self.kept), kept)
+
+    @override_settings(DELETE_MODE='tombstone')
+    def test_tombstoned_question_leaves_results_consistent(self):
+        question = self.kept.poll.get(q_type='text')
+        self.assertEqual(self.client.delete(f'/api/question/{question.pk}/delete/').status_code, 204)
+        export = b''.join(self.client.get(f'/api/poll/{self.kept.pk}/export/jsonl/').streaming_content)
+        self.assertNotIn(question.pk, {json.loads(line)['question'] for line in export.splitlines()})
+        output = StringIO()
+        call_command('rebuild_results', check=True, stdout=output)
+        self.assertIn('Расхождений: 0', output.getvalue())
+
+
+class ArchiveTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_admin())
+        self.poll, self.active = create_poll('завершённый'), create_poll('активный')
+        Poll.objects.filter(pk=self.poll.pk).update(start_date=timezone.now() - timedelta(days=90),
+                                                    end_date=timezone.now() - timedelta(days=60))
+        self.respondents = [Respondent.objects.create() for _ in range(3)]
+        for respondent in self.respondents:
+            answer_poll(respondent, self.poll)
+            answer_poll(respondent, self.active)
+
+    def snapshot(self):
+        return (
+            b''.join(self.client.get(f'/api/poll/{self.poll.pk}/export/jsonl/').streaming_content),
+            self.client.get(f'/api/poll/{self.poll.pk}/results/').data,
+            [self.client.get(f'/api/passedpoll/{respondent.pk}/list/').data['results']
+             for respondent in self.respondents],
+        )
+
+    def test_closed_poll_is_read_from_archive(self):
+        before = self.snapshot()
+        call_command('archive_polls', once=True, stdout=StringIO())
+
+        self.assertFalse(Submission.objects.filter(question__poll=self.poll).exists())
+        self.assertEqual(Submission.objects.filter(question__poll=self.active).count(), 9)
+        self.assertEqual(PollArchive.objects.get().answers, 9)
+        self.assertEqual(self.snapshot(), before)
+        for command in ('rebuild_results', 'rebuild_answer_sheets'):
+            output = StringIO()
+            call_command(command, check=True, stdout=output)
+            self.assertIn('Расхождений: 0', output.getvalue())
+
+    def test_rebuild_results_keeps_archived_counters(self):
+        archive_poll(self.poll.pk)
+        results = self.client.get(f'/api/poll/{self.poll.pk}/results/').data
+        call_command('rebuild_results', stdout=StringIO())
+        self.assertEqual(self.client.get(f'/api/poll/{self.poll.pk}/results/').data, results)
+        self.assertEqual(PollCounter.objects.get(poll=self.poll).respondents, 3)
+
+    def test_edited_poll_stays_in_history(self):
+        question = self.poll.poll.get(q_type='text')
+        response = self.client.put(f'/api/question/{question.pk}/update/', {
+            'title': 'новый заголовок', 'q_type': 'text', 'poll': self.poll.pk, 'options': [],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(AnswerSheet.objects.filter(poll=self.poll, stale=True).exists())
+
+        archive_poll(self.poll.pk)
+        self.assertFalse(AnswerSheet.objects.filter(poll=self.poll, stale=True).exists())
+        history = self.client.get(f'/api/passedpoll/{self.respondents[0].pk}/list/').data['results']
+        sheet = next(sheet for sheet in history if sheet['id'] == self.poll.pk)
+        self.assertIn('новый заголовок', [answer['title'] for answer in sheet['questions']])
+
+    def test_answers_to_archived_poll_are_rejected(self):
+        archive_poll(self.poll.pk)
+        respondent = Respondent.objects.create()
+        question = self.poll.poll.get(q_type='text')
+        answer = {'question': question.pk, 'respondent': respondent.pk, 'response_text': {'response': 'ответ'}}
+        response = self.client.post('/api/sendanswer/', answer, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('архив', str(response.data))
+        response = self.client.post(f'/api/poll/{self.poll.pk}/sendanswers/', {
+            'respondent': respondent.pk, 'answers': [answer],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_restore(self):
+        before = self.snapshot()
+        archive_poll(self.poll.pk, chunk_size=2)
+        self.assertEqual(PollArchiveChunk.objects.count(), 5)
+        call_command('archive_polls', restore=[self.poll.pk], stdout=StringIO())
+        self.assertFalse(PollArchive.objects.exists())
+        self.assertEqual(Submission.objects.filter(question__poll=self.poll).count(), 9)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_delete_archived_poll(self):
+        archive_poll(self.poll.pk)
+        self.assertEqual(self.client.delete(f'/api/poll/{self.poll.pk}/delete/').status_code, 204)
+        self.assertFalse(PollArchive.objects.exists())
+        self.assertFalse(PollArchiveChunk.objects.exists())
+
+
+class ExportTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_admin())
+        self.poll = create_poll('опрос')
+        self.respondents = [Respondent.objects.create() for _ in range(2)]
+        for respondent in self.respondents:
+            answer_poll(respondent, self.poll)
+        Submission.objects.filter(question__q_type='text', respondent=self.respondents[1]).update(text='да, "нет"')
+
+    def view(self, fmt):
+        response = self.client.get(f'/api/poll/{self.poll.pk}/export/{fmt}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="poll-{self.poll.pk}.{fmt}"')
+        return b''.join(response.streaming_content).decode()
+
+    def command(self, fmt):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, f'export.{fmt}')
+        call_command('export_answers', self.poll.pk, format=fmt, output=path, chunk_size=2)
+        with open(path, encoding='utf-8', newline='') as output:
+            return output.read()
+
+    def expected(self):
+        return [
+            {'respondent': submission.respondent_id, 'question': submission.question_id,
+             'question_title': submission.question.title, 'q_type': submission.question.q_type,
+             'option_ids': [selection.option_id for selection in submission.selections.order_by('pk')],
+             'options': [selection.option.title for selection in submission.selections.order_by('pk')],
+             'text': submission.text}
+            for submission in Submission.objects.filter(question__poll=self.poll)
+            .order_by('respondent', 'question').select_related('question')
+        ]
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.view('csv'))))
+        self.assertEqual(rows[0], ['respondent', 'question', 'question_title', 'q_type', 'option_ids', 'options',
+                                   'text'])
+        self.assertEqual(rows[1:], [
+            [str(answer['respondent']), str(answer['question']), answer['question_title'], answer['q_type'],
+             ';'.join(map(str, answer['option_ids'])), ';'.join(answer['options']), answer['text'] or '']
+            for answer in self.expected()
+        ])
+        self.assertEqual(self.command('csv'), self.view('csv'))
+
+    def test_jsonl(self):
+        self.assertEqual([json.loads(line) for line in self.view('jsonl').splitlines()], self.expected())
+        self.assertEqual(self.command('jsonl'), self.view('jsonl'))
+
+    def test_archived_and_live_answers(self):
+        expected = self.expected()
+        archive_poll(self.poll.pk)
+        # Ответ, записанный после переноса опроса в архив, выводится после архивных
+        respondent = Respondent.objects.create()
+        answer_poll(respondent, self.poll)
+        expected += self.expected()
+        self.assertEqual(len(expected), 9)
+        self.assertEqual([json.loads(line) for line in self.view('jsonl').splitlines()], expected)
+        self.assertEqual(self.command('jsonl'), self.view('jsonl'))
+        self.assertEqual(len(self.command('csv').splitlines()), 10)
+
+    def test_unknown_poll(self):
+        self.assertEqual(self.client.get('/api/poll/0/export/csv/').status_code, 404)
+        with self.assertRaises(CommandError):
+            call_command('export_answers', 0)
+
+
+class AnalyticsTest(TestCase):
+
+    def setUp(self):
+        # Матрицы хранятся в памяти процесса, а первичные ключи тестовой базы повторяются
+        clear_matrices()
+        self.client = APIClient()
+        self.client.force_authenticate(create_admin())
+        self.poll = create_poll('аналитика', options=4)
+        self.radio, self.check, self.text = self.poll.poll.order_by('pk')
+        self.respondents = [Respondent.objects.create() for _ in range(12)]
+        for number, respondent in enumerate(self.respondents):
+            self.answer(respondent, number)
+
+    def answer(self, respondent, number):
+        radio = list(self.radio.options.order_by('pk').values_list('pk', flat=True))
+        check = list(self.check.options.order_by('pk').values_list('pk', flat=True))
+        bulk_create_answers([
+            AnswerRow(self.poll.pk, respondent.pk, self.radio.pk, [radio[number % 4]], None),
+            AnswerRow(self.poll.pk, respondent.pk, self.check.pk, check[:number % 3 + 1], None),
+        ])
+
+    def crosstab(self, row, column, where=(), poll=None):
+        return self.client.get(f'/api/poll/{(poll or self.poll).pk}/crosstab/',
+                               {'row': row.pk, 'column': column.pk, 'where': list(where)})
+
+    def expected(self, row, column, where=()):
+        chosen = {}
+        for respondent_id, option_id in Selection.objects.values_list('submission__respondent', 'option'):
+            chosen.setdefault(respondent_id, set()).add(option_id)
+        chosen = [options for options in chosen.values() if set(where) <= options]
+        return [[sum(1 for options in chosen if row_option in options and column_option in options)
+                 for column_option in column.options.order_by('pk').values_list('pk', flat=True)]
+                for row_option in row.options.order_by('pk').values_list('pk', flat=True)]
+
+    def test_crosstab_matches_answers(self):
+        response = self.crosstab(self.radio, self.check)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['respondents'], 12)
+        self.assertEqual(response.data['table'], self.expected(self.radio, self.check))
+        self.assertEqual([option['count'] for option in response.data['row']['options']], [3, 3, 3, 3])
+
+        where = [self.check.options.order_by('pk')[1].pk]
+        response = self.crosstab(self.radio, self.check, where)
+        self.assertEqual(response.data['respondents'], 8)
+        self.assertEqual(response.data['table'], self.expected(self.radio, self.check, where))
+
+    def test_matrix_follows_new_answers_and_edits(self):
+        self.crosstab(self.radio, self.check)
+        self.answer(Respondent.objects.create(), 0)
+        response = self.crosstab(self.radio, self.check)
+        self.assertEqual(response.data['respondents'], 13)
+        self.assertEqual(response.data['table'], self.expected(self.radio, self.check))
+
+        self.assertEqual(self.client.put(f'/api/question/{self.radio.pk}/update/', {
+            'title': 'новый заголовок', 'q_type': 'radio', 'poll': self.poll.pk,
+            'options': [{'id': option.pk, 'title': option.title} for option in self.radio.options.order_by('pk')[1:]],
+        }, format='json').status_code, 200)
+        response = self.crosstab(self.radio, self.check)
+        self.assertEqual(response.data['row']['title'], 'новый заголовок')
+        self.assertEqual(len(response.data['table']), 3)
+        self.assertEqual(response.data['table'], self.expected(self.radio, self.check))
+
+    def test_archived_poll(self):
+        expected = self.crosstab(self.radio, self.check).data
+        clear_matrices()
+        archive_poll(self.poll.pk, chunk_size=5)
+        self.assertEqual(self.crosstab(self.radio, self.check).data, expected)
+
+    def test_invalid_query(self):
+        other = create_poll('другой').poll.first()
+        self.assertEqual(self.crosstab(self.radio, self.text).status_code, 400)
+        self.assertEqual(self.crosstab(self.radio, other).status_code, 400)
+        self.assertEqual(self.crosstab(self.radio, self.check, [other.options.first().pk]).status_code, 400)
+        self.assertEqual(self.client.get(f'/api/poll/{self.poll.pk + 100}/crosstab/',
+                                         {'row': self.radio.pk, 'column': self.check.pk}).status_code, 404)
+
+        self.client.force_authenticate(None)
+        self.assertIn(self.crosstab(self.radio, self.check).status_code, (401, 403))
+
+
+class SearchAnswersTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(create_admin())
+        self.poll, self.other = create_poll('доставка'), create_poll('магазин')
+        self.question = self.poll.poll.get(q_type='text')
+        self.answers = {}
+        for poll, text in ((self.poll, 'Доставка быстрая, доставка вовремя'), (self.poll, 'Ёлку привезли доставкой'),
+                           (self.poll, 'Курьер опоздал'), (self.other, 'Доставки не было')):
+            respondent = Respondent.objects.create()
+            bulk_create_answers([AnswerRow(poll.pk, respondent.pk, poll.poll.get(q_type='text').pk, [], text)])
+            self.answers[text] = Submission.objects.get(respondent=respondent).pk
+
+    def search(self, **params):
+        response = self.client.get('/api/answer/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def found(self, **params):
+        return [row['text'] for row in self.search(**params)['results']]
+
+    def test_ranked_search_with_word_forms(self):
+        # При равной релевантности - по id ответа
+        self.assertEqual(self.found(q='доставки'), ['Доставка быстрая, доставка вовремя', 'Ёлку привезли доставкой',
+                                                    'Доставки не было'])
+        self.assertEqual(self.found(q='елка доставка'), ['Ёлку привезли доставкой'])
+        self.assertEqual(self.found(q='доставка', poll=self.other.pk), ['Доставки не было'])
+        self.assertEqual(self.found(q='доставка', question=self.question.pk), ['Доставка быстрая, доставка вовремя',
+                                                                               'Ёлку привезли доставкой'])
+        self.assertEqual(self.found(q='OR курьер'), [])
+
+        page = self.search(q='доставка', limit=1, offset=1)
+        self.assertEqual(page['count'], 3)
+        self.assertEqual(page['results'][0]['id'], self.answers['Ёлку привезли доставкой'])
+        self.assertEqual(page['results'][0]['question'], self.question.pk)
+        self.assertIn('offset=2', page['next'])
+
+    @override_settings(SEARCH_RANK_LIMIT=2)
+    def test_broad_query_is_not_ranked(self):
+        results = self.search(q='доставка')['results']
+        self.assertEqual([row['id'] for row in results],
+                         sorted((pk for text, pk in self.answers.items() if 'оставк' in text), reverse=True))
+        self.assertEqual({row['score'] for row in results}, {None})
+
+    def test_index_follows_answer_deletes(self):
+        self.assertEqual(self.client.delete(f'/api/question/{self.question.pk}/delete/').status_code, 204)
+        self.assertEqual(self.found(q='доставка'), ['Доставки не было'])
+        with override_settings(DELETE_MODE='tombstone'):
+            self.client.delete(f'/api/poll/{self.other.pk}/delete/')
+        self.assertEqual(self.found(q='доставка'), [])
+
+        output = StringIO()
+        call_command('rebuild_search_index', check=True, stdout=output)
+        self.assertIn('Расхождений: 0', output.getvalue())
+
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO api_submission_search(rowid, text) VALUES (0, 'лишний')")
+        with self.assertRaisesMessage(CommandError, 'Индекс не совпадает с таблицей ответов'):
+            call_command('rebuild_search_index', check=True, stdout=output)
+        call_command('rebuild_search_index', stdout=StringIO())
+        call_command('rebuild_search_index', check=True, stdout=output)
+
+    def test_invalid_query(self):
+        self.assertEqual(self.client.get('/api/answer/search/', {'q': '?!'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/answer/search/').status_code, 400)
+        self.client.force_authenticate(None)
+        self.assertIn(self.client.get('/api/answer/search/', {'q': 'доставка'}).status_code, (401, 403))
+
+
+class ReplicaRoutingTest(TestCase):
+
+    # Реплика - отдельный файл SQLite со своими данными: по ним видно, из какой базы прочитан ответ
+    def setUp(self):
+        get_cache().clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.databases['replica'] = {'ENGINE': 'django.db.backends.sqlite3',
+                                            'NAME': os.path.join(directory.name, 'replica.sqlite3')}
+        self.addCleanup(self.remove_replica)
+        call_command('migrate', database='replica', verbosity=0)
+
+        Poll.objects.using('replica').create(title='реплика', start_date=timezone.now())
+        self.poll = create_poll('основная')
+        self.respondent = Respondent.objects.create()
+        self.client = APIClient()
+
+    def remove_replica(self):
+        connections['replica'].close()
+        del connections.databases['replica']
+        delattr(connections._connections, 'replica')
+
+    def active_titles(self):
+        return [poll['title'] for poll in self.client.get('/api/poll/active/list/').data['results']]
+
+    def test_reads_go_to_replica_until_written(self):
+        self.assertEqual(self.active_titles(), ['реплика'])
+
+        admin = create_admin()
+        self.client.force_authenticate(admin)
+        self.client.post('/api/poll/add/', {'title': 'новый', 'start_date': timezone.now().isoformat()}, format='json')
+        self.assertEqual(self.active_titles(), ['основная', 'новый'])
+
+    def test_respondent_reads_own_answers_after_posting(self):
+        history = f'/api/passedpoll/{self.respondent.pk}/list/'
+        self.assertEqual(self.client.get(history).data['results'], [])
+
+        question = self.poll.poll.get(q_type='text')
+        response = self.client.post('/api/sendanswer/', {
+            'question': question.pk, 'respondent': self.respondent.pk, 'response_text': {'response': 'ответ'},
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([poll['poll'] for poll in self.client.get(history).data['results']], ['основная'])
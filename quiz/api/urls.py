@@ -1,26 +1,39 @@
-from django.urls import path
+from django.urls import path, re_path
 from rest_framework.authtoken import views
 
-from .views import ListActivePoll, ListRespondentPoll, AddPoll, DeletePoll, UpdatePoll, AddQuestion, ListAllPoll, \
-    UpdateQuestion, DeleteQuestion, ListAllQuestions, CreateRespondent, CreateAnswer, api_doc
+from .views import (
+    ListActivePoll, ListRespondentPoll, AddPoll, DeletePoll, UpdatePoll, AddQuestion, ListAllPoll, UpdateQuestion,
+    DeleteQuestion, ListAllQuestions, CreateRespondent, CreateAnswer, CreatePollAnswers, PollResults, ExportPollAnswers,
+    AnswerStatus, ImportPoll, Metrics, PollCrosstab, SearchAnswers, api_doc,
+)
 
 urlpatterns = [
     # Опросы (для администраторов)
     path('', api_doc, name='api_doc'),
     path('poll/add/', AddPoll.as_view(), name='addpoll'),
+    path('poll/import/', ImportPoll.as_view(), name='importpoll'),
     path('poll/<int:pk>/update/', UpdatePoll.as_view(), name='editpoll'),
     path('poll/<int:pk>/delete/', DeletePoll.as_view(), name='deletepoll'),
     path('poll/all/list/', ListAllPoll.as_view(), name='listpoll'),
+    path('poll/<int:pk>/results/', PollResults.as_view(), name='pollresults'),
+    path('poll/<int:pk>/crosstab/', PollCrosstab.as_view(), name='pollcrosstab'),
+    re_path(r'^poll/(?P<pk>[0-9]+)/export/(?P<fmt>csv|jsonl)/$', ExportPollAnswers.as_view(), name='exportpoll'),
+    # Поиск по текстовым ответам (для администраторов)
+    path('answer/search/', SearchAnswers.as_view(), name='searchanswers'),
     # Вопросы (для администраторов)
     path('question/add/', AddQuestion.as_view(), name='addquestion'),
     path('question/<int:pk>/update/', UpdateQuestion.as_view(), name='updatequestion'),
     path('question/<int:pk>/delete/', DeleteQuestion.as_view(), name='deletequestion'),
     path('question/<int:pk>/list/', ListAllQuestions.as_view(), name='listquestions'),
+    # Метрики (для администраторов)
+    path('metrics/', Metrics.as_view(), name='metrics'),
     # Авторизация (для администраторов)
     path('token-auth/', views.obtain_auth_token),
     # Для пользователей
     path('get/respondent-id/', CreateRespondent.as_view(), name='getrespondentid'),
     path('sendanswer/', CreateAnswer.as_view(), name='sendanswer'),
+    path('sendanswer/<str:key>/status/', AnswerStatus.as_view(), name='answerstatus'),
+    path('poll/<int:pk>/sendanswers/', CreatePollAnswers.as_view(), name='sendpollanswers'),
     path('poll/active/list/', ListActivePoll.as_view(), name='listpoll'),
     path('passedpoll/<int:pk>/list/', ListRespondentPoll.as_view(), name='passedpoll'),
     ]
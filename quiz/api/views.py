@@ -1,16 +1,41 @@
-from datetime import datetime
+import uuid
+from datetime import datetime, time, timedelta
 
+from django.conf import settings
 
-from django.db.models import Q
-from django.http import HttpResponse
+from django.db import router
+from django.db.models import Q, Prefetch, Min
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.http import parse_etags
 
-from rest_framework.generics import ListAPIView, CreateAPIView, DestroyAPIView, UpdateAPIView
+from rest_framework import status
+from rest_framework.generics import ListAPIView, CreateAPIView, DestroyAPIView, UpdateAPIView, RetrieveAPIView
 from rest_framework.permissions import IsAdminUser
-
-from .models import Poll, Question, BaseAnswer
-from .serializers import PollSerializer, RespondentPollSerializer, AddPollSerializer, UpdatePollSerializer, \
-    AddQuestionSerializer, AllQuestionSerializer, UpdateQuestionSerializer, CreateAnswerSerializer, \
-    CreateRespondentSerializer
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
+
+from .analytics import get_matrix
+from .cache import get_poll_definition, invalidate_poll, invalidate_question, get_active_polls, \
+    invalidate_active_polls, stick_to_primary
+from .deletion import delete_polls, delete_questions
+from .export import EXPORT_FORMATS
+from .metrics import render_metrics
+from .pagination import SearchPagination
+from .renderers import FastJSONRenderer
+from .routers import ReplicaReadMixin
+
+from .models import Poll, Question, Option, Submission, AnswerSheet
+from .results import refresh_poll
+from .search import AnswerSearch
+from .serializers import AddPollSerializer, UpdatePollSerializer, \
+    AddQuestionSerializer, UpdateQuestionSerializer, CreateAnswerSerializer, \
+    CreateRespondentSerializer, CreatePollAnswersSerializer, PollResultsSerializer, SpoolAnswerSerializer, \
+    ImportPollSerializer, PollRowSerializer, QuestionRowSerializer, AnswerSheetRowSerializer, \
+    CrosstabQuerySerializer, AnswerSearchQuerySerializer
+from .spool import get_spool
 
 
 # Методы для администраторов
@@ -20,22 +45,96 @@ class AddPoll(CreateAPIView):
     serializer_class = AddPollSerializer
     permission_classes = [IsAdminUser]
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_active_polls()
+
+
+# Создание опроса вместе с вопросами и вариантами ответа, в ответе - присвоенные идентификаторы
+class ImportPoll(CreateAPIView):
+    serializer_class = ImportPollSerializer
+    permission_classes = [IsAdminUser]
+
 
 class UpdatePoll(UpdateAPIView):
     serializer_class = UpdatePollSerializer
     permission_classes = [IsAdminUser]
     queryset = Poll.objects.all()
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_poll(serializer.instance.pk)
+        invalidate_active_polls()
+
 
 class DeletePoll(DestroyAPIView):
     permission_classes = [IsAdminUser]
     queryset = Poll.objects.all()
 
+    # Индекс вопросов (api.cache.get_question_meta) должен забыть вопросы опроса, иначе ответы на них
+    # принимались бы в очередь. Вопросы выбираются до удаления
+    def perform_destroy(self, instance):
+        question_ids = list(Question.all_objects.filter(poll=instance.pk).values_list('pk', flat=True))
+        delete_polls(instance.pk)
+        invalidate_poll(instance.pk)
+        invalidate_question(*question_ids)
+        invalidate_active_polls()
+
 
-class ListAllPoll(ListAPIView):
-    serializer_class = PollSerializer
+class ListAllPoll(ReplicaReadMixin, ListAPIView):
+    serializer_class = PollRowSerializer
     permission_classes = [IsAdminUser]
-    queryset = Poll.objects.all()
+    queryset = Poll.objects.values(*PollRowSerializer.fields)
+    ordering = ('start_date', 'pk')
+
+
+# Результаты опроса: счётчики по вопросам и вариантам ответа читаются тремя запросами
+class PollResults(RetrieveAPIView):
+    serializer_class = PollResultsSerializer
+    permission_classes = [IsAdminUser]
+
+    def get_queryset(self):
+        options = Option.objects.select_related('counter').order_by('pk')
+        questions = Question.objects.select_related('counter').order_by('pk') \
+            .prefetch_related(Prefetch('options', queryset=options))
+        return Poll.objects.select_related('counter').prefetch_related(Prefetch('poll', queryset=questions))
+
+
+# Таблица сопряжённости ответов на два вопроса опроса по битовой матрице ответов (api.analytics):
+# /api/poll/<pk>/crosstab/?row=<вопрос>&column=<вопрос>[&where=<вариант>...]
+class PollCrosstab(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk):
+        poll = get_object_or_404(Poll, pk=pk)
+        serializer = CrosstabQuerySerializer(data=request.query_params, context={'matrix': get_matrix(poll.pk)})
+        serializer.is_valid(raise_exception=True)
+        return Response(dict(poll=poll.pk, **serializer.data))
+
+
+# Полнотекстовый поиск по текстовым ответам (api.search), фильтры ?poll= и ?question=,
+# постранично ?limit=&offset= по убыванию релевантности
+class SearchAnswers(ReplicaReadMixin, ListAPIView):
+    permission_classes = [IsAdminUser]
+    pagination_class = SearchPagination
+
+    def list(self, request, *args, **kwargs):
+        serializer = AnswerSearchQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        search = AnswerSearch(using=router.db_for_read(Submission), **serializer.validated_data)
+        return self.get_paginated_response(self.paginate_queryset(search))
+
+
+# Потоковая выгрузка ответов на опрос (CSV или JSONL)
+class ExportPollAnswers(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk, fmt):
+        poll = get_object_or_404(Poll, pk=pk)
+        iter_rows, content_type = EXPORT_FORMATS[fmt]
+        response = StreamingHttpResponse(iter_rows(poll.pk), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="poll-{poll.pk}.{fmt}"'
+        return response
 
 
 # Обработка вопросов и вариантов ответа
@@ -48,6 +147,12 @@ class DeleteQuestion(DestroyAPIView):
     permission_classes = [IsAdminUser]
     queryset = Question.objects.all()
 
+    def perform_destroy(self, instance):
+        delete_questions(instance.pk)
+        refresh_poll(instance.poll_id)
+        invalidate_poll(instance.poll_id)
+        invalidate_question(instance.pk)
+
 
 class UpdateQuestion(UpdateAPIView):
     serializer_class = UpdateQuestionSerializer
@@ -55,43 +160,162 @@ class UpdateQuestion(UpdateAPIView):
     queryset = Question.objects.all()
 
 
-class ListAllQuestions(ListAPIView):
-    serializer_class = AllQuestionSerializer
+class ListAllQuestions(ReplicaReadMixin, ListAPIView):
+    serializer_class = QuestionRowSerializer
+    ordering = ('pk',)
 
     def get_queryset(self):
-        return Question.objects.filter(poll=self.kwargs['pk'])
+        return Question.objects.filter(poll=self.kwargs['pk']).values(*QuestionRowSerializer.fields)
 
+    # Определение опроса отдаётся из кеша готовым JSON, повторный запрос с If-None-Match получает 304
+    def list(self, request, *args, **kwargs):
+        etag, content = get_poll_definition(self.kwargs['pk'], self.render_page, request.GET.urlencode())
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        return response
 
-# Пользовательские методы
-class ListActivePoll(ListAPIView):
-    serializer_class = PollSerializer
+    def render_page(self):
+        page = self.paginate_queryset(self.get_queryset())
+        return FastJSONRenderer().render(self.get_paginated_response(self.get_serializer(page, many=True).data).data)
 
-    def get_queryset(self):
-        now = datetime.now()
-        return Poll.objects.filter(Q(start_date__date__lte=now) & (Q(end_date__date__gte=now)|Q(end_date__isnull=True)))
 
+# Пользовательские методы
+# Полночь заданной даты в текущем часовом поясе
+def local_midnight(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
 
-class ListRespondentPoll(ListAPIView):
-    serializer_class = RespondentPollSerializer
 
-    def get_serializer_context(self):
-        a = super().get_serializer_context()
-        a['respondent_id'] = self.kwargs['pk']
-        return a
+# Опрос активен весь день своего начала и весь день окончания. Условия заданы диапазонами по
+# start_date/end_date, чтобы использовались индексы (без приведения к дате)
+class ListActivePoll(ReplicaReadMixin, ListAPIView):
+    serializer_class = PollRowSerializer
+    ordering = ('start_date', 'pk')
 
     def get_queryset(self):
-        return Poll.objects.filter(poll__question__respondent=self.kwargs['pk']).distinct()
+        today = timezone.localdate()
+        day_start, next_day = local_midnight(today), local_midnight(today + timedelta(days=1))
+        return Poll.objects.filter(Q(start_date__lt=next_day) & (Q(end_date__gte=day_start) | Q(end_date__isnull=True)))
+
+    def list(self, request, *args, **kwargs):
+        return Response(get_active_polls(self.render_active_polls, request.GET.urlencode()))
+
+    # Страница активных опросов и момент, когда список изменится: начало дня старта ближайшего будущего
+    # опроса или конец дня окончания одного из активных
+    def render_active_polls(self):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset.values(*PollRowSerializer.fields))
+        data = self.get_paginated_response(self.get_serializer(page, many=True).data).data
+
+        boundaries = []
+        first_end = queryset.aggregate(first_end=Min('end_date'))['first_end']
+        if first_end is not None:
+            boundaries.append(local_midnight(timezone.localdate(first_end) + timedelta(days=1)))
+        next_day = local_midnight(timezone.localdate() + timedelta(days=1))
+        next_start = Poll.objects.filter(start_date__gte=next_day).aggregate(next_start=Min('start_date'))['next_start']
+        if next_start is not None:
+            boundaries.append(local_midnight(timezone.localdate(next_start)))
+        return data, min(boundaries, default=None)
+
+
+class ListRespondentPoll(ReplicaReadMixin, ListAPIView):
+    serializer_class = AnswerSheetRowSerializer
+    ordering = ('poll',)
+    replica_scope = 'respondent:{pk}'
+
+    # Страница листов ответов респондента читается одним запросом по индексу (respondent, poll)
+    def get_queryset(self):
+        return AnswerSheet.objects.filter(respondent=self.kwargs['pk'], poll__deleted_at__isnull=True) \
+            .values(*AnswerSheetRowSerializer.fields)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['respondent_id'] = self.kwargs['pk']
+        return context
 
 
 class CreateAnswer(CreateAPIView):
     serializer_class = CreateAnswerSerializer
-    queryset = BaseAnswer.objects.all()
+    queryset = Submission.objects.all()
+
+    def get_serializer_class(self):
+        if settings.ANSWER_INGEST_MODE == 'spool':
+            return SpoolAnswerSerializer
+        return super().get_serializer_class()
+
+    # История ответов респондента какое-то время читается с основной базы (см. ListRespondentPoll)
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        stick_to_primary(f'respondent:{serializer.instance.respondent_id}')
+
+    # В режиме 'spool' ответ после проверки ставится в очередь и записывается в базу фоновым
+    # обработчиком (manage.py drain_answers). Ключ из заголовка Idempotency-Key делает повторную
+    # отправку безопасной, состояние записи доступно по адресу из заголовка Location. Ключ сохраняется
+    # в записанном ответе (Submission.spool_key), поэтому его длина ограничена длиной этого поля
+    def create(self, request, *args, **kwargs):
+        if settings.ANSWER_INGEST_MODE != 'spool':
+            return super().create(request, *args, **kwargs)
+
+        spool = get_spool()
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY') or uuid.uuid4().hex
+        max_length = Submission._meta.get_field('spool_key').max_length
+        if len(key) > max_length:
+            return Response({'detail': f'Ключ Idempotency-Key длиннее {max_length} символов'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        state = spool.status(key)
+        if state is None:
+            if spool.pending(settings.ANSWER_SPOOL_MAX_PENDING) >= settings.ANSWER_SPOOL_MAX_PENDING:
+                return Response({'detail': 'Очередь ответов переполнена, повторите запрос позже'},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                headers={'Retry-After': str(settings.ANSWER_SPOOL_RETRY_AFTER)})
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            state, created = spool.enqueue(key, serializer.validated_data['row'])
+        else:
+            created = False
+
+        return Response(state, status=status.HTTP_202_ACCEPTED if created else status.HTTP_200_OK,
+                        headers={'Location': reverse('answerstatus', args=[key], request=request)})
+
+
+# Состояние ответа, поставленного в очередь: queued, committed или rejected (с текстом ошибки)
+class AnswerStatus(APIView):
+
+    def get(self, request, key):
+        state = get_spool().status(key)
+        if state is None:
+            raise Http404
+        return Response(state)
+
+
+class CreatePollAnswers(CreateAPIView):
+    serializer_class = CreatePollAnswersSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['poll_id'] = self.kwargs['pk']
+        return context
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        stick_to_primary(f"respondent:{serializer.instance['respondent']}")
 
-class CreateRespondent(CreateAnswer):
+
+class CreateRespondent(CreateAPIView):
     serializer_class = CreateRespondentSerializer
 
 
+# Метрики запросов в формате Prometheus (см. api.metrics.MetricsMiddleware)
+class Metrics(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def api_doc(request):
     return HttpResponse(
         '<a href="https://documenter.getpostman.com/view/11811108/Tz5s2w3d">Документация по API для системы опросов</a>'
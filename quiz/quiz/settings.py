@@ -53,11 +53,29 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.BasicAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
-    ]
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    # JSON через orjson, если он установлен (см. api.renderers)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', 100)),
 }
 
+# Максимальный размер страницы, который клиент может запросить параметром page_size
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', 1000))
+# Время хранения токена с пользователем в кеше (секунды), см. api.authentication
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 60))
+
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,13 +111,114 @@ WSGI_APPLICATION = 'quiz.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
+# База данных задаётся переменными окружения: DB_ENGINE - sqlite (по умолчанию) или postgresql (нужен psycopg2).
+# DB_CONN_MAX_AGE - время жизни постоянного соединения (секунды, 0 - новое соединение на каждый запрос)
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 600))
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'quiz'),
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', ''),
+            'PORT': os.getenv('DB_PORT', ''),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            # Пул соединений - PgBouncer перед базой (DB_PGBOUNCER=1): в режиме пула транзакций
+            # серверные курсоры (QuerySet.iterator() в выгрузке ответов) недоступны
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER', '') == '1',
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 10)),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Ожидание блокировки записи другим соединением (секунды)
+                'timeout': int(os.getenv('DB_BUSY_TIMEOUT', 20)),
+            },
+        }
+    }
+
+# Реплика для чтения (api.routers): DB_REPLICA_NAME - файл SQLite или имя базы, DB_REPLICA_HOST - сервер
+# PostgreSQL. При запуске тестов реплика указывает на тестовую базу (TEST MIRROR)
+if os.getenv('DB_REPLICA_NAME') or os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        HOST=os.getenv('DB_REPLICA_HOST', DATABASES['default'].get('HOST', '')),
+        TEST={'MIRROR': 'default'},
+    )
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+# Время после записи, в течение которого чтение идёт с основной базы (секунды, не меньше задержки репликации)
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+
+# PRAGMA, выполняемые при каждом подключении к SQLite (api.database): WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL не теряет целостность при сбое процесса, mmap ускоряет чтение
+SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'wal'),
+    'busy_timeout': int(os.getenv('DB_BUSY_TIMEOUT', 20)) * 1000,
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'normal'),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+# Алиас кеша для определений опросов и время их хранения (секунды)
+POLL_CACHE_ALIAS = 'default'
+POLL_DEFINITION_TIMEOUT = 24 * 60 * 60
+# Максимальное время хранения списка активных опросов (секунды), обычно он сбрасывается раньше,
+# на ближайшем начале или окончании опроса
+ACTIVE_POLLS_TIMEOUT = 24 * 60 * 60
+
+# Запись ответов: 'sync' - сразу в базу, 'spool' - через локальную очередь (файл SQLite),
+# которую переносит в базу manage.py drain_answers
+ANSWER_INGEST_MODE = os.getenv('ANSWER_INGEST_MODE', 'sync')
+ANSWER_SPOOL_PATH = os.getenv('ANSWER_SPOOL_PATH', os.path.join(BASE_DIR, 'answer_spool.sqlite3'))
+# Предел ожидающих записи ответов, после которого новые отклоняются с кодом 503
+ANSWER_SPOOL_MAX_PENDING = int(os.getenv('ANSWER_SPOOL_MAX_PENDING', 100000))
+ANSWER_SPOOL_RETRY_AFTER = 5
+ANSWER_SPOOL_BATCH_SIZE = int(os.getenv('ANSWER_SPOOL_BATCH_SIZE', 500))
+
+# Удаление опросов и вопросов: 'immediate' - сразу вместе с ответами, 'tombstone' - пометка удалёнными,
+# строки удаляет пачками manage.py purge_deleted
+DELETE_MODE = os.getenv('DELETE_MODE', 'immediate')
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', 5000))
+
+# Перенос ответов опросов, закончившихся больше ARCHIVE_AFTER_DAYS дней назад, в архив
+# (manage.py archive_polls), по ARCHIVE_CHUNK_SIZE ответов в сжатой части архива
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+ARCHIVE_CHUNK_SIZE = int(os.getenv('ARCHIVE_CHUNK_SIZE', 20000))
+
+# Битовые матрицы ответов для таблиц сопряжённости (api.analytics): сколько опросов держать в памяти
+# процесса и через сколько секунд загружать матрицу заново
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', 4))
+ANALYTICS_REBUILD_SECONDS = int(os.getenv('ANALYTICS_REBUILD_SECONDS', 600))
+
+# Поиск по текстовым ответам (api.search): сколько найденных ответов ещё сортировать по релевантности;
+# если найдено больше, они выводятся без оценки, новые первыми
+SEARCH_RANK_LIMIT = int(os.getenv('SEARCH_RANK_LIMIT', 20000))
+
+
+# Заголовок Server-Timing с временем SQL-запросов и общим временем ответа
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', '') == '1'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators